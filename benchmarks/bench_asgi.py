@@ -0,0 +1,178 @@
+"""Benchmark of the sync WSGI app against the ASGI entry point.
+
+Both modes serve the same Flask app on a copy of the database:
+
+- wsgi: create_app() on Werkzeug's threaded server, one thread per
+  open connection
+- asgi: create_asgi_app() on uvicorn, connections held by the event
+  loop and views run by ASGI_EXECUTOR_WORKERS threads
+
+For every number of idle connections given, that many keep-alive
+connections are opened and left waiting, as slow or polling clients
+would, then the read routes are load tested (see load_test.py).
+Reports, per mode and number of idle connections, the requests per
+second, errors and p50/p95/p99 latency of all requests, and how many
+threads the process was running.
+
+Needs uvicorn for the asgi mode (pip install uvicorn). Opening many
+idle connections may also need a higher open file limit (ulimit -n).
+
+Run from the repository root:
+    python -m benchmarks.bench_asgi --idle 0 1000 --concurrency 32
+"""
+import argparse
+import contextlib
+import json
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from pathlib import Path
+from tourism_hotels_app import PROJECT_ROOT, create_app, config
+from tourism_hotels_app.asgi import create_asgi_app
+from benchmarks.load_test import parse_mix, run, serve
+
+# uvicorn is optional, only the asgi mode needs it
+try:
+    import uvicorn
+except ImportError:  # pragma: no cover - depends on the environment
+    uvicorn = None
+
+# The load test mix, of the obtain_data_api_bp routes only
+READ_MIX = {
+    "countries_page": 2,
+    "country": 4,
+    "filterby_year": 3,
+    "filterby_years": 1,
+    "top10": 2,
+    "top": 1,
+}
+
+MODES = ("wsgi", "asgi")
+
+
+@contextlib.contextmanager
+def serve_asgi(asgi_app):
+    """
+    Serve an ASGI app with uvicorn while in the block.
+
+    Args:
+        asgi_app: The ASGI application.
+    Yields:
+        The port the app listens on, at 127.0.0.1.
+    """
+    server = uvicorn.Server(
+        uvicorn.Config(
+            asgi_app,
+            host="127.0.0.1",
+            # Port 0 lets the OS pick a free port
+            port=0,
+            lifespan="on",
+            log_level="warning",
+            backlog=4096,
+        )
+    )
+    thread = threading.Thread(target=server.run)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    try:
+        yield server.servers[0].sockets[0].getsockname()[1]
+    finally:
+        # The lifespan shutdown closes the database connections
+        server.should_exit = True
+        thread.join()
+
+
+@contextlib.contextmanager
+def idle_connections(port, count):
+    """
+    Keep connections to the app open, without sending anything.
+
+    Args:
+        port (int): The port the app listens on, at 127.0.0.1.
+        count (int): How many connections to open.
+    Yields:
+        None
+    """
+    connections = []
+    try:
+        for _ in range(count):
+            connections.append(socket.create_connection(("127.0.0.1", port)))
+        # Give the server time to accept them all
+        time.sleep(0.5)
+        yield
+    finally:
+        for connection in connections:
+            connection.close()
+
+
+def measure(mode, database, idle, mix, concurrency, seconds, seed):
+    """
+    Start the app in one mode and load test it.
+
+    Args:
+        mode (str): wsgi or asgi.
+        database (Path): The copy of the database to serve.
+        idle (int): How many idle connections to hold open.
+        mix (dict): The load test's scenario name to weight.
+        concurrency (int): How many load test workers to run.
+        seconds (float): How long to load test for.
+        seed (int): Seed of the load test.
+    Returns:
+        A dictionary of the results of all requests and the threads.
+    """
+    bench_config = type(
+        "ASGIBenchConfig",
+        (config.Config,),
+        {
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{database}",
+            "SQLALCHEMY_ECHO": False,
+        },
+    )
+    if mode == "asgi":
+        server = serve_asgi(create_asgi_app(bench_config))
+    else:
+        server = serve(create_app(bench_config))
+    with server as port, idle_connections(port, idle):
+        routes = run("127.0.0.1", port, mix, concurrency, seconds, seed)
+        # Counted once the load test's own threads have finished
+        threads = threading.active_count()
+    return {**routes["total"], "threads": threads}
+
+
+def main():
+    """Run the benchmark for both modes and print the results as JSON."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--idle", type=int, nargs="+", default=[0, 1000])
+    parser.add_argument("--mix", type=parse_mix, default=READ_MIX)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the results here.")
+    args = parser.parse_args()
+    if "asgi" in args.modes and uvicorn is None:
+        parser.error("the asgi mode needs uvicorn: pip install uvicorn")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        database = Path(directory) / "tourism_hotels.db"
+        shutil.copy(PROJECT_ROOT / "data" / "tourism_hotels.db", database)
+        for mode in args.modes:
+            results[mode] = {
+                str(idle): measure(
+                    mode, database, idle, args.mix, args.concurrency,
+                    args.duration, args.seed,
+                )
+                for idle in args.idle
+            }
+    text = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Benchmark of ingest and API latency as the dataset grows.
+
+For every number of rows given, a synthetic csv is generated (see
+synthetic_data.py), loaded into a new database with csv_to_sqlite(),
+and the app is started on it, which migrates it and builds the
+in-memory snapshot. The app is then load tested over HTTP (see
+load_test.py). Reports, per scale:
+
+- generate_seconds, csv_bytes: writing the csv
+- ingest_seconds: csv_to_sqlite(), including the unique index
+- startup_seconds: create_app(), i.e. the migrations and snapshot
+- database_bytes: the database file once the app has started
+- routes: requests per second and p50/p95/p99 latency of each route
+
+Run from the repository root:
+    python -m benchmarks.bench_scaling --rows 1000 10000 100000
+"""
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+from tourism_hotels_app import create_app, config
+from tourism_hotels_app.data.csv_to_sqlite import csv_to_sqlite
+from benchmarks.load_test import parse_mix, run, serve
+from benchmarks.synthetic_data import generate_csv
+
+# The load test mix, without the full dataset GET, whose response
+# grows too large at the bigger scales to say much about latency
+SCALING_MIX = {
+    "countries_page": 2,
+    "country": 4,
+    "filterby_year": 1,
+    "top10": 2,
+    "top": 1,
+    "post": 1,
+    "patch": 1,
+}
+
+# Country names the load test picks from, however large the dataset
+MAX_COUNTRIES = 10_000
+
+
+def measure(rows, directory, mix, concurrency, seconds, seed):
+    """
+    Generate, ingest and load test one scale.
+
+    Args:
+        rows (int): How many rows to generate.
+        directory (Path): Where to write the csv and database.
+        mix (dict): The load test's scenario name to weight.
+        concurrency (int): How many load test workers to run.
+        seconds (float): How long to load test for.
+        seed (int): Seed of the data and of the load test.
+    Returns:
+        A dictionary of the results for this scale.
+    """
+    csv_file = directory / f"tourism_{rows}.csv"
+    database = directory / f"tourism_{rows}.db"
+
+    start = time.perf_counter()
+    generate_csv(rows, csv_file, seed)
+    generate_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    csv_to_sqlite(csv_file, database, chunk_size=100_000)
+    ingest_seconds = time.perf_counter() - start
+
+    scaling_config = type(
+        "ScalingConfig",
+        (config.Config,),
+        {
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{database}",
+            "SQLALCHEMY_ECHO": False,
+        },
+    )
+    start = time.perf_counter()
+    app = create_app(scaling_config)
+    startup_seconds = time.perf_counter() - start
+    database_bytes = database.stat().st_size
+
+    with serve(app) as port:
+        routes = run(
+            "127.0.0.1", port, mix, concurrency, seconds, seed,
+            MAX_COUNTRIES,
+        )
+    csv_bytes = csv_file.stat().st_size
+    csv_file.unlink()
+    database.unlink()
+    return {
+        "generate_seconds": round(generate_seconds, 3),
+        "csv_bytes": csv_bytes,
+        "ingest_seconds": round(ingest_seconds, 3),
+        "ingest_rows_per_second": round(rows / ingest_seconds),
+        "startup_seconds": round(startup_seconds, 3),
+        "database_bytes": database_bytes,
+        "routes": routes,
+    }
+
+
+def main():
+    """Run the benchmark for every scale and print the results as JSON."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--rows", type=int, nargs="+", default=[1000, 10_000, 100_000]
+    )
+    parser.add_argument("--mix", type=parse_mix, default=SCALING_MIX)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--directory",
+        help="Where to write the csv and database files, by default a "
+             "temporary directory. Needs about 1GB per million rows.",
+    )
+    parser.add_argument("--output", help="Also write the results here.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.directory) as directory:
+        results = {
+            str(rows): measure(
+                rows, Path(directory), args.mix, args.concurrency,
+                args.duration, args.seed,
+            )
+            for rows in args.rows
+        }
+    text = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Benchmark of the fast read serializer against TourismArrivalsSchema.
+
+Compares rows per second and bytes allocated (peak, via tracemalloc)
+for serializing the tourism_arrivals table to JSON bytes:
+
+- marshmallow: ORM query, countries_schema.dump(), Flask JSON encoder
+- fast: Core query, RowSerializer.dump_rows(), dumps_json()
+
+Run from the repository root:
+    python -m benchmarks.bench_serializers --copies 50 --repeat 5
+"""
+import argparse
+import json
+import time
+import tracemalloc
+from flask import current_app
+from tourism_hotels_app import create_app, config, db
+from tourism_hotels_app.models import TourismArrivals
+from tourism_hotels_app.schemas import TourismArrivalsSchema
+from tourism_hotels_app.serializers import dumps_json, get_serializer
+
+
+def run_marshmallow(copies):
+    """Serialize the table `copies` times the current way."""
+    schema = TourismArrivalsSchema(many=True)
+    instances = db.session.execute(
+        db.select(TourismArrivals)
+    ).scalars().all()
+    data = schema.dump(instances * copies)
+    return current_app.json.dumps(data).encode("utf-8"), len(data)
+
+
+def run_fast(copies):
+    """Serialize the table `copies` times with the fast serializer."""
+    serializer = get_serializer()
+    rows = db.session.execute(serializer.statement).all()
+    data = serializer.dump_rows(rows * copies)
+    return dumps_json(data), len(data)
+
+
+def measure(function, copies, repeat):
+    """
+    Time a serializer run and measure the memory it allocates.
+
+    Args:
+        function: run_marshmallow or run_fast.
+        copies (int): How many copies of the table to serialize.
+        repeat (int): How many timed runs to take the best of.
+    Returns:
+        A dictionary with rows, rows per second, peak bytes allocated
+        and the size of the encoded JSON.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        # Expire the ORM objects so every run loads them again
+        db.session.expire_all()
+        start = time.perf_counter()
+        body, rows = function(copies)
+        best = min(best, time.perf_counter() - start)
+
+    db.session.expire_all()
+    tracemalloc.start()
+    function(copies)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "rows": rows,
+        "rows_per_second": round(rows / best),
+        "peak_bytes_allocated": peak,
+        "json_bytes": len(body),
+    }
+
+
+def main():
+    """Run the benchmark and print the results as JSON."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--copies", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    app = create_app(config.Config)
+    with app.app_context():
+        results = {
+            "marshmallow": measure(run_marshmallow, args.copies, args.repeat),
+            "fast": measure(run_fast, args.copies, args.repeat),
+        }
+    results["speedup"] = round(
+        results["fast"]["rows_per_second"]
+        / results["marshmallow"]["rows_per_second"],
+        2,
+    )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
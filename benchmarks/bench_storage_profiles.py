@@ -0,0 +1,174 @@
+"""Benchmark of reader throughput under active writers, per storage profile.
+
+For every profile in SQLITE_STORAGE_PROFILES, a copy of the database is
+opened with that profile, then reader threads load single countries
+(metadata and observations, as a cache miss would) through the
+read-only engine, while writer threads keep updating year values in
+their own transactions, firing the same triggers a PATCH does. Reports
+reads and writes per second, read latency percentiles and how many
+operations failed with SQLITE_BUSY.
+
+Run from the repository root:
+    python -m benchmarks.bench_storage_profiles --seconds 5 --readers 4
+"""
+import argparse
+import json
+import random
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+from sqlalchemy.exc import OperationalError
+from tourism_hotels_app import PROJECT_ROOT, create_app, config, db
+from tourism_hotels_app.models import TourismArrivals
+from tourism_hotels_app.storage import get_reader_engine
+from tourism_hotels_app.observations import (
+    get_metadata_serializer,
+    load_records,
+)
+
+
+def read_loop(engine, names, stop, stats):
+    """Load random countries until stopped, timing each read."""
+    statement = get_metadata_serializer().statement
+    while not stop.is_set():
+        name = random.choice(names)
+        start = time.perf_counter()
+        try:
+            with engine.connect() as connection:
+                load_records(
+                    connection,
+                    statement.where(TourismArrivals.Country_Name == name),
+                )
+        except OperationalError:
+            stats["busy_errors"] += 1
+            continue
+        stats["latencies"].append(time.perf_counter() - start)
+
+
+def write_loop(engine, names, stop, stats):
+    """Update a year value of random countries until stopped."""
+    column = TourismArrivals.year_2019
+    while not stop.is_set():
+        try:
+            with engine.begin() as connection:
+                connection.execute(
+                    db.update(TourismArrivals.__table__)
+                    .where(
+                        TourismArrivals.Country_Name == random.choice(names)
+                    )
+                    .values({column: column + 1})
+                )
+        except OperationalError:
+            stats["busy_errors"] += 1
+            continue
+        stats["writes"] += 1
+
+
+def measure(profile_name, seconds, readers, writers):
+    """
+    Run readers and writers against a copy of the database.
+
+    Args:
+        profile_name (str): A name in SQLITE_STORAGE_PROFILES.
+        seconds (float): How long to run for.
+        readers (int): How many reader threads to run.
+        writers (int): How many writer threads to run.
+    Returns:
+        A dictionary of the results for the profile.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        database = Path(directory) / "tourism_hotels.db"
+        shutil.copy(PROJECT_ROOT / "data" / "tourism_hotels.db", database)
+        bench_config = type(
+            "BenchConfig",
+            (config.Config,),
+            {
+                "SQLALCHEMY_DATABASE_URI": f"sqlite:///{database}",
+                "SQLITE_STORAGE_PROFILE": profile_name,
+            },
+        )
+        app = create_app(bench_config)
+        with app.app_context():
+            engine = db.engine
+            reader_engine = get_reader_engine()
+            names = db.session.execute(
+                db.select(TourismArrivals.Country_Name)
+            ).scalars().all()
+            db.session.remove()
+
+            stop = threading.Event()
+            read_stats = [
+                {"latencies": [], "busy_errors": 0} for _ in range(readers)
+            ]
+            write_stats = [
+                {"writes": 0, "busy_errors": 0} for _ in range(writers)
+            ]
+            threads = [
+                threading.Thread(
+                    target=read_loop,
+                    args=(reader_engine, names, stop, stats),
+                )
+                for stats in read_stats
+            ] + [
+                threading.Thread(
+                    target=write_loop, args=(engine, names, stop, stats)
+                )
+                for stats in write_stats
+            ]
+            for thread in threads:
+                thread.start()
+            time.sleep(seconds)
+            stop.set()
+            for thread in threads:
+                thread.join()
+            engine.dispose()
+            reader_engine.dispose()
+
+    latencies = sorted(
+        latency for stats in read_stats for latency in stats["latencies"]
+    )
+    percentiles = (
+        statistics.quantiles(latencies, n=100) if len(latencies) > 1
+        else [0.0] * 99
+    )
+    return {
+        "reads_per_second": round(len(latencies) / seconds),
+        "read_p50_ms": round(percentiles[49] * 1000, 3),
+        "read_p99_ms": round(percentiles[98] * 1000, 3),
+        "writes_per_second": round(
+            sum(stats["writes"] for stats in write_stats) / seconds
+        ),
+        "busy_errors": sum(
+            stats["busy_errors"] for stats in read_stats + write_stats
+        ),
+    }
+
+
+def main():
+    """Run the benchmark for every profile and print the results as JSON."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--writers", type=int, default=1)
+    parser.add_argument(
+        "--profiles",
+        nargs="+",
+        default=list(config.SQLITE_STORAGE_PROFILES),
+        choices=list(config.SQLITE_STORAGE_PROFILES),
+    )
+    args = parser.parse_args()
+
+    results = {
+        profile_name: measure(
+            profile_name, args.seconds, args.readers, args.writers
+        )
+        for profile_name in args.profiles
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
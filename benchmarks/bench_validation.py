@@ -0,0 +1,114 @@
+"""Benchmark of the compiled country validator against marshmallow.
+
+Compares validations per second, on valid and invalid payloads, of:
+
+- compiled: country_validator.validate_new() and validate_patch(), the
+  checks compiled once from the model (see validation.py)
+- marshmallow: TourismArrivalsSchema.validate(), which PATCH ran on
+  every request before
+
+Payloads are a whole new country, as sent to POST, and a change of one
+year and the Region, as sent to PATCH. Each invalid payload fails on
+its last key, so every check is still run before the error is found.
+
+Run from the repository root:
+    python -m benchmarks.bench_validation --seconds 1
+"""
+import argparse
+import json
+import time
+from tourism_hotels_app.schemas import TourismArrivalsSchema
+from tourism_hotels_app.validation import COLUMN_RULES, country_validator
+
+# Built once, as the app built it once per process
+schema = TourismArrivalsSchema()
+
+
+def get_payloads():
+    """
+    Build the valid and invalid payloads of POST and PATCH.
+
+    Args:
+        None
+    Returns:
+        A dictionary of payload name to (kind, payload), where kind is
+        "new" or "patch".
+    """
+    country = {
+        rule.key: 1000 if rule.python_type is int else f"{rule.key} text"
+        for rule in COLUMN_RULES
+        if not rule.derived
+    }
+    patch = {"year_2020": 2000, "Region": "New Region"}
+    return {
+        "new_valid": ("new", country),
+        "new_wrong_type": ("new", {**country, "year_2020": "many"}),
+        "new_negative": ("new", {**country, "year_2020": -1}),
+        "patch_valid": ("patch", patch),
+        "patch_wrong_type": ("patch", {**patch, "Region": 5}),
+    }
+
+
+def validate_compiled(kind, payload, record):
+    """Validate a payload with the compiled validator."""
+    try:
+        if kind == "new":
+            country_validator.validate_new(payload)
+        else:
+            country_validator.validate_patch(payload, record)
+    except (AttributeError, ValueError):
+        pass
+
+
+def validate_marshmallow(kind, payload, record):
+    """Validate a payload with the marshmallow schema."""
+    schema.validate(payload, partial=kind == "patch")
+
+
+def measure(function, kind, payload, seconds):
+    """
+    Count how many times a payload is validated in a number of seconds.
+
+    Args:
+        function: validate_compiled or validate_marshmallow.
+        kind (str): "new" or "patch".
+        payload (dict): The JSON payload.
+        seconds (float): How long to validate for.
+    Returns:
+        The validations per second.
+    """
+    # The current record a PATCH is checked against, with other values
+    record = {key: None for key in payload}
+    count = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        # Batches of 100, so reading the clock does not dominate
+        for _ in range(100):
+            function(kind, payload, record)
+        count += 100
+    return round(count / (time.perf_counter() - start))
+
+
+def main():
+    """Run the benchmark and print the results as JSON."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=1)
+    args = parser.parse_args()
+
+    results = {}
+    for name, (kind, payload) in get_payloads().items():
+        compiled = measure(validate_compiled, kind, payload, args.seconds)
+        marshmallow = measure(
+            validate_marshmallow, kind, payload, args.seconds
+        )
+        results[name] = {
+            "compiled_per_second": compiled,
+            "marshmallow_per_second": marshmallow,
+            "speedup": round(compiled / marshmallow, 2),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,533 @@
+"""Load test of the app's routes over HTTP, with a mix of requests.
+
+Worker threads send requests for the duration of the run, each picking
+a scenario at random with the weights given by --mix, over their own
+keep-alive HTTP connection. Reports the throughput, error count, status
+codes and p50/p95/p99 latency of every route as JSON, so runs can be
+saved with --output and compared.
+
+By default the app is started in this process on a copy of the
+database, served by Werkzeug's threaded server, so the POST and PATCH
+scenarios never change tourism_hotels_app/data. The server then shares
+the GIL with the workers, so for absolute numbers start the app on its
+own (e.g. with `flask run`) and point --url at it, bearing in mind that
+POST and PATCH write to whichever database it uses.
+
+Run from the repository root:
+    python -m benchmarks.load_test --duration 10 --concurrency 8
+    python -m benchmarks.load_test --mix country=5,patch=1 --output a.json
+"""
+import argparse
+import contextlib
+import http.client
+import itertools
+import json
+import logging
+import random
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+from urllib.parse import quote, urlencode, urlsplit
+from werkzeug.serving import make_server
+from tourism_hotels_app import PROJECT_ROOT, create_app, config
+from tourism_hotels_app.derived_metrics import DERIVED_KEYS
+
+# Weights of the scenarios run when --mix is not given
+DEFAULT_MIX = {
+    "countries": 2,
+    "countries_page": 2,
+    "country": 4,
+    "filterby_year": 3,
+    "filterby_years": 1,
+    "top10": 2,
+    "top": 1,
+    "post": 1,
+    "patch": 1,
+}
+
+# Gives every POSTed country a new name across all workers
+_post_numbers = itertools.count()
+
+
+def get_countries(context, rng):
+    """GET the whole dataset."""
+    return "GET", "/api/countries", "/api/countries", None
+
+
+def get_countries_page(context, rng):
+    """GET the first page of countries."""
+    return "GET", "/api/countries?limit=50", "/api/countries?limit", None
+
+
+def get_country(context, rng):
+    """GET one random country."""
+    name = rng.choice(context["names"])
+    return (
+        "GET",
+        f"/api/countries/country/{quote(name)}",
+        "/api/countries/country/<country_name>",
+        None,
+    )
+
+
+def get_filterby_year(context, rng):
+    """GET every country's value for one random year."""
+    year = rng.choice(context["years"])
+    return (
+        "GET",
+        f"/api/filterby/year/{year}",
+        "/api/filterby/year/<chosen_year>",
+        None,
+    )
+
+
+def get_filterby_years(context, rng):
+    """GET every country's values over a random range of years."""
+    first, last = sorted(rng.sample(context["years"], 2))
+    return (
+        "GET",
+        f"/api/filterby/years?{urlencode({'from': first, 'to': last})}",
+        "/api/filterby/years",
+        None,
+    )
+
+
+def get_filterby_region(context, rng):
+    """GET the countries of a random region."""
+    region = rng.choice(context["regions"])
+    return (
+        "GET",
+        f"/api/filterby/region/{quote(region)}",
+        "/api/filterby/region/<region>",
+        None,
+    )
+
+
+def get_aggregate(context, rng):
+    """GET the totals of a random year by region or income group."""
+    query = urlencode({
+        "by": rng.choice(["region", "income"]),
+        "year": rng.choice(context["years"]),
+    })
+    return "GET", f"/api/aggregate?{query}", "/api/aggregate", None
+
+
+def get_top10(context, rng):
+    """GET the top 10 countries by 10-year average."""
+    return "GET", "/api/top-10-countries", "/api/top-10-countries", None
+
+
+def get_top(context, rng):
+    """GET a ranking by a random metric and order."""
+    query = urlencode({
+        "metric": rng.choice(["average", "max", "min", "percent_drop"]),
+        "order": rng.choice(["asc", "desc"]),
+    })
+    return "GET", f"/api/top?{query}", "/api/top", None
+
+
+def post_country(context, rng):
+    """POST a new country, with a name no other request uses."""
+    number = next(_post_numbers)
+    data = dict(context["template"])
+    data["Country_Name"] = f"Load test {context['run_id']} {number}"
+    for year in context["years"]:
+        data[f"year_{year}"] = rng.randint(1, 10_000_000)
+    return "POST", "/api/countries", "/api/countries", data
+
+
+def patch_country(context, rng):
+    """PATCH a random year of a random country."""
+    name = rng.choice(context["names"])
+    data = {f"year_{rng.choice(context['years'])}": rng.randint(1, 10**7)}
+    return (
+        "PATCH",
+        f"/api/countries/{quote(name)}",
+        "/api/countries/<country_name>",
+        data,
+    )
+
+
+def get_search(context, rng):
+    """GET a search for the start of a random country's name."""
+    name = rng.choice(context["names"])
+    query = urlencode({"q": name[:rng.randint(1, min(len(name), 8))]})
+    return (
+        "GET",
+        f"/api/countries/search?{query}",
+        "/api/countries/search",
+        None,
+    )
+
+
+def get_export(context, rng):
+    """GET the streaming NDJSON export."""
+    return (
+        "GET",
+        "/api/countries/export?format=ndjson",
+        "/api/countries/export",
+        None,
+    )
+
+
+def get_index(context, rng):
+    """GET the HTML index page."""
+    return "GET", "/", "/", None
+
+
+# Scenario name to the function building its request
+SCENARIOS = {
+    "countries": get_countries,
+    "countries_page": get_countries_page,
+    "country": get_country,
+    "filterby_year": get_filterby_year,
+    "filterby_years": get_filterby_years,
+    "filterby_region": get_filterby_region,
+    "aggregate": get_aggregate,
+    "top10": get_top10,
+    "top": get_top,
+    "post": post_country,
+    "patch": patch_country,
+    "search": get_search,
+    "export": get_export,
+    "index": get_index,
+}
+
+
+def parse_mix(text):
+    """
+    Parse a --mix value such as "country=5,patch=1".
+
+    Args:
+        text (str): Comma separated scenario=weight pairs.
+    Returns:
+        A dictionary of scenario name to weight.
+    Raises:
+        argparse.ArgumentTypeError: If a scenario or weight is invalid.
+    """
+    mix = {}
+    for pair in text.split(","):
+        name, _, weight = pair.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(
+                f"Unknown scenario {name!r}, choose from: "
+                f"{', '.join(SCENARIOS)}"
+            )
+        try:
+            mix[name] = float(weight) if weight else 1.0
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Invalid weight {weight!r}")
+        if mix[name] < 0:
+            raise argparse.ArgumentTypeError(f"Invalid weight {weight!r}")
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("At least one weight must be > 0")
+    return mix
+
+
+def send(connection, method, path, data=None):
+    """
+    Send one request and read the whole response.
+
+    Args:
+        connection: An http.client.HTTPConnection.
+        method (str): The HTTP method.
+        path (str): The path and query string.
+        data: Optional value sent as a JSON body.
+    Returns:
+        A tuple of (status code, response body bytes).
+    """
+    headers = {}
+    body = None
+    if data is not None:
+        body = json.dumps(data).encode("utf-8")
+        headers["Content-Type"] = "application/json"
+    connection.request(method, path, body=body, headers=headers)
+    response = connection.getresponse()
+    return response.status, response.read()
+
+
+def load_context(host, port, max_countries=None):
+    """
+    Fetch what the scenarios need to know about the dataset.
+
+    Args:
+        host (str): The host of the app.
+        port (int): The port of the app.
+        max_countries (int): If given, only the first this many country
+            names are fetched and used, for very large datasets.
+    Returns:
+        A dictionary with the country `names`, the `years`, the
+        `regions`, a POST `template` and a `run_id` making POSTed names
+        unique.
+    """
+    connection = http.client.HTTPConnection(host, port, timeout=30)
+    records = []
+    path = "/api/countries?limit=1000"
+    while path:
+        status, body = send(connection, "GET", path)
+        if status != 200:
+            raise SystemExit(f"GET {path} returned {status}")
+        page = json.loads(body)
+        records.extend(page["data"])
+        path = page["next"]
+        if max_countries is not None and len(records) >= max_countries:
+            break
+    connection.close()
+    names = [record["Country_Name"] for record in records]
+    years = sorted(
+        int(key[len("year_"):]) for key in records[0]
+        if key.startswith("year_")
+    )
+    regions = sorted({record["Region"] for record in records})
+    template = {
+        key: value for key, value in records[0].items()
+        if not key.startswith("year_") and key not in DERIVED_KEYS
+    }
+    return {
+        "names": names,
+        "years": years,
+        "regions": regions,
+        "template": template,
+        "run_id": format(int(time.time()), "x"),
+    }
+
+
+def worker(host, port, context, mix, seed, stop, results):
+    """
+    Send requests from the mix until stopped, timing each one.
+
+    Args:
+        host (str): The host of the app.
+        port (int): The port of the app.
+        context (dict): From load_context().
+        mix (dict): Scenario name to weight.
+        seed (int): Seed of this worker's random choices.
+        stop (threading.Event): Set when the run is over.
+        results (dict): This worker's results, route to a dictionary of
+            `latencies`, `statuses` and `failures`, filled in here.
+    Returns:
+        None
+    """
+    rng = random.Random(seed)
+    names, weights = list(mix), list(mix.values())
+    connection = http.client.HTTPConnection(host, port, timeout=30)
+    while not stop.is_set():
+        scenario = rng.choices(names, weights)[0]
+        method, path, route, data = SCENARIOS[scenario](context, rng)
+        stats = results.setdefault(
+            f"{method} {route}",
+            {"latencies": [], "statuses": {}, "failures": 0},
+        )
+        start = time.perf_counter()
+        try:
+            status, _ = send(connection, method, path, data)
+        except (OSError, http.client.HTTPException):
+            # Count the failure and start again on a new connection
+            stats["failures"] += 1
+            connection.close()
+            continue
+        stats["latencies"].append(time.perf_counter() - start)
+        stats["statuses"][status] = stats["statuses"].get(status, 0) + 1
+    connection.close()
+
+
+def summarize(worker_results, seconds):
+    """
+    Merge the workers' results into the per-route report.
+
+    Args:
+        worker_results: List of the results dictionaries of worker().
+        seconds (float): How long the run actually took.
+    Returns:
+        A dictionary of route to its requests, requests_per_second,
+        errors (failed connections and 4xx/5xx responses), statuses
+        and latency percentiles in milliseconds, plus a `total` entry.
+    """
+    merged = {}
+    for results in worker_results:
+        for route, stats in results.items():
+            # Every request also counts towards the total
+            for key in (route, "total"):
+                into = merged.setdefault(
+                    key, {"latencies": [], "statuses": {}, "failures": 0}
+                )
+                into["latencies"].extend(stats["latencies"])
+                into["failures"] += stats["failures"]
+                for status, count in stats["statuses"].items():
+                    into["statuses"][status] = (
+                        into["statuses"].get(status, 0) + count
+                    )
+
+    report = {}
+    for route, stats in sorted(merged.items()):
+        latencies = stats["latencies"]
+        percentiles = (
+            statistics.quantiles(latencies, n=100) if len(latencies) > 1
+            else latencies * 99 or [0.0] * 99
+        )
+        report[route] = {
+            "requests": len(latencies),
+            "requests_per_second": round(len(latencies) / seconds, 1),
+            "errors": stats["failures"] + sum(
+                count for status, count in stats["statuses"].items()
+                if status >= 400
+            ),
+            "statuses": {
+                str(status): count
+                for status, count in sorted(stats["statuses"].items())
+            },
+            "p50_ms": round(percentiles[49] * 1000, 3),
+            "p95_ms": round(percentiles[94] * 1000, 3),
+            "p99_ms": round(percentiles[98] * 1000, 3),
+        }
+    return report
+
+
+def run(host, port, mix, concurrency, seconds, seed, max_countries=None):
+    """
+    Run the load test against an app that is already listening.
+
+    Args:
+        host (str): The host of the app.
+        port (int): The port of the app.
+        mix (dict): Scenario name to weight.
+        concurrency (int): How many workers send requests at once.
+        seconds (float): How long to send requests for.
+        seed (int): Seed of the random choices, for repeatable mixes.
+        max_countries (int): Passed on to load_context().
+    Returns:
+        The per-route report of summarize().
+    """
+    context = load_context(host, port, max_countries)
+    stop = threading.Event()
+    worker_results = [{} for _ in range(concurrency)]
+    threads = [
+        threading.Thread(
+            target=worker,
+            args=(host, port, context, mix, seed + number, stop, results),
+        )
+        for number, results in enumerate(worker_results)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return summarize(worker_results, time.perf_counter() - start)
+
+
+@contextlib.contextmanager
+def serve(app):
+    """
+    Serve an app with Werkzeug's threaded server while in the block.
+
+    Args:
+        app: Flask app application instance
+    Yields:
+        The port the app listens on, at 127.0.0.1.
+    """
+    # Logging every request would slow the server down
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    # Port 0 lets the OS pick a free port
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        yield server.port
+    finally:
+        server.shutdown()
+        thread.join()
+        with app.app_context():
+            for engine in app.extensions["sqlalchemy"].engines.values():
+                engine.dispose()
+
+
+def run_local(config_name, mix, concurrency, seconds, seed):
+    """
+    Start the app on a copy of the database and load test it.
+
+    Args:
+        config_name (str): Name of the config class in config.py.
+        mix (dict): Scenario name to weight.
+        concurrency (int): How many workers send requests at once.
+        seconds (float): How long to send requests for.
+        seed (int): Seed of the random choices.
+    Returns:
+        The per-route report of summarize().
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        database = Path(directory) / "tourism_hotels.db"
+        shutil.copy(PROJECT_ROOT / "data" / "tourism_hotels.db", database)
+        load_config = type(
+            "LoadTestConfig",
+            (getattr(config, config_name),),
+            {
+                "SQLALCHEMY_DATABASE_URI": f"sqlite:///{database}",
+                "SQLALCHEMY_ECHO": False,
+            },
+        )
+        with serve(create_app(load_config)) as port:
+            return run("127.0.0.1", port, mix, concurrency, seconds, seed)
+
+
+def main():
+    """Run the load test and print or save the report as JSON."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--url",
+        help="Base URL of an app already running, e.g. "
+             "http://127.0.0.1:5000. By default one is started.",
+    )
+    parser.add_argument(
+        "--config",
+        default="Config",
+        help="Config class used to start the app when --url is not given.",
+    )
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default=DEFAULT_MIX,
+        help="Weights as scenario=weight pairs, from: "
+             f"{', '.join(SCENARIOS)}.",
+    )
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the report here.")
+    args = parser.parse_args()
+
+    if args.url:
+        url = urlsplit(args.url)
+        routes = run(
+            url.hostname, url.port or 80, args.mix, args.concurrency,
+            args.duration, args.seed,
+        )
+    else:
+        routes = run_local(
+            args.config, args.mix, args.concurrency, args.duration,
+            args.seed,
+        )
+    report = {
+        "settings": {
+            "url": args.url,
+            "mix": args.mix,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "seed": args.seed,
+        },
+        "routes": routes,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
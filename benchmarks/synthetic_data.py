@@ -0,0 +1,177 @@
+"""Generator of synthetic tourism CSVs at any scale, in the real layout.
+
+Each synthetic row starts from a random row of
+Tourism_arrivals_prepared.csv, so the Region and IncomeGroup mix and
+which years are null follow the real data. Its values are the real
+series scaled by a random factor, with a little noise per year, and
+its indicator is drawn from INDICATORS. Derived columns are computed
+with derived_metrics.compute_metrics(), so the output passes
+check-derived-metrics. Country names are unique, like the model's
+primary key, by numbering every row.
+
+Rows are generated and written in chunks, so a 10M row file only ever
+holds one chunk in memory.
+
+Run from the repository root:
+    python -m benchmarks.synthetic_data 100000 /tmp/tourism_100k.csv
+"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from tourism_hotels_app import PROJECT_ROOT
+from tourism_hotels_app.derived_metrics import compute_metrics
+from tourism_hotels_app.observations import get_legacy_years
+
+# Indicator names, with how likely they are and how their values
+# compare to arrivals (receipts are in US$, roughly 1000 per arrival)
+INDICATORS = {
+    "International tourism, number of arrivals": (0.6, 1.0),
+    "International tourism, number of departures": (0.3, 1.0),
+    "International tourism, receipts (current US$)": (0.1, 1000.0),
+}
+
+# The leading text columns of the prepared csv
+TEXT_COLUMNS = [
+    "Country Name",
+    "Region",
+    "IncomeGroup",
+    "Country Code",
+    "Indicator Name",
+]
+
+# The derived columns of the prepared csv, in compute_metrics() order
+DERIVED_COLUMNS = [
+    "10-year Average in tourist arrivals",
+    "Max number of arrivals",
+    "Minimum number of arrivals",
+    "Percent drop 2019 to 2020",
+]
+
+# Spread of the random factor scaling each template row, and of the
+# noise added to each year, as standard deviations of their logarithm
+SCALE_SIGMA = 0.5
+NOISE_SIGMA = 0.05
+
+
+def load_templates(csv_file=None):
+    """
+    Read the real rows the synthetic ones are based on.
+
+    Args:
+        csv_file: Path of the csv, by default the prepared csv.
+    Returns:
+        A tuple of (text columns dataframe, year values matrix).
+    """
+    if csv_file is None:
+        csv_file = PROJECT_ROOT / "data" / "Tourism_arrivals_prepared.csv"
+    templates = pd.read_csv(csv_file)
+    years = [str(year) for year in get_legacy_years()]
+    return (
+        templates[TEXT_COLUMNS].reset_index(drop=True),
+        templates[years].to_numpy(dtype=np.float64),
+    )
+
+
+def generate_chunk(rng, templates, template_values, start, rows):
+    """
+    Generate one chunk of synthetic rows.
+
+    Args:
+        rng (np.random.Generator): The random number generator.
+        templates (pd.DataFrame): The text columns of the real rows.
+        template_values (np.ndarray): The year values of the real rows.
+        start (int): The number of the first row, used in its name.
+        rows (int): How many rows to generate.
+    Returns:
+        A dataframe in the prepared csv's column layout.
+    """
+    years = get_legacy_years()
+    picks = rng.integers(0, len(templates), rows)
+    names, weights, units = (
+        list(INDICATORS),
+        [weight for weight, _ in INDICATORS.values()],
+        np.array([unit for _, unit in INDICATORS.values()]),
+    )
+    indicators = rng.choice(len(names), rows, p=weights)
+
+    # Scale whole series, then add noise per year, keeping the nulls
+    scale = np.exp(rng.normal(0, SCALE_SIGMA, (rows, 1)))
+    noise = np.exp(rng.normal(0, NOISE_SIGMA, (rows, len(years))))
+    values = template_values[picks] * scale * noise
+    values *= units[indicators][:, np.newaxis]
+    # Round to the thousands the source data is reported in
+    values = np.maximum(np.round(values, -3), 1000)
+
+    chunk = templates.iloc[picks].reset_index(drop=True)
+    numbers = np.arange(start, start + rows)
+    chunk["Country Name"] = [
+        f"{name} {number:08d}"
+        for name, number in zip(chunk["Country Name"], numbers)
+    ]
+    chunk["Indicator Name"] = np.array(names, dtype=object)[indicators]
+    # Whole numbers as nullable integers, which are much faster to
+    # write than floats formatted one by one
+    year_columns = pd.DataFrame(
+        values, columns=[str(year) for year in years]
+    ).astype("Int64")
+    derived = pd.DataFrame(compute_metrics(values, years))
+    derived.columns = DERIVED_COLUMNS
+    derived = derived.astype({
+        "Max number of arrivals": "Int64",
+        "Minimum number of arrivals": "Int64",
+    })
+    return pd.concat([chunk, year_columns, derived], axis=1)
+
+
+def generate_csv(rows, csv_file, seed=0, chunk_size=100_000):
+    """
+    Write a synthetic csv with the prepared csv's columns.
+
+    Args:
+        rows (int): How many rows to write.
+        csv_file: Path of the csv to write, replaced if it exists.
+        seed (int): Seed of the random numbers, for repeatable files.
+        chunk_size (int): How many rows to generate at a time.
+    Returns:
+        None
+    """
+    rng = np.random.default_rng(seed)
+    templates, template_values = load_templates()
+    with open(csv_file, "w", newline="", encoding="utf-8") as output:
+        for start in range(0, rows, chunk_size):
+            chunk = generate_chunk(
+                rng, templates, template_values, start,
+                min(chunk_size, rows - start),
+            )
+            # %.10g writes the averages like the prepared csv
+            chunk.to_csv(
+                output, header=start == 0, index=False, float_format="%.10g"
+            )
+        if rows == 0:
+            pd.DataFrame(
+                columns=TEXT_COLUMNS
+                + [str(year) for year in get_legacy_years()]
+                + DERIVED_COLUMNS
+            ).to_csv(output, index=False)
+
+
+def main():
+    """Generate a synthetic csv from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("rows", type=int)
+    parser.add_argument("csv_file")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-size", type=int, default=100_000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    generate_csv(args.rows, args.csv_file, args.seed, args.chunk_size)
+    print(
+        f"Wrote {args.rows} rows to {args.csv_file} in "
+        f"{time.perf_counter() - start:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -14,11 +14,18 @@ setup(
         "flask-wtf",
         "jwt",
         "marshmallow-sqlalchemy",
+        "numpy",
         "openpyxl",
         "pandas",
         "requests",
         "scikit-learn",
     ],
+    extras_require={
+        # Optional faster JSON encoder used by serializers.py
+        "fast-json": ["orjson"],
+        # ASGI server for tourism_hotels_app.asgi and bench_asgi.py
+        "asgi": ["uvicorn"],
+    },
     package_data={
         "Tourism_arrivals_prepared": ["Tourism_arrivals_prepared.csv"],
     },
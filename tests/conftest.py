@@ -1,14 +1,24 @@
 """All fixtures used in testing."""
+import shutil
 import pytest
-from tourism_hotels_app import create_app, config
+from tourism_hotels_app import create_app, config, PROJECT_ROOT
 from tourism_hotels_app.models import TourismArrivals
 
 
 # Define an app instance fixture for flask routes test
 @pytest.fixture(scope="session")
-def app():
-    """Create a Flask app configured for testing."""
-    app = create_app(config.TestConfig)
+def app(tmp_path_factory):
+    """Create a Flask app configured for testing, on a database copy."""
+    # The tests write to the database, so they run on a copy of it and
+    # leave the shipped database as it is, for every run to start from
+    database = tmp_path_factory.mktemp("data") / "tourism_hotels.db"
+    shutil.copy(PROJECT_ROOT / "data" / "tourism_hotels.db", database)
+    test_config = type(
+        "CopyTestConfig",
+        (config.TestConfig,),
+        {"SQLALCHEMY_DATABASE_URI": f"sqlite:///{database}"},
+    )
+    app = create_app(test_config)
     yield app
 
 
@@ -1,6 +1,11 @@
 """This file contains tests for all GET routes."""
+import csv
+import gzip
+import io
 import pytest
 import json
+import sqlite3
+from sqlalchemy.engine import make_url
 from tourism_hotels_app.models import TourismArrivals
 from tourism_hotels_app.schemas import TourismArrivalsSchema
 from tourism_hotels_app import db
@@ -47,6 +52,114 @@ def test_get_all_countries(test_client, expected_column_value_types):
         assert set(country_data.keys()) == expected_keys_dict.keys()
 
 
+def test_get_all_countries_etag_and_not_modified(test_client):
+    """
+    Test if GET request for countries supports ETag revalidation.
+
+    Args:
+        test_client: fixture containing test client instance of app, to
+        allow the tests to interact with the Flask server.
+
+    Given: A Flask app configured for testing.
+    When: - A HTTP GET request is made to RESTAPI `/countries` endpoint.
+          - The request is repeated with the returned ETag.
+          - A country is changed with a PATCH request and the request
+            is repeated with the same ETag again.
+    Then: - The first response has a strong ETag.
+          - The repeated request returns 304 with an empty body.
+          - After the PATCH, a 200 with a new ETag is returned.
+    """
+    response = test_client.get("/api/countries")
+    etag = response.headers["ETag"]
+    assert response.status_code == 200
+    assert not etag.startswith("W/")
+
+    # Revalidate with the ETag, which should not resend the payload
+    response = test_client.get(
+        "/api/countries", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert response.data == b""
+
+    # Change a value so that the cached payload becomes stale
+    current = test_client.get("/api/countries/country/Angola").json
+    test_client.patch(
+        "/api/countries/Angola", json={"year_1995": current["year_1995"] + 1}
+    )
+    response = test_client.get(
+        "/api/countries", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_get_countries_by_page_follows_next_links(test_client):
+    """
+    Test if the keyset paginated GET request returns every country once.
+
+    Args:
+        test_client: fixture containing test client instance of app, to
+        allow the tests to interact with the Flask server.
+
+    Given: A Flask app configured for testing.
+    When: HTTP GET requests are made to `/api/countries?limit=50` and
+          then to each `next` link until it is null.
+    Then: - Every page has status code 200 and at most 50 countries.
+          - The pages together contain every country exactly once,
+            ordered by country name.
+    """
+    all_names = [row["Country_Name"] for row in test_client.get(
+        "/api/countries"
+    ).json]
+
+    paged_names = []
+    link = "/api/countries?limit=50"
+    while link is not None:
+        response = test_client.get(link)
+        assert response.status_code == 200
+        assert len(response.json["data"]) <= 50
+        paged_names.extend(
+            row["Country_Name"] for row in response.json["data"]
+        )
+        link = response.json["next"]
+
+    assert paged_names == sorted(all_names)
+
+
+@pytest.mark.parametrize(
+    "query_string",
+    [
+        "limit=0",
+        "limit=text",
+        "limit=100000",
+        "limit=5&cursor=a",
+        "limit=5&cursor=%25%25%25",
+        "limit=5&cursor=QW5nb2xh%25",
+        "limit=5&cursor=QR%3D%3D",
+    ],
+)
+def test_get_countries_by_page_with_invalid_parameters(
+    test_client, query_string
+):
+    """
+    Test if the paginated GET request rejects invalid parameters.
+
+    Args:
+        test_client: fixture containing test client instance of app, to
+        allow the tests to interact with the Flask server.
+        query_string: parameter containing invalid limits and cursors.
+
+    Given: A Flask app configured for testing.
+    When: A HTTP GET request is made to `/api/countries` with an invalid
+          limit or cursor.
+    Then: A 400 status code and a JSON error message is returned.
+    """
+    response = test_client.get(f"/api/countries?{query_string}")
+    assert response.status_code == 400
+    assert response.json["status"] == 400
+    assert response.json["error"] == "Bad Request"
+
+
 @pytest.mark.parametrize(
     (
         "expected_result_cname",
@@ -241,6 +354,68 @@ def test_filter_by_year_for_valid_and_invalid_years_combined(
         assert response.json["message"] == "Invalid resource URI: Invalid year"
 
 
+def test_filter_by_year_range_matches_single_years(test_client):
+    """
+    Test if GET request for a range of years returns the right matrix.
+
+    Args:
+        test_client: fixture containing test client instance of app, to
+            allow the tests to interact with the Flask server.
+
+    Given: A Flask test client.
+    When: A HTTP GET request is made for 2001 to 2003 for two countries,
+          one by name and one by country code.
+    Then: - The response status code is 200.
+          - The years and countries are returned in the order asked.
+          - Each value matches the single year route for that year.
+    """
+    response = test_client.get(
+        "/api/filterby/years?from=2001&to=2003&countries=Aruba"
+        "&countries=ZWE"
+    )
+    assert response.status_code == 200
+    assert response.json["years"] == [2001, 2002, 2003]
+    assert response.json["countries"] == ["Aruba", "Zimbabwe"]
+
+    for column, year in enumerate(response.json["years"]):
+        single_year = {
+            row["Country_Name"]: row[f"year_{year}"]
+            for row in test_client.get(f"/api/filterby/year/{year}").json
+        }
+        for row, name in enumerate(response.json["countries"]):
+            assert response.json["values"][row][column] == single_year[name]
+
+
+@pytest.mark.parametrize(
+    "query_string, expected_status",
+    [
+        ("from=2005&to=2001", 400),
+        ("from=text", 400),
+        ("countries=Invalid_Country", 400),
+        ("from=1900&to=1950", 404),
+    ],
+)
+def test_filter_by_year_range_with_invalid_parameters(
+    test_client, query_string, expected_status
+):
+    """
+    Test if GET request for a range of years rejects invalid input.
+
+    Args:
+        test_client: fixture containing test client instance of app, to
+            allow the tests to interact with the Flask server.
+        query_string: parameter containing invalid ranges and countries.
+        expected_status: parameter containing the expected status code.
+
+    Given: A Flask test client.
+    When: A HTTP GET request is made with an invalid range or country.
+    Then: The expected error status code and JSON message is returned.
+    """
+    response = test_client.get(f"/api/filterby/years?{query_string}")
+    assert response.status_code == expected_status
+    assert response.json["status"] == expected_status
+
+
 def test_top_10_countries_2020(
     test_client,
     new_top_country_for_top_10,
@@ -292,3 +467,497 @@ def test_top_10_countries_2020(
     # and their values dynamically, even with a new country added
     for country in data["Top 10 countries for tourist arrivals"]:
         assert country["Country_Name"] in top_10_countries_expected.keys()
+
+
+def test_top_by_metric_is_numeric_and_follows_patch(test_client):
+    """
+    Test if GET request for a ranking is ordered and kept up to date.
+
+    Args:
+        test_client: fixture containing test client instance of app, to
+        allow the tests to interact with the Flask server.
+
+    Given: A Flask app configured for testing.
+    When: - A HTTP GET request is made to `/api/top` for the arrivals
+            of 2019, in both orders.
+          - A country is given the highest 2019 value with a PATCH
+            request and the ranking is requested again.
+    Then: - The rankings match the values of `/filterby/year/2019`
+            sorted numerically.
+          - After the PATCH, the country is ranked first.
+    """
+    year_data = test_client.get("/api/filterby/year/2019").json
+    values = sorted(
+        country["year_2019"]
+        for country in year_data
+        if country["year_2019"] is not None
+    )
+
+    response = test_client.get("/api/top?metric=arrivals&year=2019&n=5")
+    assert response.status_code == 200
+    assert response.json["year"] == 2019
+    assert [row["rank"] for row in response.json["data"]] == [1, 2, 3, 4, 5]
+    assert [row["value"] for row in response.json["data"]] == values[:-6:-1]
+
+    response = test_client.get(
+        "/api/top?metric=arrivals&year=2019&n=5&order=asc"
+    )
+    assert [row["value"] for row in response.json["data"]] == values[:5]
+
+    # Move a country to the top, then put its value back
+    original = test_client.get("/api/countries/country/Angola").json
+    test_client.patch(
+        "/api/countries/Angola", json={"year_2019": values[-1] + 1}
+    )
+    response = test_client.get("/api/top?metric=arrivals&year=2019&n=1")
+    assert response.json["data"][0]["Country_Name"] == "Angola"
+    test_client.patch(
+        "/api/countries/Angola",
+        json={"year_2019": original["year_2019"]},
+    )
+    response = test_client.get("/api/top?metric=arrivals&year=2019&n=1")
+    assert response.json["data"][0]["Country_Name"] != "Angola"
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "metric=unknown",
+        "metric=arrivals",
+        "metric=arrivals&year=1800",
+        "n=0",
+        "n=text",
+        "order=sideways",
+    ],
+)
+def test_top_by_metric_with_invalid_parameters(test_client, query):
+    """
+    Test if GET request for a ranking rejects invalid parameters.
+
+    Args:
+        test_client: fixture containing test client instance of app, to
+        allow the tests to interact with the Flask server.
+        query: parameter containing an invalid query string.
+
+    Given: A Flask app configured for testing.
+    When: A HTTP GET request is made to `/api/top` with the query.
+    Then: The response is a 400 error JSON message.
+    """
+    response = test_client.get(f"/api/top?{query}")
+    assert response.status_code == 400
+    assert response.json["status"] == 400
+
+
+@pytest.mark.parametrize(
+    "query, expected_country",
+    [
+        ("united", "United Kingdom"),
+        ("KINGDOM", "United Kingdom"),
+        ("gbr", "United Kingdom"),
+        ("côte d", "Cote d'Ivoire"),
+        ("inida", "India"),
+        ("Germny", "Germany"),
+    ],
+)
+def test_search_countries_by_prefix_code_and_typo(
+    test_client, query, expected_country
+):
+    """
+    Test if GET request for a search finds countries as they are typed.
+
+    Args:
+        test_client: fixture containing test client instance of app, to
+        allow the tests to interact with the Flask server.
+        query: parameter containing the start of a name or code, with
+        other case, accents or a typo.
+        expected_country: parameter containing the country to find.
+
+    Given: A Flask app configured for testing.
+    When: A HTTP GET request is made to `/api/countries/search` with
+          the query.
+    Then: - The response status code should be 200.
+          - The expected country is among the results, with its code
+            and region.
+    """
+    response = test_client.get(
+        "/api/countries/search", query_string={"q": query}
+    )
+    assert response.status_code == 200
+    assert response.json["query"] == query
+    names = [country["Country_Name"] for country in response.json["data"]]
+    assert expected_country in names
+    assert set(response.json["data"][0]) == {
+        "Country_Name", "Country_Code", "Region"
+    }
+
+
+def test_search_countries_ranks_and_limits(test_client):
+    """
+    Test if GET request for a search ranks closer matches first.
+
+    Args:
+        test_client: fixture containing test client instance of app, to
+        allow the tests to interact with the Flask server.
+
+    Given: A Flask app configured for testing.
+    When: HTTP GET requests are made to `/api/countries/search` for
+          "ind", with and without a limit.
+    Then: - Countries whose name starts with the query come first, in
+            name order.
+          - No more countries than the limit are returned.
+    """
+    response = test_client.get("/api/countries/search?q=ind")
+    names = [country["Country_Name"] for country in response.json["data"]]
+    assert names[:2] == ["India", "Indonesia"]
+
+    response = test_client.get("/api/countries/search?q=a&limit=3")
+    assert len(response.json["data"]) == 3
+
+
+def test_search_countries_follows_patch(test_client):
+    """
+    Test if the search index is kept current when a country is renamed.
+
+    Args:
+        test_client: fixture containing test client instance of app, to
+        allow the tests to interact with the Flask server.
+
+    Given: A Flask app configured for testing.
+    When: A country is renamed with a PATCH request, then renamed back.
+    Then: - After the first PATCH, the new name is found and the old
+            one is not.
+          - After the second PATCH, the old name is found again.
+    """
+    def search(query):
+        """Get the names of the countries found for a query."""
+        response = test_client.get(
+            "/api/countries/search", query_string={"q": query}
+        )
+        return [country["Country_Name"] for country in response.json["data"]]
+
+    test_client.patch(
+        "/api/countries/Aruba", json={"Country_Name": "Zanzaruba"}
+    )
+    assert search("zanzaruba") == ["Zanzaruba"]
+    assert "Aruba" not in search("aruba")
+
+    test_client.patch(
+        "/api/countries/Zanzaruba", json={"Country_Name": "Aruba"}
+    )
+    assert "Aruba" in search("aruba")
+    assert search("zanzaruba") == []
+
+
+@pytest.mark.parametrize(
+    "query",
+    ["", "q=", "q=%20", "q=india&limit=0", "q=india&limit=51",
+     "q=india&limit=text"],
+)
+def test_search_countries_with_invalid_parameters(test_client, query):
+    """
+    Test if GET request for a search rejects invalid parameters.
+
+    Args:
+        test_client: fixture containing test client instance of app, to
+        allow the tests to interact with the Flask server.
+        query: parameter containing an invalid query string.
+
+    Given: A Flask app configured for testing.
+    When: A HTTP GET request is made to `/api/countries/search` with
+          the query.
+    Then: The response is a 400 error JSON message.
+    """
+    response = test_client.get(f"/api/countries/search?{query}")
+    assert response.status_code == 400
+    assert response.json["status"] == 400
+
+
+@pytest.mark.parametrize(
+    "group_key, column, group",
+    [
+        ("region", "Region", "South Asia"),
+        ("region", "Region", "East Asia & Pacific"),
+        ("income", "IncomeGroup", "High income"),
+    ],
+)
+def test_filter_by_region_and_income_group(
+    test_client, group_key, column, group
+):
+    """
+    Test if GET request for a group returns exactly its countries.
+
+    Args:
+        test_client: fixture containing test client instance of app, to
+        allow the tests to interact with the Flask server.
+        group_key: parameter containing the group in the URI.
+        column: parameter containing the key of the group's column.
+        group: parameter containing a region or income group.
+
+    Given: A Flask app configured for testing.
+    When: A HTTP GET request is made to `/api/filterby/<group_key>/`
+          with the group.
+    Then: - The response status code should be 200.
+          - The countries are those of `/api/countries` in the group,
+            with all their details, in name order.
+    """
+    expected = sorted(
+        (
+            country
+            for country in test_client.get("/api/countries").json
+            if country[column] == group
+        ),
+        key=lambda country: country["Country_Name"],
+    )
+
+    response = test_client.get(f"/api/filterby/{group_key}/{group}")
+    assert response.status_code == 200
+    assert response.json == expected
+
+
+@pytest.mark.parametrize("group_key", ["region", "income"])
+def test_filter_by_unknown_group(test_client, group_key):
+    """
+    Test if GET request for a group without countries returns a 404.
+
+    Args:
+        test_client: fixture containing test client instance of app, to
+        allow the tests to interact with the Flask server.
+        group_key: parameter containing the group in the URI.
+
+    Given: A Flask app configured for testing.
+    When: A HTTP GET request is made to `/api/filterby/<group_key>/`
+          with a group no country is in.
+    Then: The response is a 404 error JSON message.
+    """
+    response = test_client.get(f"/api/filterby/{group_key}/Atlantis")
+    assert response.status_code == 404
+    assert response.json["status"] == 404
+
+
+def test_aggregate_by_region_matches_countries_and_follows_patch(
+    test_client,
+):
+    """
+    Test if GET request for the totals per region is correct and current.
+
+    Args:
+        test_client: fixture containing test client instance of app, to
+        allow the tests to interact with the Flask server.
+
+    Given: A Flask app configured for testing.
+    When: - A HTTP GET request is made to `/api/aggregate` by region for
+            2019.
+          - A country's 2019 value is changed with a PATCH request and
+            the totals are requested again.
+    Then: - Each region's sum, mean and count match the countries of
+            `/api/countries` with a 2019 value.
+          - After the PATCH, the country's region sum changes by the
+            same amount.
+    """
+    expected = {}
+    for country in test_client.get("/api/countries").json:
+        if country["year_2019"] is not None:
+            expected.setdefault(country["Region"], []).append(
+                country["year_2019"]
+            )
+
+    response = test_client.get("/api/aggregate?by=region&year=2019")
+    assert response.status_code == 200
+    assert response.json["by"] == "region"
+    assert response.json["year"] == 2019
+    totals = {row["Region"]: row for row in response.json["data"]}
+    for region, values in expected.items():
+        assert totals[region]["sum"] == sum(values)
+        assert totals[region]["count"] == len(values)
+        assert totals[region]["mean"] == pytest.approx(
+            sum(values) / len(values)
+        )
+
+    # Change one value, then put it back
+    original = test_client.get("/api/countries/country/Angola").json
+    test_client.patch(
+        "/api/countries/Angola",
+        json={"year_2019": original["year_2019"] + 1000},
+    )
+    response = test_client.get("/api/aggregate?by=region&year=2019")
+    patched = {row["Region"]: row for row in response.json["data"]}
+    region = original["Region"]
+    assert patched[region]["sum"] == totals[region]["sum"] + 1000
+    test_client.patch(
+        "/api/countries/Angola",
+        json={"year_2019": original["year_2019"]},
+    )
+
+
+@pytest.mark.parametrize(
+    "query, status_code",
+    [
+        ("year=2019", 400),
+        ("by=continent&year=2019", 400),
+        ("by=income", 400),
+        ("by=income&year=text", 400),
+        ("by=income&year=1800", 404),
+    ],
+)
+def test_aggregate_with_invalid_parameters(test_client, query, status_code):
+    """
+    Test if GET request for the totals per group rejects invalid input.
+
+    Args:
+        test_client: fixture containing test client instance of app, to
+        allow the tests to interact with the Flask server.
+        query: parameter containing an invalid query string.
+        status_code: parameter containing the expected error status.
+
+    Given: A Flask app configured for testing.
+    When: A HTTP GET request is made to `/api/aggregate` with the query.
+    Then: The response is an error JSON message with the status code.
+    """
+    response = test_client.get(f"/api/aggregate?{query}")
+    assert response.status_code == status_code
+    assert response.json["status"] == status_code
+
+
+def test_export_countries_streams_ndjson_and_csv(app, test_client):
+    """
+    Test if GET request for the export streams every country.
+
+    Args:
+        app: fixture containing the Flask app configured for testing.
+        test_client: fixture containing test client instance of app, to
+        allow the tests to interact with the Flask server.
+
+    Given: A Flask app fetching 50 countries at a time for exports.
+    When: - The export is requested as NDJSON.
+          - The export is requested as gzipped CSV with two fields.
+          - The export is requested with an unknown field.
+    Then: - The NDJSON has one line per country, equal to the countries
+            of `/countries` sorted by name.
+          - The CSV has a header and one row per country, with only
+            the two fields and empty cells for nulls.
+          - The unknown field returns a 400 error JSON message.
+    """
+    chunk_size = app.config["EXPORT_CHUNK_SIZE"]
+    app.config["EXPORT_CHUNK_SIZE"] = 50
+    countries = sorted(
+        test_client.get("/api/countries").json,
+        key=lambda country: country["Country_Name"],
+    )
+    try:
+        response = test_client.get("/api/countries/export")
+        assert response.status_code == 200
+        assert response.mimetype == "application/x-ndjson"
+        assert [
+            json.loads(line) for line in response.data.splitlines()
+        ] == countries
+
+        response = test_client.get(
+            "/api/countries/export?format=csv&fields=Country_Name,year_2020",
+            headers={"Accept-Encoding": "gzip"},
+        )
+        assert response.headers["Content-Encoding"] == "gzip"
+        rows = list(csv.reader(
+            io.StringIO(gzip.decompress(response.data).decode("utf-8"))
+        ))
+        assert rows[0] == ["Country_Name", "year_2020"]
+        assert rows[1:] == [
+            [
+                country["Country_Name"],
+                "" if country["year_2020"] is None
+                else str(country["year_2020"]),
+            ]
+            for country in countries
+        ]
+    finally:
+        app.config["EXPORT_CHUNK_SIZE"] = chunk_size
+
+    response = test_client.get("/api/countries/export?fields=year_1800")
+    assert response.status_code == 400
+
+
+def test_export_does_not_block_writers_while_streaming(app, test_client):
+    """
+    Test a write can commit while an export is being read.
+
+    Args:
+        app: fixture containing the app, whose chunk size is changed.
+        test_client: fixture containing test client instance of app, to
+            allow the tests to interact with the Flask server.
+
+    Given: An export of 50 countries a chunk, with only its first
+           chunk read, and the app's rollback journal storage profile.
+    When: Another connection writes to the database and commits,
+          without waiting for any lock.
+    Then: - The commit succeeds, as the export holds no lock between
+            chunks.
+          - The rest of the export is sent, every country once.
+    """
+    chunk_size = app.config["EXPORT_CHUNK_SIZE"]
+    app.config["EXPORT_CHUNK_SIZE"] = 50
+    try:
+        response = test_client.get(
+            "/api/countries/export?fields=Country_Name", buffered=False
+        )
+        chunks = iter(response.response)
+        first_chunk = next(chunks)
+
+        database = make_url(app.config["SQLALCHEMY_DATABASE_URI"]).database
+        writer = sqlite3.connect(database, timeout=0)
+        try:
+            writer.execute("CREATE TABLE export_write_check (id INTEGER)")
+            writer.execute("DROP TABLE export_write_check")
+            writer.commit()
+        finally:
+            writer.close()
+
+        body = first_chunk + b"".join(chunks)
+        response.close()
+    finally:
+        app.config["EXPORT_CHUNK_SIZE"] = chunk_size
+    names = [json.loads(line)["Country_Name"] for line in body.splitlines()]
+    assert names == sorted(
+        country["Country_Name"]
+        for country in test_client.get("/api/countries").json
+    )
+
+
+@pytest.mark.parametrize(
+    "url, expected_message",
+    [
+        (
+            "/api/countries?limit=²",
+            "limit must be an integer between 1 and 1000",
+        ),
+        (
+            "/api/countries/search?q=a&limit=²",
+            "limit must be an integer between 1 and 50",
+        ),
+        ("/api/filterby/years?from=²", "from and to must be years"),
+        ("/api/top?n=²", "n must be a positive integer"),
+        (
+            "/api/top?metric=arrivals&year=²",
+            "year is required for the arrivals metric",
+        ),
+        ("/api/aggregate?by=region&year=²", "year must be a year"),
+    ],
+)
+def test_number_parameters_only_accept_ascii_digits(
+    test_client, url, expected_message
+):
+    """
+    Test number parameters reject digits int() cannot read.
+
+    Args:
+        test_client: fixture containing test client instance of app, to
+            allow the tests to interact with the Flask server.
+        url: The URL with a number parameter of "²".
+        expected_message: The route's message for an invalid value.
+
+    Given: A Flask test client.
+    When: A GET request sends "²", a digit to str.isdigit(), as a
+          number parameter.
+    Then: The route returns 400 with its own message for the parameter.
+    """
+    response = test_client.get(url)
+    assert response.status_code == 400
+    assert response.json["message"] == expected_message
@@ -1,6 +1,7 @@
 """This file tests the PATCH routes."""
 import pytest
-from tourism_hotels_app.models import TourismArrivals
+from sqlalchemy import event
+from tourism_hotels_app.models import TourismArrivals, TourismObservation
 from tourism_hotels_app.schemas import TourismArrivalsSchema
 from tourism_hotels_app import db
 
@@ -109,6 +110,24 @@ def test_edit_existing_country_with_valid_input(
             400,
             "The value entered for year_1995 should be of type: int",
         ),
+        (
+            "India",
+            {"year_1995": True},
+            400,
+            "The value entered for year_1995 should be of type: int",
+        ),
+        (
+            "India",
+            {"year_2019": -5},
+            400,
+            "The value entered for year_2019 cannot be negative",
+        ),
+        (
+            "India",
+            {"year_2021": 2 ** 63},
+            400,
+            "The value entered for year_2021 is too large to be stored",
+        ),
     ],
 )
 def test_edit_country_with_invalid_country_or_invalid_json_entry(
@@ -210,3 +229,322 @@ def test_edit_nonexistent_country(test_client):
         response_json["message"] ==
         "Invalid resource URI - That country does not exist"
     )
+
+
+def test_get_country_reflects_patch(test_client):
+    """
+    Test GET route returns the new values after a PATCH request.
+
+    Args:
+        test_client: fixture containing test client instance of app, to
+            allow the tests to interact with the Flask server.
+
+    Given: A Flask test client and the in-memory snapshot used by the
+           GET routes.
+    When: A HTTP PATCH request updates a year column of a country,
+    Then: The GET routes for that country and year should return the
+          updated value without the app being restarted.
+    """
+    # Use a value that differs from the current one to avoid an error
+    current = test_client.get("/api/countries/country/Aruba").json
+    new_value = current["year_2002"] + 1
+
+    response = test_client.patch(
+        "/api/countries/Aruba", json={"year_2002": new_value}
+    )
+    assert response.status_code == 200
+
+    # Assert the snapshot was patched for both GET routes
+    country_response = test_client.get("/api/countries/country/Aruba")
+    assert country_response.json["year_2002"] == new_value
+    year_response = test_client.get("/api/filterby/year/2002")
+    aruba = [
+        row for row in year_response.json if row["Country_Name"] == "Aruba"
+    ]
+    assert aruba == [{"Country_Name": "Aruba", "year_2002": new_value}]
+
+
+def test_patch_new_year_is_stored_as_observation(test_client):
+    """
+    Test PATCH method with a year that has no column in the model.
+
+    Args:
+        test_client: fixture containing test client instance of app, to
+            allow the tests to interact with the Flask server.
+
+    Given: A Flask test client and a database without any 2021 data.
+    When: - A HTTP PATCH request sets year_2021 for an existing country.
+          - The year is then removed again by patching it to null.
+    Then: - The PATCH succeeds and the year is stored in the
+            tourism_observations table.
+          - The GET routes return year_2021 without a code change.
+          - After removing it, no 2021 observation is left and the
+            year is no longer served.
+    """
+    response = test_client.patch(
+        "/api/countries/India", json={"year_2021": 7000000}
+    )
+    assert response.status_code == 200
+    assert response.json["year_2021"] == 7000000
+
+    # Check the new year is stored in the long-format table
+    stored_value = db.session.execute(
+        db.select(TourismObservation.Value).filter_by(
+            Country_Name="India", Year=2021
+        )
+    ).scalar_one()
+    assert stored_value == 7000000
+
+    # Check the GET routes read it from the long-format table
+    country_response = test_client.get("/api/countries/country/India")
+    assert country_response.json["year_2021"] == 7000000
+    year_response = test_client.get("/api/filterby/year/2021")
+    assert year_response.status_code == 200
+    assert {"Country_Name": "India", "year_2021": 7000000} in (
+        year_response.json
+    )
+
+    # Remove the year again, which drops it from the year axis
+    response = test_client.patch(
+        "/api/countries/India", json={"year_2021": None}
+    )
+    assert response.status_code == 200
+    assert db.session.execute(
+        db.select(TourismObservation).filter_by(Year=2021)
+    ).first() is None
+    assert test_client.get("/api/filterby/year/2021").status_code == 404
+
+
+def test_patch_year_recomputes_derived_metrics(test_client):
+    """
+    Test PATCH method recomputes the derived metrics of the country.
+
+    Args:
+        test_client: fixture containing test client instance of app, to
+            allow the tests to interact with the Flask server.
+
+    Given: A Flask test client and Albania, with 6406000 arrivals in
+           2019 and a 10-year average of 4235100.
+    When: - A HTTP PATCH request changes its 2020 arrivals to 3203000.
+          - A HTTP PATCH request tries to set the average directly.
+    Then: - The percent drop and average are recomputed from the years.
+          - Setting the average is rejected with a 400 error.
+    """
+    original = test_client.get("/api/countries/country/Albania").json
+    response = test_client.patch(
+        "/api/countries/Albania", json={"year_2020": 3203000}
+    )
+    assert response.status_code == 200
+    assert response.json["Percent_drop_2019_to_2020"] == "-50%"
+    # The 2020 value is 545000 higher, so the average is 54500 higher
+    assert response.json["Average_10year_in_tourist_arrivals"] == "4289600.0"
+    assert response.json["Max_number_of_arrivals"] == 6406000
+
+    response = test_client.patch(
+        "/api/countries/Albania",
+        json={"Average_10year_in_tourist_arrivals": "1"},
+    )
+    assert response.status_code == 400
+
+    test_client.patch(
+        "/api/countries/Albania", json={"year_2020": original["year_2020"]}
+    )
+
+
+def test_country_etag_and_conditional_patch(test_client):
+    """
+    Test the country ETag with conditional GET and PATCH requests.
+
+    Args:
+        test_client: fixture containing test client instance of app, to
+            allow the tests to interact with the Flask server.
+
+    Given: A Flask test client and a country's current ETag.
+    When: - The country is requested again with If-None-Match.
+          - It is patched with If-Match set to that ETag.
+          - It is patched again with the ETag that is now outdated.
+    Then: - The GET returns 304 with no body.
+          - The first PATCH succeeds and returns a new ETag, which a
+            GET returns too.
+          - The second PATCH returns 412 and changes nothing.
+    """
+    response = test_client.get("/api/countries/country/Aruba")
+    etag = response.get_etag()[0]
+    assert etag
+
+    cached = test_client.get(
+        "/api/countries/country/Aruba", headers={"If-None-Match": f'"{etag}"'}
+    )
+    assert cached.status_code == 304
+    assert cached.data == b""
+
+    new_value = response.json["year_2003"] + 1
+    patched = test_client.patch(
+        "/api/countries/Aruba",
+        json={"year_2003": new_value},
+        headers={"If-Match": f'"{etag}"'},
+    )
+    assert patched.status_code == 200
+    new_etag = patched.get_etag()[0]
+    assert new_etag != etag
+    refreshed = test_client.get(
+        "/api/countries/country/Aruba", headers={"If-None-Match": f'"{etag}"'}
+    )
+    assert refreshed.status_code == 200
+    assert refreshed.get_etag()[0] == new_etag
+
+    stale = test_client.patch(
+        "/api/countries/Aruba",
+        json={"year_2003": new_value + 1},
+        headers={"If-Match": f'"{etag}"'},
+    )
+    assert stale.status_code == 412
+    assert stale.json["error"] == "Precondition Failed"
+    current = test_client.get("/api/countries/country/Aruba")
+    assert current.json["year_2003"] == new_value
+
+
+def test_update_outside_the_orm_changes_the_etag(test_client):
+    """
+    Test a Core UPDATE increases the row version, through the trigger.
+
+    Args:
+        test_client: fixture containing test client instance of app, to
+            allow the tests to interact with the Flask server.
+
+    Given: A Flask test client and a country's current ETag.
+    When: The country is updated with a Core UPDATE statement, as the
+          csv import and the CLI commands do, and then patched with
+          If-Match set to the ETag read before.
+    Then: The ETag changes and the PATCH returns 412.
+    """
+    etag = test_client.get("/api/countries/country/Albania").get_etag()[0]
+    table = TourismArrivals.__table__
+    db.session.execute(
+        db.update(table)
+        .where(table.c["Country Name"] == "Albania")
+        .values(Region="Europe & Central Asia")
+    )
+    db.session.commit()
+
+    response = test_client.get("/api/countries/country/Albania")
+    assert response.get_etag()[0] != etag
+    stale = test_client.patch(
+        "/api/countries/Albania",
+        json={"Region": "UpdatedRegion"},
+        headers={"If-Match": f'"{etag}"'},
+    )
+    assert stale.status_code == 412
+
+
+def test_patch_runs_one_statement(app, test_client):
+    """
+    Test a PATCH of model columns is written with one UPDATE statement.
+
+    Args:
+        app: fixture containing the Flask app instance.
+        test_client: fixture containing test client instance of app, to
+            allow the tests to interact with the Flask server.
+
+    Given: A Flask test client and a listener counting the statements
+           run on both database engines.
+    When: A HTTP PATCH request changes a year column of a country.
+    Then: The only statement run is one UPDATE, and the GET route
+          returns the new value and derived metrics from the snapshot.
+    """
+    current = test_client.get("/api/countries/country/Armenia").json
+    statements = []
+
+    def count_statement(conn, cursor, statement, *args):
+        """Keep the statement."""
+        statements.append(statement)
+
+    engines = list(db.engines.values())
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", count_statement)
+    try:
+        response = test_client.patch(
+            "/api/countries/Armenia",
+            json={"year_2020": current["year_2020"] + 1},
+        )
+    finally:
+        for engine in engines:
+            event.remove(engine, "before_cursor_execute", count_statement)
+
+    assert response.status_code == 200
+    assert len(statements) == 1
+    assert statements[0].startswith("UPDATE tourism_arrivals")
+    assert "RETURNING" in statements[0]
+    country = test_client.get("/api/countries/country/Armenia").json
+    assert country == response.json
+    assert country["year_2020"] == current["year_2020"] + 1
+    assert country["Average_10year_in_tourist_arrivals"] != (
+        current["Average_10year_in_tourist_arrivals"]
+    )
+
+
+def test_bulk_patch(test_client):
+    """
+    Test the bulk PATCH applies all patches, or none if any is invalid.
+
+    Args:
+        test_client: fixture containing test client instance of app, to
+            allow the tests to interact with the Flask server.
+
+    Given: A Flask test client and the ETags of two countries.
+    When: - A bulk PATCH has a valid patch and an invalid one.
+          - A bulk PATCH has an outdated etag.
+          - A bulk PATCH has two valid patches, one with its etag.
+    Then: - The first returns 400 with the invalid patch's position,
+            and the valid patch is not applied.
+          - The second returns 412.
+          - The third applies both and returns their new ETags, which
+            the GET route returns too.
+    """
+    austria = test_client.get("/api/countries/country/Austria")
+    bahrain = test_client.get("/api/countries/country/Bahrain")
+    austria_etag = austria.get_etag()[0]
+    austria_patch = {
+        "Country_Name": "Austria",
+        "patch": {"year_2020": austria.json["year_2020"] + 1},
+        "etag": austria_etag,
+    }
+
+    response = test_client.patch(
+        "/api/countries",
+        json=[
+            austria_patch,
+            {"Country_Name": "Bahrain", "patch": {"year_2020": "many"}},
+        ],
+    )
+    assert response.status_code == 400
+    assert response.json["failed"] == 1
+    assert response.json["errors"][0]["index"] == 1
+    assert test_client.get("/api/countries/country/Austria").json == (
+        austria.json
+    )
+
+    response = test_client.patch(
+        "/api/countries", json=[dict(austria_patch, etag="v0")]
+    )
+    assert response.status_code == 412
+
+    response = test_client.patch(
+        "/api/countries",
+        json=[
+            austria_patch,
+            {"Country_Name": "Bahrain", "patch": {"Region": "Gulf"}},
+        ],
+    )
+    assert response.status_code == 200
+    assert response.json["updated"] == 2
+    austria = test_client.get("/api/countries/country/Austria")
+    bahrain_after = test_client.get("/api/countries/country/Bahrain")
+    assert austria.json["year_2020"] == austria_patch["patch"]["year_2020"]
+    assert bahrain_after.json["Region"] == "Gulf"
+    assert response.json["etags"] == {
+        "Austria": austria.get_etag()[0],
+        "Bahrain": bahrain_after.get_etag()[0],
+    }
+    assert austria.get_etag()[0] != austria_etag
+    assert bahrain_after.get_etag()[0] != bahrain.get_etag()[0]
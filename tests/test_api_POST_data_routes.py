@@ -1,7 +1,14 @@
 """This file tests the POST routes."""
+import io
+import json
+import pytest
+from sqlalchemy import event
 from tourism_hotels_app.models import TourismArrivals
 from tourism_hotels_app.schemas import TourismArrivalsSchema
 from tourism_hotels_app import db
+from tourism_hotels_app.derived_metrics import DERIVED_KEYS
+from tourism_hotels_app.bulk_ingest import iter_json_array
+from tourism_hotels_app.storage import WRITE_LOCK
 
 # Define Schemas
 countries_schema = TourismArrivalsSchema(many=True)
@@ -37,6 +44,7 @@ def test_post_country_added_when_add_country(
           "/api/countries" with the given data
     Then: the new country is added to the database and its data
           matches the given JSON data, and
+          the derived metrics are computed from the year values, and
           the response status code is 201, and
           the number of countries in the database increases by 1.
 
@@ -82,9 +90,17 @@ def test_post_country_added_when_add_country(
     )
     data = response.json
 
-    # Assert if correct expected values are in the posted entry
+    # Assert if correct expected values are in the posted entry,
+    # except the derived metrics the server computes from the years
     for key, value in country_example_json.items():
-        assert data[key] == value
+        if key not in DERIVED_KEYS:
+            assert data[key] == value
+
+    # Every year is 1, so the sent metrics are replaced by these
+    assert data["Average_10year_in_tourist_arrivals"] == "1.0"
+    assert data["Max_number_of_arrivals"] == 1
+    assert data["Minimum_number_of_arrivals"] == 1
+    assert data["Percent_drop_2019_to_2020"] == "0%"
 
     # Assert correct status code and correct count after adding
     assert response.status_code == 201
@@ -171,3 +187,320 @@ def test_post_country_not_added_when_invalid_entry(
                     ),
                 }
                 assert ValueError(expected_error_message)
+
+
+def test_post_checks_every_non_nullable_column(
+    test_client, country_example_base_valid_json
+):
+    """
+    Test POST rejects an empty required value wherever it is sent.
+
+    Args:
+        test_client: fixture containing test client instance of app, to
+            allow the tests to interact with the Flask server.
+        country_example_base_valid_json: fixture containing a valid
+            example country in JSON.
+
+    Given: A valid country with its Region emptied and sent last, after
+           the year keys, and the same country with a negative year.
+    When: Each is sent to "/api/countries" with a POST request.
+    Then: Both are rejected with 400 and the validator's message.
+    """
+    # Other tests of the module empty the fixture's IncomeGroup
+    valid_country = {
+        **country_example_base_valid_json, "IncomeGroup": "High Income"
+    }
+    country = dict(valid_country)
+    del country["Region"]
+    country["Region"] = ""
+    response = test_client.post("/api/countries", json=country)
+    assert response.status_code == 400
+    assert response.get_json()["error"] == (
+        "The value entered for Region cannot be empty or null"
+    )
+
+    country = {**valid_country, "year_2019": -1}
+    response = test_client.post("/api/countries", json=country)
+    assert response.status_code == 400
+    assert response.get_json()["error"] == (
+        "The value entered for year_2019 cannot be negative"
+    )
+
+
+def test_whitespace_only_text_is_rejected_like_the_csv_import(
+    test_client, country_example_base_valid_json
+):
+    """
+    Test POST and PATCH reject a required text of only whitespace.
+
+    Args:
+        test_client: fixture containing test client instance of app, to
+            allow the tests to interact with the Flask server.
+        country_example_base_valid_json: fixture containing a valid
+            example country in JSON.
+
+    Given: A valid country with a Region of only spaces, and a PATCH
+           setting an existing country's Region to spaces.
+    When: They are sent to "/api/countries" and
+          "/api/countries/Angola".
+    Then: - Both are rejected with 400 and the message of an empty
+            value, as validate_frame() rejects it in the csv import.
+          - Angola keeps its Region.
+    """
+    expected_error = "The value entered for Region cannot be empty or null"
+    country = {
+        **country_example_base_valid_json,
+        "IncomeGroup": "High Income",
+        "Region": "  ",
+    }
+    response = test_client.post("/api/countries", json=country)
+    assert response.status_code == 400
+    assert response.get_json()["error"] == expected_error
+
+    region = test_client.get("/api/countries/country/Angola").json["Region"]
+    response = test_client.patch(
+        "/api/countries/Angola", json={"Region": " \t "}
+    )
+    assert response.status_code == 400
+    assert response.get_json()["error"] == expected_error
+    assert test_client.get("/api/countries/country/Angola").json[
+        "Region"
+    ] == region
+
+
+def test_bulk_post_reports_each_failed_country(test_client):
+    """
+    Test bulk POST of NDJSON inserts the valid countries only.
+
+    Args:
+        test_client: fixture containing test client instance of app, to
+            allow the tests to interact with the Flask server.
+
+    Given: An NDJSON body with two new valid countries, one country
+           missing its Region, one country that already exists and one
+           line that is not valid JSON.
+    When: A POST request is made to "/api/countries/bulk".
+    Then: - The response status code is 200, as only some countries
+            were inserted.
+          - The report lists each failed country by its position, in
+            body order.
+          - The valid countries are served with computed metrics.
+    """
+    # Every year is 1, as in the valid example country
+    valid_countries = [
+        {
+            "Country_Name": name,
+            "Region": "New Region",
+            "IncomeGroup": "High Income",
+            "Country_Code": "TEST",
+            "Indicator_Name": "International tourism, number of arrivals",
+            **{f"year_{year}": 1 for year in range(1995, 2021)},
+        }
+        for name in ("Bulk Country 1", "Bulk Country 2")
+    ]
+    missing_region = dict(valid_countries[0], Country_Name="Bulk Country 3")
+    del missing_region["Region"]
+    existing_country = dict(valid_countries[0], Country_Name="Angola")
+    lines = [
+        json.dumps(valid_countries[0]),
+        json.dumps(missing_region),
+        "",
+        json.dumps(existing_country),
+        "{not json",
+        json.dumps(valid_countries[1]),
+    ]
+
+    response = test_client.post(
+        "/api/countries/bulk",
+        data="\n".join(lines),
+        content_type="application/x-ndjson",
+    )
+    assert response.status_code == 200
+    report = response.json
+    assert (report["received"], report["inserted"], report["failed"]) == (
+        5, 2, 3
+    )
+    assert [error["index"] for error in report["errors"]] == [1, 2, 3]
+    assert report["errors"][1]["Country_Name"] == "Angola"
+
+    for country in valid_countries:
+        served = test_client.get(
+            f"/api/countries/country/{country['Country_Name']}"
+        ).json
+        assert served["year_1995"] == 1
+        assert served["Percent_drop_2019_to_2020"] == "0%"
+
+    # Remove the inserted countries again
+    db.session.execute(
+        db.delete(TourismArrivals).where(
+            TourismArrivals.Country_Name.in_(
+                [country["Country_Name"] for country in valid_countries]
+            )
+        )
+    )
+    db.session.commit()
+
+
+def test_bulk_post_reports_content_after_the_array(test_client):
+    """
+    Test bulk POST of a JSON array reports content that follows it.
+
+    Args:
+        test_client: fixture containing test client instance of app, to
+            allow the tests to interact with the Flask server.
+
+    Given: A JSON array with one valid country, followed by text.
+    When: A POST request is made to "/api/countries/bulk".
+    Then: The country is inserted, but the text is reported as an error
+          after it, so the response is 200 rather than 201.
+    """
+    country = {
+        "Country_Name": "Bulk Country 6",
+        "Region": "New Region",
+        "IncomeGroup": "High Income",
+        "Country_Code": "TEST",
+        "Indicator_Name": "International tourism, number of arrivals",
+        **{f"year_{year}": 1 for year in range(1995, 2021)},
+    }
+    response = test_client.post(
+        "/api/countries/bulk",
+        data=json.dumps([country]) + " garbage",
+        content_type="application/json",
+    )
+    assert response.status_code == 200
+    report = response.json
+    assert (report["received"], report["inserted"], report["failed"]) == (
+        1, 1, 1
+    )
+    assert report["errors"] == [{
+        "index": 1,
+        "Country_Name": None,
+        "error": "Invalid JSON: content after the array",
+    }]
+
+    # Remove the inserted country again
+    db.session.execute(
+        db.delete(TourismArrivals).where(
+            TourismArrivals.Country_Name == "Bulk Country 6"
+        )
+    )
+    db.session.commit()
+
+
+class LockCheckingStream(io.BytesIO):
+    """A request body recording if the write lock is held at each read."""
+
+    def __init__(self, body):
+        """Create the stream of the given body bytes."""
+        super().__init__(body)
+        self.lock_held = []
+
+    def read(self, size=-1):
+        """Read from the body, noting if the write lock is held."""
+        self.lock_held.append(WRITE_LOCK.locked())
+        return super().read(size)
+
+    def readinto(self, buffer):
+        """Read into a buffer, noting if the write lock is held."""
+        self.lock_held.append(WRITE_LOCK.locked())
+        return super().readinto(buffer)
+
+
+def test_bulk_post_only_holds_write_lock_to_insert(app, test_client):
+    """
+    Test bulk POST holds the write lock per chunk, not while reading.
+
+    Args:
+        app: fixture containing the app, whose chunk size is changed.
+        test_client: fixture containing test client instance of app, to
+            allow the tests to interact with the Flask server.
+
+    Given: A chunk size of 1 and an NDJSON body with two new countries.
+    When: A POST request is made to "/api/countries/bulk".
+    Then: - Both countries are inserted, in one statement each.
+          - The write lock is held for every statement of the writer,
+            and never while the body is read, so a slow client does
+            not hold up the other writers.
+    """
+    lines = [
+        json.dumps({
+            "Country_Name": name,
+            "Region": "New Region",
+            "IncomeGroup": "High Income",
+            "Country_Code": "TEST",
+            "Indicator_Name": "International tourism, number of arrivals",
+            **{f"year_{year}": 1 for year in range(1995, 2021)},
+        })
+        for name in ("Bulk Country 4", "Bulk Country 5")
+    ]
+    stream = LockCheckingStream("\n".join(lines).encode("utf-8"))
+    lock_held_per_statement = []
+
+    def record_lock(*args):
+        lock_held_per_statement.append(WRITE_LOCK.locked())
+
+    chunk_size = app.config["BULK_INGEST_CHUNK_SIZE"]
+    app.config["BULK_INGEST_CHUNK_SIZE"] = 1
+    event.listen(db.engine, "before_cursor_execute", record_lock)
+    try:
+        response = test_client.post(
+            "/api/countries/bulk",
+            input_stream=stream,
+            content_type="application/x-ndjson",
+            headers={"Content-Length": str(len(stream.getvalue()))},
+        )
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record_lock)
+        app.config["BULK_INGEST_CHUNK_SIZE"] = chunk_size
+    assert response.status_code == 201
+    assert response.json["inserted"] == 2
+    assert lock_held_per_statement and all(lock_held_per_statement)
+    assert stream.lock_held and not any(stream.lock_held)
+
+    # Remove the inserted countries again
+    db.session.execute(
+        db.delete(TourismArrivals).where(
+            TourismArrivals.Country_Name.in_(
+                ["Bulk Country 4", "Bulk Country 5"]
+            )
+        )
+    )
+    db.session.commit()
+
+
+def test_iter_json_array_reads_elements_split_across_reads():
+    """
+    Test the JSON array reader of the bulk route on a streamed body.
+
+    Given: A JSON array read 7 bytes at a time, so elements and a
+           non-ASCII character are split between reads.
+    When: The array is read with iter_json_array(), complete, with its
+          closing bracket missing, followed by whitespace and followed
+          by other content.
+    Then: - Every element is returned in order.
+          - A missing closing bracket or content after the array raise
+            a ValueError, after the complete elements have been
+            returned, while whitespace after it is ignored.
+    """
+    elements = [{"Country_Name": "Curaçao", "year_1995": 1}, {"a": [1, 2]}]
+    body = json.dumps(elements, ensure_ascii=False).encode("utf-8")
+
+    read = [data for data, _ in iter_json_array(io.BytesIO(body), 7)]
+    assert read == elements
+
+    read = []
+    with pytest.raises(ValueError):
+        for data, _ in iter_json_array(io.BytesIO(body[:-1]), 7):
+            read.append(data)
+    assert read == elements
+
+    read = [
+        data for data, _ in iter_json_array(io.BytesIO(body + b" \n"), 7)
+    ]
+    assert read == elements
+
+    read = []
+    with pytest.raises(ValueError, match="content after the array"):
+        for data, _ in iter_json_array(io.BytesIO(body + b" garbage"), 7):
+            read.append(data)
+    assert read == elements
@@ -0,0 +1,119 @@
+"""This file tests the ASGI entry point of the app."""
+import asyncio
+import json
+import shutil
+from tourism_hotels_app import config, PROJECT_ROOT
+from tourism_hotels_app.asgi import create_asgi_app
+
+
+def call_asgi(asgi_app, method, path, query_string=b"", headers=()):
+    """
+    Send one HTTP request to an ASGI app, as an ASGI server would.
+
+    Args:
+        asgi_app: The ASGI application.
+        method (str): The HTTP method.
+        path (str): The request path.
+        query_string (bytes): The query string, without the "?".
+        headers: (name, value) pairs of bytes.
+    Returns:
+        The status, the headers as a dictionary and the body.
+    """
+    async def call():
+        requests = [{"type": "http.request", "body": b""}]
+        messages = []
+
+        async def receive():
+            return requests.pop(0) if requests else {"type": "http.disconnect"}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {
+            "type": "http",
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "query_string": query_string,
+            "headers": list(headers),
+            "server": ("127.0.0.1", 8000),
+        }
+        await asgi_app(scope, receive, send)
+        return messages
+
+    messages = asyncio.run(call())
+    assert messages[-1]["more_body"] is False
+    return (
+        messages[0]["status"],
+        dict(messages[0]["headers"]),
+        b"".join(message["body"] for message in messages[1:]),
+    )
+
+
+def test_asgi_app_serves_same_responses_as_sync_app(tmp_path):
+    """
+    Test if the ASGI entry point answers like the sync app.
+
+    Args:
+        tmp_path: pytest fixture with a temporary directory.
+
+    Given: An ASGI app on a copy of the database.
+    When: - A country is requested.
+          - All countries are requested with their current ETag.
+          - The streamed export is requested.
+          - The server shuts the app down.
+    Then: - The country is the same as from the sync app.
+          - The countries get a 304 with no body.
+          - The export has one line per country.
+          - The shutdown is acknowledged.
+    """
+    database = tmp_path / "tourism_hotels.db"
+    shutil.copy(PROJECT_ROOT / "data" / "tourism_hotels.db", database)
+    asgi_config = type(
+        "ASGIConfig",
+        (config.TestConfig,),
+        {
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{database}",
+            "SQLALCHEMY_ECHO": False,
+        },
+    )
+    asgi_app = create_asgi_app(asgi_config)
+    sync_client = asgi_app.flask_app.test_client()
+
+    path = "/api/countries/country/Angola"
+    status, headers, body = call_asgi(asgi_app, "GET", path)
+    assert status == 200
+    assert headers[b"content-type"] == b"application/json"
+    assert json.loads(body) == sync_client.get(path).json
+
+    etag = sync_client.get("/api/countries").headers["ETag"]
+    status, headers, body = call_asgi(
+        asgi_app, "GET", "/api/countries",
+        headers=[(b"if-none-match", etag.encode())],
+    )
+    assert (status, body) == (304, b"")
+
+    status, headers, body = call_asgi(
+        asgi_app, "GET", "/api/countries/export", b"format=ndjson"
+    )
+    countries = sync_client.get("/api/countries").json
+    assert status == 200
+    assert len(body.splitlines()) == len(countries)
+
+    async def shut_down():
+        events = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+        sent = []
+
+        async def receive():
+            return events.pop(0)
+
+        async def send(message):
+            sent.append(message["type"])
+
+        await asgi_app({"type": "lifespan"}, receive, send)
+        return sent
+
+    assert asyncio.run(shut_down()) == [
+        "lifespan.startup.complete", "lifespan.shutdown.complete"
+    ]
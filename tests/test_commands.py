@@ -0,0 +1,36 @@
+"""This file tests the flask command line commands."""
+from tourism_hotels_app.models import TourismArrivals
+from tourism_hotels_app.snapshot import snapshot
+from tourism_hotels_app import db
+
+
+def test_check_derived_metrics_finds_and_fixes_mismatch(app, test_client):
+    """
+    Test the check-derived-metrics command on an inconsistent country.
+
+    Args:
+        app: fixture containing the Flask app configured for testing.
+        test_client: fixture containing test client instance of app,
+            used here for its application context.
+
+    Given: A country whose stored maximum contradicts its year values.
+    When: - The check-derived-metrics command is run.
+          - The command is run again with --fix.
+    Then: - The first run reports the country and exits with status 1.
+          - The second run stores the computed maximum, which the
+            snapshot serves straight away.
+    """
+    angola = db.session.execute(
+        db.select(TourismArrivals).filter_by(Country_Name="Angola")
+    ).scalar_one()
+    angola.Max_number_of_arrivals = 1
+    db.session.commit()
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=["check-derived-metrics"])
+    assert result.exit_code == 1
+    assert "Angola: Max_number_of_arrivals is 1" in result.output
+
+    result = runner.invoke(args=["check-derived-metrics", "--fix"])
+    assert result.exit_code == 0
+    assert snapshot.country("Angola")["Max_number_of_arrivals"] == 650000
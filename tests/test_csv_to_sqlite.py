@@ -0,0 +1,171 @@
+"""This file tests the csv importer in tourism_hotels_app/data."""
+import sqlite3
+import subprocess
+import sys
+import pandas as pd
+from tourism_hotels_app import PROJECT_ROOT
+from tourism_hotels_app.data.csv_to_sqlite import (
+    csv_to_sqlite,
+    tourism_arrivals_prepared_file,
+)
+
+
+def test_csv_import_only_writes_changed_rows(tmp_path):
+    """
+    Test if importing a csv again only inserts and updates what changed.
+
+    Args:
+        tmp_path: pytest fixture with a temporary directory.
+
+    Given: A database imported from the first 5 rows of the csv.
+    When: The same csv is imported again, then a csv with one row
+        changed and one row added.
+    Then: The first re-import leaves every row unchanged, the second
+        updates and inserts one row each, and no row is duplicated.
+    """
+    csv_file = tmp_path / "countries.csv"
+    database = tmp_path / "countries.db"
+    countries = pd.read_csv(tourism_arrivals_prepared_file).head(6)
+    countries.head(5).to_csv(csv_file, index=False)
+
+    first = csv_to_sqlite(csv_file, database, chunk_size=2)
+    again = csv_to_sqlite(csv_file, database, chunk_size=2)
+    assert first == {
+        "inserted": 5, "updated": 0, "unchanged": 0, "rejected": 0
+    }
+    assert again == {
+        "inserted": 0, "updated": 0, "unchanged": 5, "rejected": 0
+    }
+
+    countries.loc[0, "2019"] = 1234000
+    countries.to_csv(csv_file, index=False)
+    refresh = csv_to_sqlite(csv_file, database, chunk_size=2)
+    assert refresh == {
+        "inserted": 1, "updated": 1, "unchanged": 4, "rejected": 0
+    }
+
+    connection = sqlite3.connect(database)
+    rows = connection.execute(
+        'SELECT "Country Name", "2019" FROM tourism_arrivals'
+    ).fetchall()
+    connection.close()
+    assert len(rows) == 6
+    assert dict(rows)[countries.loc[0, "Country Name"]] == 1234000
+
+
+def test_csv_import_rejects_invalid_rows_and_coerces_types(tmp_path):
+    """
+    Test if the import validates rows with the model's rules.
+
+    Args:
+        tmp_path: pytest fixture with a temporary directory.
+
+    Given: A csv with a null IncomeGroup, a year that is not a number
+        and a year with a fraction.
+    When: The csv is imported.
+    Then: The first two rows are written to the rejects file with the
+        API's messages, and the third is stored with a whole number and
+        derived metrics computed from its years.
+    """
+    csv_file = tmp_path / "countries.csv"
+    database = tmp_path / "countries.db"
+    countries = pd.read_csv(tourism_arrivals_prepared_file).head(3)
+    countries["2019"] = countries["2019"].astype(object)
+    countries.loc[0, "IncomeGroup"] = None
+    countries.loc[1, "2019"] = "many"
+    countries.loc[2, "2019"] = 1000000.4
+    countries.loc[2, "Max number of arrivals"] = 1
+    countries.to_csv(csv_file, index=False)
+
+    report = csv_to_sqlite(csv_file, database)
+    assert report == {
+        "inserted": 1, "updated": 0, "unchanged": 0, "rejected": 2
+    }
+    rejected = pd.read_csv(tmp_path / "countries.rejected.csv")
+    assert rejected["Error"].tolist() == [
+        "The value entered for IncomeGroup cannot be empty or null",
+        "The value entered for year_2019 should be of type: int",
+    ]
+
+    connection = sqlite3.connect(database)
+    year_2019, maximum = connection.execute(
+        'SELECT "2019", "Max number of arrivals" FROM tourism_arrivals'
+    ).fetchone()
+    connection.close()
+    assert year_2019 == 1000000
+    assert maximum == countries.iloc[2, 5:31].astype(float).max().round()
+
+
+def test_csv_import_rejects_numbers_too_large_to_store(tmp_path):
+    """
+    Test if years that do not fit an INTEGER are rejected, not crashing.
+
+    Args:
+        tmp_path: pytest fixture with a temporary directory.
+
+    Given: A csv with a year of "inf", a year of "1e20", a year just
+        below 2 ** 63, which is read as the float 2 ** 63, and a valid
+        row.
+    When: The csv is imported.
+    Then: The first three rows are written to the rejects file as too
+        large to be stored, and the valid row is still imported.
+    """
+    csv_file = tmp_path / "countries.csv"
+    database = tmp_path / "countries.db"
+    countries = pd.read_csv(tourism_arrivals_prepared_file).head(4)
+    countries["2019"] = countries["2019"].astype(object)
+    countries.loc[0, "2019"] = "inf"
+    countries.loc[1, "2019"] = "1e20"
+    countries.loc[2, "2019"] = "9223372036854775000"
+    countries.to_csv(csv_file, index=False)
+
+    report = csv_to_sqlite(csv_file, database)
+    assert report == {
+        "inserted": 1, "updated": 0, "unchanged": 0, "rejected": 3
+    }
+    rejected = pd.read_csv(tmp_path / "countries.rejected.csv")
+    assert rejected["Country Name"].tolist() == (
+        countries["Country Name"].head(3).tolist()
+    )
+    assert rejected["Error"].tolist() == [
+        "The value entered for year_2019 is too large to be stored",
+    ] * 3
+
+
+def test_csv_import_runs_as_module(tmp_path):
+    """
+    Test if the import runs from the command line as a module.
+
+    Args:
+        tmp_path: pytest fixture with a temporary directory.
+
+    Given: A csv with the first 3 rows of the prepared csv.
+    When: `python -m tourism_hotels_app.data.csv_to_sqlite` is run from
+        the project folder on the csv and a new database.
+    Then: It succeeds, reports 3 inserted countries and the database
+        has them.
+    """
+    csv_file = tmp_path / "countries.csv"
+    database = tmp_path / "countries.db"
+    pd.read_csv(tourism_arrivals_prepared_file).head(3).to_csv(
+        csv_file, index=False
+    )
+
+    result = subprocess.run(
+        [
+            sys.executable, "-m", "tourism_hotels_app.data.csv_to_sqlite",
+            str(csv_file), str(database),
+        ],
+        cwd=PROJECT_ROOT.parent,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.startswith("Inserted 3, updated 0")
+    connection = sqlite3.connect(database)
+    count = connection.execute(
+        "SELECT COUNT(*) FROM tourism_arrivals"
+    ).fetchone()[0]
+    connection.close()
+    assert count == 3
@@ -0,0 +1,79 @@
+"""This file tests the Prometheus metrics."""
+import threading
+from tourism_hotels_app.metrics import MetricsRegistry
+
+
+def test_metrics_route_reports_requests(test_client):
+    """
+    Test if /metrics reports the requests that were answered.
+
+    Args:
+        test_client: fixture containing test client instance of app.
+
+    Given: A Flask app with metrics enabled.
+    When: /api/countries is requested, then again with its ETag, and
+        /metrics is requested.
+    Then: The response is in Prometheus text format, counts both
+        responses by status and counts the ETag revalidation as a hit.
+    """
+    etag = test_client.get("/api/countries").headers["ETag"]
+    test_client.get("/api/countries", headers={"If-None-Match": etag})
+
+    response = test_client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["Content-Type"].startswith("text/plain")
+    samples = dict(
+        line.rsplit(" ", 1)
+        for line in response.get_data(as_text=True).splitlines()
+        if not line.startswith("#")
+    )
+    labels = 'blueprint="api_obtain_data",route="/api/countries",method="GET"'
+    assert int(samples[f"tourism_http_responses_total{{{labels},"
+                       f'status="200"}}']) >= 1
+    assert int(samples[f"tourism_http_responses_total{{{labels},"
+                       f'status="304"}}']) >= 1
+    hit_ratio = 'tourism_response_cache_hit_ratio{cache="etag:/api/countries"}'
+    assert float(samples[hit_ratio]) > 0
+
+
+def test_metrics_registry_adds_up_threads():
+    """
+    Test if values recorded on several threads are added up.
+
+    Given: A metrics registry.
+    When: Four threads each count 1000 responses and observe one
+        latency, and have finished.
+    Then: The totals are 4000 responses and four latencies, with the
+        histogram buckets counting every latency up to their bound.
+    """
+    registry = MetricsRegistry()
+    labels = (("route", "/api/top"),)
+
+    def record():
+        for _ in range(1000):
+            registry.inc("tourism_http_responses_total", labels)
+        registry.observe(
+            "tourism_http_request_duration_seconds", labels, 0.003
+        )
+
+    threads = [threading.Thread(target=record) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    totals = registry.collect()
+    assert totals[("tourism_http_responses_total", labels)] == 4000
+    text = registry.render()
+    assert (
+        'tourism_http_request_duration_seconds_bucket{route="/api/top",'
+        'le="0.0025"} 0' in text
+    )
+    assert (
+        'tourism_http_request_duration_seconds_bucket{route="/api/top",'
+        'le="0.005"} 4' in text
+    )
+    assert (
+        'tourism_http_request_duration_seconds_count{route="/api/top"} 4'
+        in text
+    )
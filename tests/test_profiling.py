@@ -0,0 +1,105 @@
+"""This file tests the opt-in profiling of requests."""
+import cProfile
+import pstats
+import shutil
+from tourism_hotels_app import create_app, config, db, profiling, PROJECT_ROOT
+
+
+def create_profiling_app(tmp_path):
+    """
+    Create an app with profiling enabled, on a copy of the database.
+
+    Args:
+        tmp_path: The temporary directory of the test.
+    Returns:
+        The Flask app, saving cProfile dumps to tmp_path / "profiles".
+    """
+    database = tmp_path / "tourism_hotels.db"
+    shutil.copy(PROJECT_ROOT / "data" / "tourism_hotels.db", database)
+    profiling_config = type(
+        "ProfilingConfig",
+        (config.TestConfig,),
+        {
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{database}",
+            "SQLALCHEMY_ECHO": False,
+            "PROFILING_ENABLED": True,
+            "PROFILING_DUMP_DIR": str(tmp_path / "profiles"),
+        },
+    )
+    return create_app(profiling_config)
+
+
+def dispose_engines(app):
+    """Close the pooled connections to the app's database copy."""
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+def test_profiled_request_has_server_timing(tmp_path):
+    """
+    Test if a request asking for profiling gets its timings.
+
+    Args:
+        tmp_path: pytest fixture with a temporary directory.
+
+    Given: An app with profiling enabled, on a copy of the database.
+    When: - A GET request is sent without the profiling header.
+          - The same request is sent with the header set to cprofile.
+    Then: - The first response has no Server-Timing header.
+          - The second has the SQL, serialize and total timings, and
+            names a cProfile dump that pstats can read.
+    """
+    app = create_profiling_app(tmp_path)
+    client = app.test_client()
+
+    response = client.get("/api/countries/country/Angola")
+    assert "Server-Timing" not in response.headers
+
+    response = client.get(
+        "/api/countries/country/Angola", headers={"X-Profile": "cprofile"}
+    )
+    assert response.status_code == 200
+    metrics = response.headers["Server-Timing"].split(", ")
+    assert metrics[0].startswith("sql;dur=")
+    assert [metric.split(";")[0] for metric in metrics[1:]] == [
+        "serialize", "app", "total"
+    ]
+    dump = tmp_path / "profiles" / response.headers["X-Profile-Dump"]
+    assert pstats.Stats(str(dump)).total_calls > 0
+    dispose_engines(app)
+
+
+class BusyProfile(cProfile.Profile):
+    """A profiler refused like one started while another one runs."""
+
+    def enable(self, *args, **kwargs):
+        """Refuse to start, as Python 3.12+ does for a second profiler."""
+        raise ValueError("Another profiling tool is already active")
+
+
+def test_cprofile_request_is_timed_when_profiler_is_busy(
+    tmp_path, monkeypatch
+):
+    """
+    Test if a cProfile request succeeds when cProfile cannot start.
+
+    Args:
+        tmp_path: pytest fixture with a temporary directory.
+        monkeypatch: pytest fixture to replace cProfile.Profile.
+
+    Given: An app with profiling enabled, whose profiler refuses to
+           start, as when another request is already under cProfile.
+    When: A GET request is sent with the header set to cprofile.
+    Then: It succeeds with its Server-Timing header, without a dump.
+    """
+    app = create_profiling_app(tmp_path)
+    monkeypatch.setattr(profiling.cProfile, "Profile", BusyProfile)
+
+    response = app.test_client().get(
+        "/api/countries/country/Angola", headers={"X-Profile": "cprofile"}
+    )
+    assert response.status_code == 200
+    assert "total;dur=" in response.headers["Server-Timing"]
+    assert "X-Profile-Dump" not in response.headers
+    dispose_engines(app)
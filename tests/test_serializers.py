@@ -0,0 +1,63 @@
+"""File that tests the fast read-only serializer."""
+import json
+from tourism_hotels_app import db
+from tourism_hotels_app.models import TourismArrivals
+from tourism_hotels_app.schemas import TourismArrivalsSchema
+from tourism_hotels_app.serializers import (
+    dumps_json,
+    get_serializer,
+)
+
+# Define Schemas
+countries_schema = TourismArrivalsSchema(many=True)
+
+
+def test_serializer_matches_marshmallow_schema(test_client):
+    """
+    Test if the fast serializer gives the same output as the schema.
+
+    Args:
+        test_client: fixture containing test client instance of app, to
+            allow the tests to interact with the Flask server.
+
+    Given: Every row of the tourism_arrivals table.
+    When: The rows are serialized with TourismArrivalsSchema and with
+          the RowSerializer (from Core rows and from model instances).
+    Then: All three give the same dictionaries, and the encoded JSON
+          decodes back to the same data.
+    """
+    serializer = get_serializer()
+    instances = db.session.execute(db.select(TourismArrivals)).scalars()
+    expected = countries_schema.dump(instances.all())
+
+    from_rows = serializer.dump_rows(db.session.execute(serializer.statement))
+    from_instances = [
+        serializer.dump_instance(instance)
+        for instance in db.session.execute(
+            db.select(TourismArrivals)
+        ).scalars()
+    ]
+
+    assert from_rows == expected
+    assert from_instances == expected
+    assert json.loads(dumps_json(from_rows)) == expected
+
+
+def test_get_serializer_reuses_serializer_for_same_columns():
+    """
+    Test if serializers for a set of columns are only built once.
+
+    Given: The get_serializer() factory.
+    When: It is called twice with the same columns and once with other
+          columns.
+    Then: The same object is returned for the same columns, and the
+          other serializer only outputs its own columns.
+    """
+    columns = ("Country_Name", "year_2001")
+    serializer = get_serializer(columns)
+    assert get_serializer(columns) is serializer
+    assert get_serializer(("Country_Name",)) is not serializer
+    assert serializer.dump_row(("Aruba", 1178000.0)) == {
+        "Country_Name": "Aruba",
+        "year_2001": 1178000,
+    }
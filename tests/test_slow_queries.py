@@ -0,0 +1,61 @@
+"""This file tests the slow query log."""
+import shutil
+from tourism_hotels_app import create_app, config, db, PROJECT_ROOT
+from tourism_hotels_app.slow_queries import is_full_scan
+
+
+def test_slow_query_log_has_route_and_query_plan(tmp_path):
+    """
+    Test if slow statements are logged with their route and plan.
+
+    Args:
+        tmp_path: pytest fixture with a temporary directory.
+
+    Given: An app logging every statement slower than 0 ms, on a copy
+        of the database.
+    When: A page of countries is requested.
+    Then: Its statements are logged with the route, and the lookup of
+        the page's years with a plan using the unique country index.
+    """
+    database = tmp_path / "tourism_hotels.db"
+    log_file = tmp_path / "slow_queries.log"
+    shutil.copy(PROJECT_ROOT / "data" / "tourism_hotels.db", database)
+    slow_query_config = type(
+        "SlowQueryConfig",
+        (config.TestConfig,),
+        {
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{database}",
+            "SQLALCHEMY_ECHO": False,
+            "SLOW_QUERY_THRESHOLD_MS": 0,
+            "SLOW_QUERY_LOG_FILE": str(log_file),
+        },
+    )
+    app = create_app(slow_query_config)
+    response = app.test_client().get("/api/countries?limit=5")
+    assert response.status_code == 200
+
+    log = log_file.read_text()
+    assert "on reader, GET /api/countries\n" in log
+    assert "parameters: (6, 0)" in log
+    assert "SEARCH tourism_arrivals USING INDEX idx_unique_country_name" in log
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+def test_full_scan_is_found_in_plan():
+    """
+    Test if a plan reading a whole table is told apart from an index.
+
+    Given: Query plans with and without an index.
+    When: is_full_scan() is called on them.
+    Then: Only the plan scanning the table without an index is a full
+        scan.
+    """
+    assert is_full_scan(["SCAN tourism_arrivals", "USE TEMP B-TREE"])
+    assert not is_full_scan(
+        ["SCAN tourism_arrivals USING INDEX idx_unique_country_name"]
+    )
+    assert not is_full_scan(
+        ["SEARCH tourism_arrivals USING INDEX idx_unique_country_name"]
+    )
@@ -0,0 +1,152 @@
+"""This file tests the in-memory snapshot of tourism_hotels_app."""
+import shutil
+import numpy as np
+from tourism_hotels_app import create_app, config, PROJECT_ROOT
+from tourism_hotels_app.snapshot import (
+    METADATA_COLUMNS,
+    NUMERIC_COLUMNS,
+    SNAPSHOT_EXTENSION,
+    SnapshotState,
+)
+
+
+def get_rows(state):
+    """Get every country's arrays of a state, keyed by country name."""
+    for row, name in enumerate(state.names):
+        assert state.index[name] == row
+        assert state.records[row]["Country_Name"] == name
+    return {
+        name: (
+            state.records[row],
+            state.year_matrix[row].tolist(),
+            [state.metadata[column][row] for column in METADATA_COLUMNS],
+            [state.numeric[column][row] for column in NUMERIC_COLUMNS],
+        )
+        for name, row in state.index.items()
+    }
+
+
+def test_patched_state_matches_a_state_built_from_its_records(app):
+    """
+    Test if patching a state gives the arrays of a full build.
+
+    Args:
+        app: fixture containing the app, whose snapshot is patched.
+
+    Given: The app's snapshot state.
+    When: One country is changed, one renamed, one removed and one
+        added with SnapshotState.patched().
+    Then: - Every country's record and arrays are those of a state
+            built from the same records.
+          - The renamed and the added country take the rows of the
+            countries they replace, no row is left empty.
+          - The state it was patched from is left as it was.
+    """
+    current = app.extensions[SNAPSHOT_EXTENSION]._state
+    before = get_rows(current)
+    changed, renamed, removed = (
+        record["Country_Name"] for record in current.records[:3]
+    )
+    fresh = {
+        changed: {**current.records[0], "year_2019": 1234, "Region": "X"},
+        "Renamed land": {
+            **current.records[1],
+            "Country_Name": "Renamed land",
+            "Country_Code": "RNL",
+        },
+        "New land": {
+            **current.records[2],
+            "Country_Name": "New land",
+            "Country_Code": "NWL",
+        },
+    }
+    versions = {name: 1 for name in fresh}
+
+    patched = current.patched(
+        {changed, renamed, removed, "Renamed land", "New land"},
+        fresh,
+        versions,
+    )
+    built = SnapshotState(
+        patched.records, current.years, patched.generation, {}
+    )
+    patched_rows = get_rows(patched)
+    assert patched_rows.keys() == get_rows(built).keys()
+    for name, (record, years, metadata, numeric) in get_rows(built).items():
+        assert patched_rows[name][0] == record
+        assert np.array_equal(patched_rows[name][1], years, equal_nan=True)
+        assert patched_rows[name][2] == metadata
+        assert np.array_equal(patched_rows[name][3], numeric, equal_nan=True)
+    assert patched.code_index == built.code_index
+    assert removed not in patched.index and renamed not in patched.index
+    assert patched.index["Renamed land"] == current.index[renamed]
+    assert patched.index["New land"] == current.index[removed]
+    assert len(patched.records) == len(current.records)
+    assert patched.versions["New land"] == 1
+    assert removed not in patched.versions
+
+    assert get_rows(current).keys() == before.keys()
+    assert current.records[0]["Country_Name"] == changed
+    assert np.array_equal(
+        current.year_matrix[0], before[changed][1], equal_nan=True
+    )
+
+
+def create_app_on_copy(database):
+    """
+    Create an app on its own copy of the database.
+
+    Args:
+        database: The path the database is copied to.
+    Returns:
+        The Flask app.
+    """
+    shutil.copy(PROJECT_ROOT / "data" / "tourism_hotels.db", database)
+    copy_config = type(
+        "CopyConfig",
+        (config.TestConfig,),
+        {
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{database}",
+            "SQLALCHEMY_ECHO": False,
+        },
+    )
+    return create_app(copy_config)
+
+
+def test_every_app_keeps_its_own_snapshot(tmp_path):
+    """
+    Test if two apps on two databases each serve their own data.
+
+    Args:
+        tmp_path: pytest fixture with a temporary directory.
+
+    Given: An app on a copy of the database.
+    When: - It patches India.
+          - A second app is created on another copy of the database.
+          - The first app patches India again with its current ETag.
+    Then: - Each app serves India from its own database.
+          - The first app accepts the patch with its own ETag.
+    """
+    first_client = create_app_on_copy(tmp_path / "first.db").test_client()
+    response = first_client.patch(
+        "/api/countries/India", json={"Region": "First Region"}
+    )
+    assert response.status_code == 200
+    etag = response.get_etag()[0]
+
+    second_client = create_app_on_copy(
+        tmp_path / "second.db"
+    ).test_client()
+    path = "/api/countries/country/India"
+    assert first_client.get(path).json["Region"] == "First Region"
+    assert second_client.get(path).json["Region"] == "South Asia"
+    assert first_client.get(path).get_etag()[0] == etag
+
+    response = first_client.patch(
+        "/api/countries/India",
+        json={"Region": "Second Region"},
+        headers={"If-Match": f'"{etag}"'},
+    )
+    assert response.status_code == 200
+    assert first_client.get(path).json["Region"] == "Second Region"
+    assert second_client.get(path).json["Region"] == "South Asia"
@@ -0,0 +1,105 @@
+"""This file tests the SQLite storage profiles and the engines."""
+import pytest
+from flask import Flask
+from sqlalchemy.exc import OperationalError
+from tourism_hotels_app import db
+from tourism_hotels_app.storage import (
+    add_reader_bind,
+    apply_storage_profile,
+    get_reader_engine,
+)
+
+
+@pytest.mark.parametrize(
+    "profile_name, expected_pragmas",
+    [
+        ("sqlite_default", {"journal_mode": "delete", "busy_timeout": 5000}),
+        (
+            "read_heavy",
+            {
+                "journal_mode": "wal",
+                "synchronous": 1,
+                "cache_size": -65536,
+                "busy_timeout": 5000,
+            },
+        ),
+        ("write_durable", {"journal_mode": "wal", "synchronous": 2}),
+    ],
+)
+def test_storage_profile_is_applied_to_connections(
+    tmp_path, profile_name, expected_pragmas
+):
+    """
+    Test if the configured storage profile sets up new connections.
+
+    Args:
+        tmp_path: pytest fixture with a temporary directory.
+        profile_name: parameter containing the name of a profile.
+        expected_pragmas: parameter containing PRAGMA values expected
+            on a connection, as SQLite reports them.
+
+    Given: A Flask app with an empty database and a storage profile.
+    When: The profile is applied and a connection is opened.
+    Then: The connection reports the profile's PRAGMA values.
+    """
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = (
+        f"sqlite:///{tmp_path / 'storage.db'}"
+    )
+    app.config["SQLITE_STORAGE_PROFILE"] = profile_name
+    add_reader_bind(app)
+    db.init_app(app)
+    with app.app_context():
+        apply_storage_profile(app)
+        with db.engine.connect() as connection:
+            for name, value in expected_pragmas.items():
+                pragma = connection.exec_driver_sql(f"PRAGMA {name}")
+                assert pragma.scalar() == value
+        db.engine.dispose()
+
+
+def test_unknown_storage_profile_is_rejected(tmp_path):
+    """
+    Test if an unknown storage profile stops the app from starting.
+
+    Args:
+        tmp_path: pytest fixture with a temporary directory.
+
+    Given: A Flask app configured with a profile that does not exist.
+    When: The profile is applied.
+    Then: A ValueError naming the profile is raised.
+    """
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = (
+        f"sqlite:///{tmp_path / 'storage.db'}"
+    )
+    app.config["SQLITE_STORAGE_PROFILE"] = "fastest"
+    add_reader_bind(app)
+    db.init_app(app)
+    with app.app_context():
+        with pytest.raises(ValueError, match="fastest"):
+            apply_storage_profile(app)
+
+
+def test_reader_engine_cannot_write(test_client):
+    """
+    Test if the read-only engine refuses writes but sees the data.
+
+    Args:
+        test_client: pytest fixture with the Flask test client.
+
+    Given: The app with its writer and read-only engines.
+    When: A read and an insert are run on the read-only engine.
+    Then: The read succeeds, query_only is on and the insert fails.
+    """
+    with get_reader_engine().connect() as connection:
+        count = connection.exec_driver_sql(
+            "SELECT COUNT(*) FROM tourism_arrivals"
+        ).scalar()
+        assert count > 0
+        pragma = connection.exec_driver_sql("PRAGMA query_only")
+        assert pragma.scalar() == 1
+        with pytest.raises(OperationalError):
+            connection.exec_driver_sql(
+                "CREATE TABLE reader_write_test (id INTEGER)"
+            )
@@ -32,6 +32,10 @@ def create_app(config_object):
     # See config parameters in config.py, using classes
     app.config.from_object(config_object)
 
+    # Add the read-only engine, used by the routes that only read
+    from tourism_hotels_app.storage import add_reader_bind
+    add_reader_bind(app)
+
     # Uses a helper function to initialise extensions
     initialize_extensions(app)
 
@@ -45,6 +49,10 @@ def create_app(config_object):
     app.register_blueprint(obtain_data_api_bp)
     app.register_blueprint(update_data_api_bp)
 
+    # Add the command line commands, e.g. check-derived-metrics
+    from tourism_hotels_app.commands import register_commands
+    register_commands(app)
+
     # Include the routes within app context
     with app.app_context():
         from tourism_hotels_app import (
@@ -54,6 +62,25 @@ def create_app(config_object):
         )
         # Instantiate TourismArrivals models marshamallow schemas
         from tourism_hotels_app.models import TourismArrivals
+        # Set up every connection of both engines with the configured
+        # storage profile
+        from tourism_hotels_app.storage import apply_storage_profile
+        apply_storage_profile(app)
+        # Time the requests that ask for it, if profiling is enabled
+        from tourism_hotels_app.profiling import init_profiling
+        init_profiling(app)
+        # Record request and database metrics, served at /metrics
+        from tourism_hotels_app.metrics import init_metrics
+        init_metrics(app)
+        # Log slow statements with their query plans, if configured
+        from tourism_hotels_app.slow_queries import init_slow_query_log
+        init_slow_query_log(app)
+        # Bring the database schema up to date before reading from it
+        from tourism_hotels_app.migrations import upgrade_database
+        upgrade_database()
+        # Build the in-memory snapshot used by the read endpoints
+        from tourism_hotels_app.snapshot import TourismSnapshot
+        TourismSnapshot().init_app(app)
 
     return app
 
@@ -0,0 +1,235 @@
+"""File containing the ASGI entry point of the app, next to create_app().
+
+The sync app served by a threaded WSGI server holds one thread per open
+connection, for as long as the connection is kept alive. Served by an
+ASGI server such as uvicorn, connections are held by the event loop
+instead, and a request only takes a thread of a bounded pool while its
+view runs. The views read from the in-memory snapshot (see snapshot.py)
+or the read-only engine, so that is usually well under a millisecond,
+and one process can keep thousands of connections open with
+ASGI_EXECUTOR_WORKERS threads.
+
+Every route is served, the obtain_data_api_bp routes as well as the
+update and html routes, by the same Flask app create_app() builds, so
+both modes give the same responses. Nothing here needs a package
+beyond Flask. Run it with any ASGI server, e.g.:
+    uvicorn --factory tourism_hotels_app.asgi:create_asgi_app
+"""
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from tourism_hotels_app import create_app, db
+
+
+def get_environ(scope, body):
+    """
+    Build the WSGI environ of an ASGI HTTP request.
+
+    Args:
+        scope (dict): The ASGI connection scope.
+        body (bytes): The whole request body.
+    Returns:
+        The WSGI environ dictionary.
+    """
+    server_name, server_port = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        # WSGI strings hold the raw bytes as latin-1
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server_name,
+        "SERVER_PORT": str(server_port),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"] = scope["client"][0]
+    for name, value in scope.get("headers", []):
+        key = name.decode("latin-1").upper().replace("-", "_")
+        if key not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            key = f"HTTP_{key}"
+        value = value.decode("latin-1")
+        # Repeated headers are joined, as a WSGI server would
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+class TourismASGIApp:
+    """
+    ASGI application serving the Flask app from a thread pool.
+
+    Attributes:
+        flask_app: The Flask app built by create_app().
+        executor (ThreadPoolExecutor): The threads running the views.
+    """
+
+    def __init__(self, flask_app, workers):
+        """
+        Wrap a Flask app.
+
+        Args:
+            flask_app: Flask app application instance
+            workers (int): How many requests may run their views at
+                once. Others wait on the event loop, not on a thread.
+        """
+        self.flask_app = flask_app
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="tourism-asgi"
+        )
+
+    async def __call__(self, scope, receive, send):
+        """
+        Handle one ASGI connection.
+
+        Args:
+            scope (dict): The ASGI connection scope.
+            receive: Awaitable giving the next event from the client.
+            send: Awaitable sending an event to the client.
+        Returns:
+            None
+        Raises:
+            ValueError: For a websocket, which the app does not serve.
+        """
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self.handle_http(scope, receive, send)
+        else:
+            raise ValueError(f"Unsupported ASGI scope {scope['type']!r}")
+
+    async def lifespan(self, receive, send):
+        """
+        Answer the server's startup and shutdown events.
+
+        The Flask app is built before the server starts, so startup has
+        nothing left to do. Shutdown waits for the running views, then
+        closes every pooled database connection.
+
+        Args:
+            receive: Awaitable giving the next lifespan event.
+            send: Awaitable answering it.
+        Returns:
+            None
+        """
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self.close
+                )
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def close(self):
+        """Stop the thread pool and close the database connections."""
+        self.executor.shutdown(wait=True)
+        with self.flask_app.app_context():
+            for engine in db.engines.values():
+                engine.dispose()
+
+    async def handle_http(self, scope, receive, send):
+        """
+        Read an HTTP request and run it through the Flask app.
+
+        Args:
+            scope (dict): The ASGI HTTP scope.
+            receive: Awaitable giving the request body events.
+            send: Awaitable sending the response events.
+        Returns:
+            None
+        """
+        body = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        environ = get_environ(scope, b"".join(body))
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            self.executor, self.run_wsgi, environ, send, loop
+        )
+
+    def run_wsgi(self, environ, send, loop):
+        """
+        Sub-helper function running a request on a pool thread.
+
+        The whole response, a streamed one too, is produced on the same
+        thread, as Flask's request context belongs to it, and each part
+        is handed to the event loop to send.
+
+        Args:
+            environ (dict): The WSGI environ of the request.
+            send: Awaitable sending a response event.
+            loop: The event loop the connection belongs to.
+        Returns:
+            None
+        """
+        def send_from_thread(message):
+            """Send an event from this thread, waiting until it is sent."""
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        response_start = {}
+
+        def start_response(status, headers, exc_info=None):
+            """Keep the status and headers until the first body part."""
+            response_start["message"] = {
+                "type": "http.response.start",
+                "status": int(status.split(" ", 1)[0]),
+                "headers": [
+                    (name.lower().encode("latin-1"), value.encode("latin-1"))
+                    for name, value in headers
+                ],
+            }
+            return lambda data: send_body(data, more_body=True)
+
+        def send_body(data, more_body):
+            """Send a part of the body, after the status and headers."""
+            if "message" in response_start:
+                send_from_thread(response_start.pop("message"))
+            if data or not more_body:
+                send_from_thread({
+                    "type": "http.response.body",
+                    "body": data,
+                    "more_body": more_body,
+                })
+
+        app_iter = self.flask_app.wsgi_app(environ, start_response)
+        try:
+            for data in app_iter:
+                send_body(data, more_body=True)
+            send_body(b"", more_body=False)
+        finally:
+            # Closing the iterable ends the request context and runs
+            # the teardown functions, e.g. removing the session
+            if hasattr(app_iter, "close"):
+                app_iter.close()
+
+
+def create_asgi_app(config_object="tourism_hotels_app.config.Config"):
+    """
+    Create the ASGI application, with the Flask app of create_app().
+
+    Args:
+        config_object: Config classes from config.py, or the import
+            path of one, so ASGI servers can call it with no arguments.
+
+    Returns:
+        The TourismASGIApp.
+    """
+    flask_app = create_app(config_object)
+    return TourismASGIApp(
+        flask_app, flask_app.config["ASGI_EXECUTOR_WORKERS"]
+    )
@@ -0,0 +1,331 @@
+"""File containing the bulk ingest of countries from a request body.
+
+The body is read as a stream, one country at a time, either as NDJSON
+(one JSON object per line) or as a JSON array, so the whole body is
+never held in memory. Countries are validated and inserted in chunks,
+each chunk in its own transaction with one executemany INSERT, and a
+report lists every country that failed, so one bad country does not
+stop the others from being added.
+"""
+import codecs
+import json
+import numpy as np
+from sqlalchemy.exc import SQLAlchemyError
+from tourism_hotels_app import db
+from tourism_hotels_app.models import ROW_VERSION_KEY, TourismArrivals
+from tourism_hotels_app.derived_metrics import compute_metrics
+from tourism_hotels_app.storage import hold_write_lock
+from tourism_hotels_app.observations import (
+    CHANGED_COUNTRIES_OPTION,
+    get_legacy_years,
+    upsert_observations,
+)
+from tourism_hotels_app.validation import country_validator
+
+# Bytes read from the request stream at a time
+READ_SIZE = 64 * 1024
+
+# Maps model attribute names to the table column keys used by INSERT,
+# the row version is left to its column default
+_COLUMN_KEYS = {
+    key: attr.columns[0].key
+    for key, attr in TourismArrivals.__mapper__.column_attrs.items()
+    if key != ROW_VERSION_KEY
+}
+
+
+def iter_ndjson(stream, read_size=READ_SIZE):
+    """
+    Read countries from a stream of NDJSON, one per line.
+
+    The body is read in blocks and split into lines here, as iterating
+    over the request stream itself reads it one byte at a time.
+    Blank lines are skipped. A line that is not valid JSON is reported
+    on its own and reading carries on with the next line.
+
+    Args:
+        stream: A binary file-like object, e.g. request.stream.
+        read_size (int): How many bytes to read at a time.
+    Yields:
+        (data, error) tuples, data the decoded JSON value or None, and
+        error a message if the line could not be decoded, else None.
+    """
+    pending = b""
+    while True:
+        chunk = stream.read(read_size)
+        lines = (pending + chunk).split(b"\n")
+        # The last line may continue in the next block
+        pending = lines.pop() if chunk else b""
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line), None
+            except ValueError as decode_error:
+                yield None, f"Invalid JSON: {decode_error}"
+        if not chunk:
+            return
+
+
+def iter_json_array(stream, read_size=READ_SIZE):
+    """
+    Read countries from a stream holding one JSON array.
+
+    Each element is decoded with JSONDecoder.raw_decode() as soon as
+    it has been read, and only the unread part of the body is kept.
+
+    Args:
+        stream: A binary file-like object, e.g. request.stream.
+        read_size (int): How many bytes to read at a time.
+    Yields:
+        (data, None) tuples, data the decoded element.
+    Raises:
+        ValueError: If the body is not a valid JSON array, or anything
+            but whitespace follows it. Elements before the error have
+            already been yielded.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer, position, at_end = "", 0, False
+    # What may come next: "[", a "value" or "]", a "value", "," or "]",
+    # or the "end" of the body
+    expected = "["
+
+    while True:
+        # Skip whitespace, reading more of the body when it runs out
+        while position < len(buffer) and buffer[position].isspace():
+            position += 1
+        if position == len(buffer):
+            if at_end and expected == "end":
+                return
+            if at_end:
+                raise ValueError("Invalid JSON: the array is not closed")
+            chunk = stream.read(read_size)
+            at_end = not chunk
+            buffer = buffer[position:] + text_decoder.decode(
+                chunk, final=at_end
+            )
+            position = 0
+            continue
+
+        character = buffer[position]
+        if expected == "[":
+            if character != "[":
+                raise ValueError("Invalid JSON: expected an array")
+            position += 1
+            expected = "value or ]"
+        elif expected == "end":
+            raise ValueError("Invalid JSON: content after the array")
+        elif character == "]" and expected in ("value or ]", ", or ]"):
+            position += 1
+            expected = "end"
+        elif expected == ", or ]":
+            if character != ",":
+                raise ValueError("Invalid JSON: expected ',' or ']'")
+            position += 1
+            expected = "value"
+        else:
+            try:
+                data, end = decoder.raw_decode(buffer, position)
+            except ValueError as decode_error:
+                # The element may just not have been read completely
+                if at_end:
+                    raise ValueError(f"Invalid JSON: {decode_error}")
+                chunk = stream.read(read_size)
+                at_end = not chunk
+                buffer = buffer[position:] + text_decoder.decode(
+                    chunk, final=at_end
+                )
+                position = 0
+                continue
+            position = end
+            expected = ", or ]"
+            yield data, None
+
+
+def ingest_countries(records, chunk_size):
+    """
+    Validate and insert countries, chunk by chunk.
+
+    Args:
+        records: Iterable of (data, error) tuples from iter_ndjson() or
+            iter_json_array().
+        chunk_size (int): How many countries to insert per transaction.
+    Returns:
+        report: A dictionary with the number of countries `received`,
+        `inserted` and `failed`, and `errors`, a list of
+        {"index", "Country_Name", "error"} dictionaries where index is
+        the position of the country in the body, in body order.
+    """
+    report = {"received": 0, "inserted": 0, "failed": 0, "errors": []}
+    chunk = []
+    try:
+        for index, (data, error) in enumerate(records):
+            report["received"] += 1
+            if error is not None:
+                add_error(report, index, data, error)
+                continue
+            chunk.append((index, data))
+            if len(chunk) == chunk_size:
+                insert_chunk(chunk, report)
+                chunk = []
+    # A JSON array that cannot be read any further ends the ingest,
+    # the countries read before the error are still inserted
+    except ValueError as stream_error:
+        add_error(report, report["received"], None, str(stream_error))
+    if chunk:
+        insert_chunk(chunk, report)
+    # Errors of the stream are added as they are read, and those of a
+    # chunk once it is inserted, so put them back in body order
+    report["errors"].sort(key=lambda error: error["index"])
+    return report
+
+
+def insert_chunk(chunk, report):
+    """
+    Sub-helper function.
+
+    Validates one chunk of countries and inserts the valid ones in a
+    single transaction, with their derived metrics computed in one
+    vectorized pass.
+
+    Args:
+        chunk: List of (index, data) tuples.
+        report (dict): The report of ingest_countries(), updated here.
+    Returns:
+        None
+    """
+    valid = []
+    for index, data in chunk:
+        try:
+            column_data, new_years = country_validator.validate_new(data)
+        except (AttributeError, ValueError) as validation_error:
+            add_error(report, index, data, str(validation_error))
+            continue
+        valid.append((index, column_data, new_years))
+    # Only this chunk's write holds the lock, so other writers can run
+    # while the next chunk of the body is read
+    with hold_write_lock():
+        store_chunk(valid, report)
+
+
+def store_chunk(valid, report):
+    """
+    Sub-helper function.
+
+    Inserts the validated countries of a chunk in a single transaction,
+    leaving out names already in the database or earlier in the body.
+    Must be called with the write lock held.
+
+    Args:
+        valid: List of (index, column data, new years) tuples.
+        report (dict): The report of ingest_countries(), updated here.
+    Returns:
+        None
+    """
+    # Leave out names already in the database or earlier in the body,
+    # checked with one query so the INSERT cannot fail on them
+    names = [column_data["Country_Name"] for _, column_data, _ in valid]
+    existing = set(db.session.execute(
+        db.select(TourismArrivals.Country_Name).where(
+            TourismArrivals.Country_Name.in_(names)
+        )
+    ).scalars())
+    countries = []
+    for index, column_data, new_years in valid:
+        if column_data["Country_Name"] in existing:
+            add_error(
+                report, index, column_data,
+                "Country name already exists in the database!",
+            )
+            continue
+        existing.add(column_data["Country_Name"])
+        countries.append((index, column_data, new_years))
+    if not countries:
+        return
+
+    # Derived metrics for the whole chunk in one NumPy pass
+    years = sorted(set(get_legacy_years()).union(
+        *(new_years for _, _, new_years in countries)
+    ))
+    year_matrix = np.array(
+        [
+            [
+                np.nan if value is None else value
+                for value in (
+                    new_years.get(year, column_data.get(f"year_{year}"))
+                    for year in years
+                )
+            ]
+            for _, column_data, new_years in countries
+        ],
+        dtype=np.float64,
+    ).reshape(len(countries), len(years))
+    metrics = compute_metrics(year_matrix, years)
+
+    rows = [
+        {
+            column_key: {**column_data, **derived}.get(key)
+            for key, column_key in _COLUMN_KEYS.items()
+        }
+        for (_, column_data, _), derived in zip(countries, metrics)
+    ]
+    observations = [
+        (
+            column_data["Country_Name"],
+            column_data["Indicator_Name"],
+            year,
+            value,
+        )
+        for _, column_data, new_years in countries
+        for year, value in new_years.items()
+        if value is not None
+    ]
+    inserted_names = [
+        column_data["Country_Name"] for _, column_data, _ in countries
+    ]
+    try:
+        # The snapshot only reloads the countries named here
+        db.session.execute(
+            db.insert(TourismArrivals.__table__),
+            rows,
+            execution_options={CHANGED_COUNTRIES_OPTION: inserted_names},
+        )
+        upsert_observations(db.session, observations)
+        db.session.commit()
+    except SQLAlchemyError as database_error:
+        db.session.rollback()
+        # Report the driver's message, without the SQL statement
+        reason = getattr(database_error, "orig", None) or database_error
+        for index, column_data, _ in countries:
+            add_error(
+                report, index, column_data, f"Could not be stored: {reason}"
+            )
+        return
+    report["inserted"] += len(countries)
+
+
+def add_error(report, index, data, message):
+    """
+    Sub-helper function.
+
+    Adds a failed country to the ingest report.
+
+    Args:
+        report (dict): The report of ingest_countries().
+        index (int): The position of the country in the body.
+        data: The country's data, if it could be decoded.
+        message (str): Why the country was not inserted.
+    Returns:
+        None
+    """
+    report["failed"] += 1
+    report["errors"].append(
+        {
+            "index": index,
+            "Country_Name": data.get("Country_Name")
+            if isinstance(data, dict) else None,
+            "error": message,
+        }
+    )
@@ -0,0 +1,277 @@
+"""File containing the bulk PATCH of many countries in one transaction.
+
+The body is a JSON array with one merge patch per country, e.g.:
+
+    [
+        {"Country_Name": "India", "patch": {"year_2020": 6000000}},
+        {"Country_Name": "Aruba", "patch": {"Region": "Caribbean"},
+         "etag": "v3"}
+    ]
+
+Each patch holds the same changes a PATCH /api/countries/<country_name>
+body would, and the optional etag makes it conditional, as If-Match
+does there. Every patch is checked against the snapshot before anything
+is written, and if any of them fails, none is applied. The changes are
+then written in one transaction, with one executemany UPDATE per set of
+changed columns, one upsert of the years without a model column and one
+DELETE of those set to null.
+"""
+import numpy as np
+from sqlalchemy import bindparam
+from sqlalchemy.orm.exc import StaleDataError
+from tourism_hotels_app import db
+from tourism_hotels_app.models import ROW_VERSION_KEY, TourismArrivals
+from tourism_hotels_app.snapshot import snapshot
+from tourism_hotels_app.bulk_ingest import add_error
+from tourism_hotels_app.derived_metrics import compute_metrics
+from tourism_hotels_app.observations import (
+    CHANGED_COUNTRIES_OPTION,
+    delete_observations,
+    upsert_observations,
+)
+from tourism_hotels_app.utilities import get_country_etag
+from tourism_hotels_app.validation import country_validator
+
+
+def patch_countries(patches):
+    """
+    Check and apply the patches of many countries, all or none.
+
+    If a row does not have the version it was checked against, the
+    database has a change this process has not seen, e.g. from another
+    process, so the countries are reloaded into the snapshot and the
+    patches are checked and written once more.
+
+    Args:
+        patches: The decoded JSON body, a list of patches.
+    Returns:
+        report: A dictionary with the number of patches `received`,
+        countries `updated` and patches `failed`, `errors`, a list of
+        {"index", "Country_Name", "error"} dictionaries where index is
+        the position of the patch in the body, and `etags`, the new
+        ETag of each country.
+    Raises:
+        ValueError: If the body is not a JSON array.
+        StaleDataError: If a patch's etag is not the country's current
+            ETag, or the rows kept changing while being updated.
+        IntegrityError: If a country is renamed to a name in use.
+    """
+    if not isinstance(patches, list):
+        raise ValueError("The body must be a JSON array of patches")
+    for attempt in range(2):
+        report = {
+            "received": len(patches),
+            "updated": 0,
+            "failed": 0,
+            "errors": [],
+            "etags": {},
+        }
+        checked = check_patches(patches, report)
+        if report["failed"]:
+            return report
+        if write_patches(checked):
+            break
+        # Load the changes this process missed, then check again
+        db.session.rollback()
+        snapshot.refresh_rows(
+            [country_name for country_name, *_ in checked]
+        )
+    else:
+        raise StaleDataError("The countries changed while being updated")
+
+    # The commit also patches the read snapshot (see snapshot.py)
+    db.session.commit()
+    for country_name, _, column_values, *_ in checked:
+        updated_name = column_values.get("Country_Name", country_name)
+        _, row_version = snapshot.versioned_country(updated_name)
+        report["etags"][updated_name] = get_country_etag(row_version)
+    report["updated"] = len(checked)
+    return report
+
+
+def check_patches(patches, report):
+    """
+    Sub-helper function.
+
+    Checks every patch against the country's record in the snapshot,
+    and computes the derived metrics of the countries whose years
+    change, in one vectorized pass.
+
+    Args:
+        patches (list): The patches of the request body.
+        report (dict): The report of patch_countries(), any patch that
+            fails is added to it.
+    Returns:
+        A list of (country name, row version, column values, new years,
+        indicator name) tuples, one per patch.
+    Raises:
+        StaleDataError: If a patch's etag is not the country's current
+            ETag, and every patch is otherwise valid.
+    """
+    checked = []
+    year_changes = []
+    stale = []
+    seen = set()
+    for index, item in enumerate(patches):
+        if not (
+            isinstance(item, dict)
+            and isinstance(item.get("Country_Name"), str)
+            and isinstance(item.get("patch"), dict)
+        ):
+            add_error(
+                report, index, item,
+                'Each patch must be a JSON object with "Country_Name" '
+                'and a "patch" object',
+            )
+            continue
+        country_name = item.get("Country_Name")
+        if country_name in seen:
+            add_error(report, index, item, "Country is patched twice")
+            continue
+        seen.add(country_name)
+        current_record, row_version = snapshot.versioned_country(
+            country_name
+        )
+        if current_record is None:
+            add_error(report, index, item, "That country does not exist")
+            continue
+        try:
+            column_values, new_years, values_by_year = (
+                country_validator.validate_patch(
+                    item["patch"], current_record
+                )
+            )
+        except (AttributeError, ValueError) as validation_error:
+            add_error(report, index, item, str(validation_error))
+            continue
+        # The etag may be sent with or without its quotes
+        etag = item.get("etag")
+        if etag is not None and str(etag).strip('"') != get_country_etag(
+            row_version
+        ):
+            stale.append(country_name)
+        if values_by_year is not None:
+            year_changes.append((column_values, values_by_year))
+        checked.append((
+            country_name,
+            row_version,
+            column_values,
+            new_years,
+            column_values.get(
+                "Indicator_Name", current_record["Indicator_Name"]
+            ),
+        ))
+    if report["failed"]:
+        return checked
+    if stale:
+        raise StaleDataError(f"Outdated etag for: {', '.join(stale)}")
+
+    # Derived metrics of every country whose years change, in one pass
+    if year_changes:
+        years = sorted(set().union(
+            *(values_by_year for _, values_by_year in year_changes)
+        ))
+        year_matrix = np.array(
+            [
+                [
+                    np.nan if values_by_year.get(year) is None
+                    else values_by_year[year]
+                    for year in years
+                ]
+                for _, values_by_year in year_changes
+            ],
+            dtype=np.float64,
+        ).reshape(len(year_changes), len(years))
+        for (column_values, _), derived in zip(
+            year_changes, compute_metrics(year_matrix, years)
+        ):
+            column_values.update(derived)
+    return checked
+
+
+def write_patches(checked):
+    """
+    Sub-helper function.
+
+    Writes the checked patches in the session's transaction, without
+    committing. Countries are grouped by the columns they change, so
+    each group is one executemany UPDATE, which only matches a row that
+    still has the version it was checked against, and increases it.
+
+    Args:
+        checked (list): The tuples of check_patches().
+    Returns:
+        True if every row was matched, False if any had changed.
+    """
+    table = TourismArrivals.__table__
+    column_attrs = TourismArrivals.__mapper__.column_attrs
+    version_column = column_attrs[ROW_VERSION_KEY].columns[0]
+
+    groups = {}
+    upserts = []
+    deletes = []
+    for country_name, row_version, column_values, new_years, indicator in (
+        checked
+    ):
+        # A patch with no changes leaves the row as it is
+        if not column_values and not new_years:
+            continue
+        groups.setdefault(tuple(sorted(column_values)), []).append(
+            (country_name, row_version, column_values)
+        )
+        updated_name = column_values.get("Country_Name", country_name)
+        for year, value in new_years.items():
+            if value is None:
+                deletes.append((updated_name, indicator, year))
+            else:
+                upserts.append((updated_name, indicator, year, value))
+
+    matched = 0
+    expected = 0
+    for keys, rows in groups.items():
+        # Bound names are prefixed, as those named after a column are
+        # reserved by SQLAlchemy for the SET clause
+        statement = (
+            db.update(table)
+            .where(
+                table.c["Country Name"] == bindparam("old_name"),
+                version_column == bindparam("old_version"),
+            )
+            .values({
+                column_attrs[key].columns[0]: bindparam(f"new_{key}")
+                for key in keys
+            })
+            .values({version_column: version_column + 1})
+        )
+        result = db.session.execute(
+            statement,
+            [
+                {
+                    "old_name": country_name,
+                    "old_version": row_version,
+                    **{
+                        f"new_{key}": value
+                        for key, value in column_values.items()
+                    },
+                }
+                for country_name, row_version, column_values in rows
+            ],
+            # The snapshot reloads just these countries at commit
+            execution_options={
+                CHANGED_COUNTRIES_OPTION: {
+                    name
+                    for country_name, _, column_values in rows
+                    for name in (
+                        country_name,
+                        column_values.get("Country_Name", country_name),
+                    )
+                }
+            },
+        )
+        matched += result.rowcount
+        expected += len(rows)
+    if matched != expected:
+        return False
+    upsert_observations(db.session, upserts)
+    delete_observations(db.session, deletes)
+    return True
@@ -0,0 +1,78 @@
+"""File containing the flask command line commands of the app.
+
+Run them like the app itself (see README.md), with the command name in
+place of `run`, e.g. `flask --app "..." check-derived-metrics`.
+"""
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import bindparam
+from tourism_hotels_app import db
+from tourism_hotels_app.models import TourismArrivals
+from tourism_hotels_app.derived_metrics import check_derived_metrics
+from tourism_hotels_app.observations import CHANGED_COUNTRIES_OPTION
+
+
+@click.command("check-derived-metrics")
+@click.option(
+    "--fix",
+    is_flag=True,
+    help="Overwrite mismatching metrics with the computed values.",
+)
+@with_appcontext
+def check_derived_metrics_command(fix):
+    """
+    Check the derived metrics of every country against its years.
+
+    Prints one line per mismatch and exits with status 1 if any are
+    found, unless --fix is given, which stores the computed values.
+    """
+    mismatches = check_derived_metrics(db.session)
+    for country_name, key, stored, expected in mismatches:
+        click.echo(f"{country_name}: {key} is {stored!r}, expected "
+                   f"{expected!r}")
+
+    if not mismatches:
+        click.echo("All derived metrics are consistent.")
+        return
+    if not fix:
+        raise click.exceptions.Exit(1)
+
+    # Group the fixes per country, then update them in one executemany,
+    # naming the countries so the snapshot only patches those rows
+    fixes = {}
+    for country_name, key, stored, expected in mismatches:
+        fixes.setdefault(country_name, {})[key] = expected
+    table = TourismArrivals.__table__
+    for keys in {tuple(sorted(values)) for values in fixes.values()}:
+        rows = [
+            {"country_name": country_name, **values}
+            for country_name, values in fixes.items()
+            if tuple(sorted(values)) == keys
+        ]
+        db.session.execute(
+            db.update(table)
+            .where(table.c["Country Name"] == bindparam("country_name"))
+            .values({
+                TourismArrivals.__mapper__.column_attrs[key].columns[0]:
+                bindparam(key)
+                for key in keys
+            }),
+            rows,
+            execution_options={
+                CHANGED_COUNTRIES_OPTION: [row["country_name"] for row in rows]
+            },
+        )
+    db.session.commit()
+    click.echo(f"Fixed {len(mismatches)} metrics of {len(fixes)} countries.")
+
+
+def register_commands(app):
+    """
+    Add the command line commands to the app.
+
+    Args:
+        app: Flask app application instance
+    Returns:
+        None
+    """
+    app.cli.add_command(check_derived_metrics_command)
@@ -4,6 +4,31 @@ from pathlib import Path
 # Sets the project root folder
 PROJECT_ROOT = Path(__file__).parent
 
+# Named SQLite storage profiles, each a dictionary of PRAGMAs applied
+# to every new database connection (see storage.py).
+# - sqlite_default: leaves SQLite's own settings (rollback journal)
+# - read_heavy: WAL so readers never wait for a writer, a 256 MiB
+#   memory map and 64 MiB page cache, syncing only at checkpoints
+# - write_durable: WAL, but syncing every commit to disk
+SQLITE_STORAGE_PROFILES = {
+    "sqlite_default": {},
+    "read_heavy": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 256 * 1024 * 1024,
+        # Negative sizes are in KiB rather than pages
+        "cache_size": -64 * 1024,
+        "busy_timeout": 5000,
+    },
+    "write_durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "mmap_size": 0,
+        "cache_size": -8 * 1024,
+        "busy_timeout": 10000,
+    },
+}
+
 
 class Config:
     """
@@ -22,6 +47,40 @@ class Config:
         SQLALCHEMY_ECHO (bool): Whether or not to show SQL statements for
             easier debugging.
         JSON_SORT_KEYS (bool): Whether or not to sort JSON keys.
+        API_PAGE_DEFAULT_LIMIT (int): Page size used by /api/countries
+            when only a cursor is given.
+        API_PAGE_MAX_LIMIT (int): Largest page size a client may ask
+            for from /api/countries.
+        API_SEARCH_DEFAULT_LIMIT (int): How many countries
+            /api/countries/search returns when no limit is given.
+        BULK_INGEST_CHUNK_SIZE (int): How many countries
+            /api/countries/bulk inserts per transaction.
+        EXPORT_CHUNK_SIZE (int): How many countries
+            /api/countries/export fetches from the database at a time.
+        SQLITE_STORAGE_PROFILE (str): The name of the profile in
+            SQLITE_STORAGE_PROFILES applied to every connection.
+        SQLALCHEMY_BINDS (dict): Extra engines. The "reader" bind, the
+            read-only engine of the GET routes, is added by create_app()
+            from SQLALCHEMY_DATABASE_URI unless it is set here.
+        PROFILING_ENABLED (bool): Whether requests may ask for a
+            Server-Timing header with PROFILING_HEADER (see
+            profiling.py).
+        PROFILING_HEADER (str): The request header asking for profiling,
+            with the value "cprofile" to also save a cProfile dump.
+        PROFILING_DUMP_DIR (str): Where cProfile dumps are saved, by
+            default the profiles folder of the instance path.
+        METRICS_ENABLED (bool): Whether to record request and database
+            metrics and serve them at /metrics (see metrics.py).
+        SLOW_QUERY_THRESHOLD_MS (float): Statements slower than this
+            are logged with their query plan (see slow_queries.py), or
+            None to log none.
+        SLOW_QUERY_LOG_FILE (str): The slow query log, by default
+            slow_queries.log in the instance path.
+        SLOW_QUERY_LOG_MAX_BYTES (int): The size the log is rotated at.
+        SLOW_QUERY_LOG_BACKUP_COUNT (int): How many rotated logs are
+            kept.
+        ASGI_EXECUTOR_WORKERS (int): How many requests the ASGI entry
+            point runs at once (see asgi.py).
     """
 
     # Define unique secret key and define URI path
@@ -33,6 +92,31 @@ class Config:
     SQLALCHEMY_ECHO = False
     # Disable autosort for json keys to keep desired order
     JSON_SORT_KEYS = False
+    # Keyset pagination page sizes for /api/countries
+    API_PAGE_DEFAULT_LIMIT = 50
+    API_PAGE_MAX_LIMIT = 1000
+    # Results of /api/countries/search, at most search.MAX_RESULTS
+    API_SEARCH_DEFAULT_LIMIT = 10
+    # Countries per executemany INSERT and commit for /api/countries/bulk
+    BULK_INGEST_CHUNK_SIZE = 500
+    # Countries fetched per chunk, each in its own short transaction,
+    # by /api/countries/export
+    EXPORT_CHUNK_SIZE = 1000
+    # Keep SQLite's own settings unless a config chooses a profile
+    SQLITE_STORAGE_PROFILE = "sqlite_default"
+    # Request profiling is off unless a config turns it on
+    PROFILING_ENABLED = False
+    PROFILING_HEADER = "X-Profile"
+    PROFILING_DUMP_DIR = None
+    # Prometheus metrics at /metrics
+    METRICS_ENABLED = True
+    # No slow query log unless a config sets a threshold
+    SLOW_QUERY_THRESHOLD_MS = None
+    SLOW_QUERY_LOG_FILE = None
+    SLOW_QUERY_LOG_MAX_BYTES = 1024 * 1024
+    SLOW_QUERY_LOG_BACKUP_COUNT = 5
+    # Threads running the views when served by an ASGI server
+    ASGI_EXECUTOR_WORKERS = 32
 
 
 class ProdConfig(Config):
@@ -49,12 +133,20 @@ class ProdConfig(Config):
         SQLALCHEMY_TRACK_MODIFICATIONS (bool): Whether or not to track
             modifications to database models.
         JSON_SORT_KEYS (bool): Whether or not to sort JSON keys.
+        SQLITE_STORAGE_PROFILE (str): read_heavy, so readers are not
+            blocked while a PATCH or POST is being written.
+        SLOW_QUERY_THRESHOLD_MS (float): Statements slower than 100 ms
+            are logged.
     """
 
     # Disable testing, debugging and tracking
     TESTING = False
     DEBUG = False
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # WAL journal and a larger cache for a read-mostly API
+    SQLITE_STORAGE_PROFILE = "read_heavy"
+    # Log any statement slow enough to notice in a response
+    SLOW_QUERY_THRESHOLD_MS = 100
 
     JSON_SORT_KEYS = False
     pass
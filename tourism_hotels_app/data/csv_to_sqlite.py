@@ -1,66 +1,277 @@
-"""For creating the database from csv."""
+"""For creating the database from csv, or refreshing it from a newer csv.
+
+Run it as a module from the project folder, so it can import the
+validation rules of tourism_hotels_app:
+
+    python -m tourism_hotels_app.data.csv_to_sqlite [csv_file] [database]
+
+By default the prepared csv is imported into tourism_hotels.db.
+"""
+import argparse
 from pathlib import Path
+import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine, types
+from sqlalchemy import (
+    Column,
+    MetaData,
+    Table,
+    create_engine,
+    select,
+    text,
+    types,
+)
+from sqlalchemy.dialects.sqlite import insert
+from tourism_hotels_app.derived_metrics import (
+    AVERAGE_KEY,
+    DERIVED_KEYS,
+    compute_metrics,
+)
+from tourism_hotels_app.observations import get_legacy_years
+from tourism_hotels_app.validation import COLUMN_RULES, validate_frame
 
 
 # Define the database file name and location
 db_tourism_hotels_file = Path(__file__).parent.joinpath("tourism_hotels.db")
 
-# Create a connection to file as a SQLite database
-# (automatically creates file if it doesn't exist)
-engine = create_engine("sqlite:///" + str(db_tourism_hotels_file), echo=False)
-
-# Read the tourism_arrivals_prepared data to a pandas dataframe
+# Define the prepared csv file name and location
 tourism_arrivals_prepared_file = Path(__file__).parent.joinpath(
     "Tourism_arrivals_prepared.csv"
 )
-tourism_arrivals_prepared = pd.read_csv(tourism_arrivals_prepared_file)
 
-# Write the data to tables in a sqlite database
+# Write the data to tables in a sqlite database. The column types are
+# worked out from the same rules as the API's validation, the values
+# themselves are coerced to the model's types by validate_frame()
+# before they are written. Integer columns are stored as FLOAT, as in
+# the existing database, and so is the 10-year average, a Text column
+# in the model but computed as a number from the years
 dtype_tourism = {
-    "Country Name": types.TEXT(),
-    "Region": types.TEXT(),
-    "IncomeGroup": types.TEXT(),
-    "Country Code": types.TEXT(),
-    "Indicator Name": types.TEXT(),
-    "1995": types.FLOAT(),
-    "1996": types.FLOAT(),
-    "1997": types.FLOAT(),
-    "1998": types.FLOAT(),
-    "1999": types.FLOAT(),
-    "2000": types.FLOAT(),
-    "2001": types.FLOAT(),
-    "2002": types.FLOAT(),
-    "2003": types.FLOAT(),
-    "2004": types.FLOAT(),
-    "2005": types.FLOAT(),
-    "2006": types.FLOAT(),
-    "2007": types.FLOAT(),
-    "2008": types.FLOAT(),
-    "2009": types.FLOAT(),
-    "2010": types.FLOAT(),
-    "2011": types.FLOAT(),
-    "2012": types.FLOAT(),
-    "2013": types.FLOAT(),
-    "2014": types.FLOAT(),
-    "2015": types.FLOAT(),
-    "2016": types.FLOAT(),
-    "2017": types.FLOAT(),
-    "2018": types.FLOAT(),
-    "2019": types.FLOAT(),
-    "2020": types.FLOAT(),
-    "10-year Average in tourist arrivals": types.FLOAT(),
-    "Max number of arrivals": types.FLOAT(),
-    "Minimum number of arrivals": types.FLOAT(),
-    "Percent drop 2019 to 2020": types.TEXT(),
+    rule.column_name: (
+        types.TEXT()
+        if rule.python_type is str and rule.key != AVERAGE_KEY
+        else types.FLOAT()
+    )
+    for rule in COLUMN_RULES
 }
 
-# Create SQL database from prepared csv file
-tourism_arrivals_prepared.to_sql(
+
+# Build the table from the same column types, to create it if needed
+tourism_arrivals_table = Table(
     "tourism_arrivals",
-    engine,
-    if_exists="append",
-    index=False,
-    dtype=dtype_tourism,
+    MetaData(),
+    *(
+        Column(name, column_type)
+        for name, column_type in dtype_tourism.items()
+    ),
 )
+
+# The text columns, every other column is read as a float
+text_columns = [
+    name for name, column_type in dtype_tourism.items()
+    if isinstance(column_type, types.TEXT)
+]
+
+# Most names compared with one IN query
+lookup_batch_size = 10_000
+
+
+def get_row_hashes(frame):
+    """
+    Hash the content of every row of a dataframe.
+
+    Text nulls are made None and numbers float64 first, so a row read
+    from the csv and the same row read back from the database hash the
+    same.
+
+    Args:
+        frame (pd.DataFrame): Rows with the columns of dtype_tourism.
+    Returns:
+        A pd.Series of uint64 hashes, with the same index as frame.
+    """
+    frame = frame[list(dtype_tourism)].astype(
+        {
+            name: object if name in text_columns else "float64"
+            for name in dtype_tourism
+        }
+    )
+    frame[text_columns] = frame[text_columns].where(
+        frame[text_columns].notna(), None
+    )
+    return pd.util.hash_pandas_object(frame, index=False)
+
+
+def get_stored_hashes(connection, country_names):
+    """
+    Hash the rows already stored for some country names.
+
+    Args:
+        connection: An open SQLAlchemy connection.
+        country_names: List of country names.
+    Returns:
+        A dictionary of country name to the hash of its stored row.
+    """
+    name_column = tourism_arrivals_table.c["Country Name"]
+    stored_hashes = {}
+    for start in range(0, len(country_names), lookup_batch_size):
+        stored = pd.read_sql(
+            select(tourism_arrivals_table).where(
+                name_column.in_(
+                    country_names[start:start + lookup_batch_size]
+                )
+            ),
+            connection,
+        )
+        stored_hashes.update(
+            zip(stored["Country Name"], get_row_hashes(stored))
+        )
+    return stored_hashes
+
+
+def set_derived_columns(frame):
+    """
+    Compute the derived metric columns of a dataframe from its years.
+
+    Args:
+        frame (pd.DataFrame): Validated rows with the year columns.
+    Returns:
+        The dataframe with the derived columns set, as the API would.
+    """
+    years = get_legacy_years()
+    year_matrix = frame[[str(year) for year in years]].to_numpy(
+        dtype="float64", na_value=np.nan
+    )
+    metrics = pd.DataFrame(
+        compute_metrics(year_matrix, years), index=frame.index
+    )
+    derived_columns = {
+        rule.key: rule.column_name for rule in COLUMN_RULES if rule.derived
+    }
+    return frame.assign(**{
+        derived_columns[key]: metrics[key] for key in DERIVED_KEYS
+    })
+
+
+def csv_to_sqlite(csv_file, database_file, chunk_size=10_000,
+                  rejects_file=None):
+    """
+    Import a csv file into the tourism_arrivals table, chunk by chunk.
+
+    Every chunk is first validated against the same rules as the API
+    (see validation.py). Rejected rows are written to rejects_file with
+    the reason, the others are coerced to the model's types and their
+    derived metrics computed from their years.
+
+    Rows are upserted by Country Name, so the import can be run again
+    on the same or a newer csv. A row whose content hashes the same as
+    the stored row is not written at all, so a refresh only touches the
+    countries that changed. Countries missing from the csv are kept.
+
+    Args:
+        csv_file: Path of a csv file in the prepared csv's layout.
+        database_file: Path of the SQLite database file, created if it
+            doesn't exist.
+        chunk_size (int): How many rows are read, compared and written
+            at a time, each chunk in its own transaction.
+        rejects_file: Path of the csv the rejected rows are written to,
+            by default next to csv_file with a .rejected.csv suffix.
+            Only written if a row is rejected.
+    Returns:
+        report: A dictionary with the number of rows `inserted`,
+        `updated`, `unchanged` and `rejected`.
+    Raises:
+        ValueError: If the csv is missing a column or has a column the
+            model does not.
+    """
+    if rejects_file is None:
+        rejects_file = Path(csv_file).with_suffix(".rejected.csv")
+    # Leave no rejects from an earlier import behind
+    Path(rejects_file).unlink(missing_ok=True)
+
+    # Create a connection to file as a SQLite database
+    # (automatically creates file if it doesn't exist)
+    engine = create_engine("sqlite:///" + str(database_file), echo=False)
+
+    # Create the table if needed, and the unique index the upsert needs,
+    # as every country name is unique, as in the model's primary key
+    with engine.begin() as connection:
+        tourism_arrivals_table.create(connection, checkfirst=True)
+        connection.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_unique_country_name "
+            'ON tourism_arrivals ("Country Name")'
+        ))
+
+    # Insert new countries, or update every column of existing ones.
+    # It is compiled once and run with plain tuples, which is much
+    # faster than having SQLAlchemy bind a dictionary per row
+    statement = insert(tourism_arrivals_table)
+    upsert = str(statement.on_conflict_do_update(
+        index_elements=["Country Name"],
+        set_={
+            name: statement.excluded[name]
+            for name in dtype_tourism if name != "Country Name"
+        },
+    ).compile(dialect=engine.dialect))
+
+    report = {"inserted": 0, "updated": 0, "unchanged": 0, "rejected": 0}
+    # Read the csv to pandas dataframes in chunks
+    chunks = pd.read_csv(
+        csv_file,
+        chunksize=chunk_size,
+        dtype={name: object for name in text_columns},
+    )
+    for chunk in chunks:
+        chunk, rejected = validate_frame(chunk)
+        if len(rejected):
+            rejected.to_csv(
+                rejects_file,
+                mode="a",
+                header=report["rejected"] == 0,
+                index=False,
+            )
+            report["rejected"] += len(rejected)
+        chunk = set_derived_columns(chunk)
+        # If a country is in the csv twice, the last row wins
+        chunk = chunk.drop_duplicates("Country Name", keep="last")
+        csv_hashes = get_row_hashes(chunk)
+        with engine.begin() as connection:
+            stored_hashes = get_stored_hashes(
+                connection, chunk["Country Name"].tolist()
+            )
+            is_new = ~chunk["Country Name"].isin(stored_hashes)
+            is_changed = ~is_new & (
+                chunk["Country Name"].map(stored_hashes) != csv_hashes
+            )
+            changed = chunk[is_new | is_changed]
+            if len(changed):
+                # NaN becomes None, so empty cells are stored as NULL
+                rows = changed[list(dtype_tourism)].astype(object)
+                rows = rows.where(rows.notna(), None)
+                connection.exec_driver_sql(
+                    upsert, list(rows.itertuples(index=False, name=None))
+                )
+        report["inserted"] += int(is_new.sum())
+        report["updated"] += int(is_changed.sum())
+        report["unchanged"] += len(chunk) - len(changed)
+    engine.dispose()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "csv_file", nargs="?", default=tourism_arrivals_prepared_file,
+        help="csv file in the prepared csv's layout",
+    )
+    parser.add_argument(
+        "database_file", nargs="?", default=db_tourism_hotels_file,
+        help="SQLite database to create or refresh",
+    )
+    arguments = parser.parse_args()
+    import_report = csv_to_sqlite(
+        arguments.csv_file, arguments.database_file
+    )
+    print(
+        f"Inserted {import_report['inserted']}, updated "
+        f"{import_report['updated']}, unchanged "
+        f"{import_report['unchanged']} and rejected "
+        f"{import_report['rejected']} countries."
+    )
@@ -0,0 +1,168 @@
+"""File containing the server-side computation of the derived metrics.
+
+The 10-year average, maximum, minimum and percent drop columns are
+worked out from a country's year values instead of being taken from the
+client, so they can never contradict them. The computation takes a
+countries x years matrix, so one NumPy pass covers a single country on
+POST or PATCH as well as the whole table in check_derived_metrics().
+"""
+import math
+import warnings
+import numpy as np
+from tourism_hotels_app import db
+from tourism_hotels_app.models import TourismArrivals
+from tourism_hotels_app.observations import (
+    get_legacy_years,
+    get_year_axis,
+    load_observations,
+)
+
+# Keys of the derived metrics, in model column order
+AVERAGE_KEY = "Average_10year_in_tourist_arrivals"
+MAX_KEY = "Max_number_of_arrivals"
+MIN_KEY = "Minimum_number_of_arrivals"
+PERCENT_DROP_KEY = "Percent_drop_2019_to_2020"
+DERIVED_KEYS = (AVERAGE_KEY, MAX_KEY, MIN_KEY, PERCENT_DROP_KEY)
+
+# The average covers the last 10 years of the original dataset
+AVERAGE_YEARS = get_legacy_years()[-10:]
+# The percent drop is from the first to the second of these years
+DROP_YEARS = (2019, 2020)
+
+# Stored percentages are rounded to 2 decimals by the source data, but
+# not always the same way as Python, so allow for that when checking
+PERCENT_TOLERANCE = 0.01
+
+
+def format_percent(value):
+    """
+    Sub-helper function formatting a percentage like the source data.
+
+    Args:
+        value (float): The percentage, e.g. -58.5074.
+    Returns:
+        The percentage as text, e.g. "-58.51%" or "-64%".
+    """
+    return np.format_float_positional(round(value, 2), trim="-") + "%"
+
+
+def compute_metrics(year_matrix, years):
+    """
+    Compute the derived metrics for every row of a year matrix.
+
+    Args:
+        year_matrix (np.ndarray): Countries x years float matrix, with
+            NaN for missing values.
+        years: The year of each matrix column.
+    Returns:
+        A list with one dictionary of DERIVED_KEYS per row, with None
+        where a metric has no data to be computed from.
+    """
+    position = {year: column for column, year in enumerate(years)}
+    average_columns = [position[year] for year in AVERAGE_YEARS]
+    before, after = (year_matrix[:, position[year]] for year in DROP_YEARS)
+
+    # All-missing rows give NaN (with a warning), turned into None below
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        average = np.nanmean(year_matrix[:, average_columns], axis=1)
+        maximum = np.nanmax(year_matrix, axis=1, initial=-np.inf)
+        minimum = np.nanmin(year_matrix, axis=1, initial=np.inf)
+        percent_drop = (after - before) / before * 100
+
+    return [
+        {
+            # Rounded to the 10 significant digits of the source data
+            AVERAGE_KEY: float(f"{mean:.10g}") if np.isfinite(mean)
+            else None,
+            MAX_KEY: float(high) if np.isfinite(high) else None,
+            MIN_KEY: float(low) if np.isfinite(low) else None,
+            PERCENT_DROP_KEY: format_percent(drop) if np.isfinite(drop)
+            else None,
+        }
+        for mean, high, low, drop in zip(
+            average, maximum, minimum, percent_drop
+        )
+    ]
+
+
+def compute_country_metrics(values_by_year):
+    """
+    Compute the derived metrics for one country.
+
+    Args:
+        values_by_year (dict): Maps year (int) to the country's value,
+            None or missing if there is no value.
+    Returns:
+        A dictionary of DERIVED_KEYS to their values.
+    """
+    years = sorted(set(get_legacy_years()).union(values_by_year))
+    year_matrix = np.array(
+        [[
+            np.nan if values_by_year.get(year) is None
+            else values_by_year[year]
+            for year in years
+        ]],
+        dtype=np.float64,
+    )
+    return compute_metrics(year_matrix, years)[0]
+
+
+def values_match(key, stored, expected):
+    """
+    Sub-helper function comparing a stored metric to the computed one.
+
+    Args:
+        key (str): One of DERIVED_KEYS.
+        stored: The value in the database.
+        expected: The value from compute_metrics().
+    Returns:
+        True if the values agree, False otherwise.
+    """
+    if stored is None or expected is None:
+        return stored is None and expected is None
+    if key == PERCENT_DROP_KEY:
+        try:
+            stored = float(str(stored).rstrip("%"))
+        except ValueError:
+            return False
+        return math.isclose(
+            stored, float(expected[:-1]), abs_tol=PERCENT_TOLERANCE
+        )
+    return math.isclose(float(stored), expected, rel_tol=1e-9)
+
+
+def check_derived_metrics(connection):
+    """
+    Re-verify the derived metrics of the whole table in one pass.
+
+    Reads the raw stored values, not the serialized ones, so values
+    are compared at full precision.
+
+    Args:
+        connection: An open SQLAlchemy connection or session.
+    Returns:
+        A list of (country name, key, stored value, expected value)
+        tuples, one per metric that does not match its year values.
+    """
+    years = get_year_axis(connection)
+    rows = connection.execute(
+        db.select(
+            TourismArrivals.Country_Name,
+            *(getattr(TourismArrivals, key) for key in DERIVED_KEYS),
+        )
+    ).all()
+    row_of = {row[0]: number for number, row in enumerate(rows)}
+    position = {year: column for column, year in enumerate(years)}
+
+    # Fill the matrix straight from the long-format observations
+    year_matrix = np.full((len(rows), len(years)), np.nan)
+    for country_name, year, value in load_observations(connection):
+        year_matrix[row_of[country_name], position[year]] = value
+
+    mismatches = []
+    for row, expected in zip(rows, compute_metrics(year_matrix, years)):
+        for key, stored in zip(DERIVED_KEYS, row[1:]):
+            if not values_match(key, stored, expected[key]):
+                mismatches.append((row[0], key, stored, expected[key]))
+    return mismatches
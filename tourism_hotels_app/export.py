@@ -0,0 +1,213 @@
+"""File containing the streaming export of the dataset as NDJSON or CSV.
+
+Countries are fetched from the database in chunks, a page of names at
+a time, and each chunk is encoded and sent before the next one is
+fetched, so the memory used stays the same however many countries
+there are. Every chunk is read in its own short transaction, so no
+lock is held on the database while a chunk is sent: with the
+rollback journal of the sqlite_default profile, a reader's lock would
+keep every writer from committing until a slow client had read the
+whole export. A country changed during the export is therefore sent
+as it is when its chunk is read.
+"""
+import csv
+import io
+import zlib
+from tourism_hotels_app.models import TourismArrivals
+from tourism_hotels_app.serializers import dumps_json
+from tourism_hotels_app.observations import (
+    LEADING_KEYS,
+    TRAILING_KEYS,
+    build_records,
+    get_metadata_serializer,
+    get_year,
+    get_year_axis,
+    load_observations,
+)
+
+# Formats accepted by /api/countries/export and their content types
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def get_export_fields(connection, fields=None):
+    """
+    Get the keys to export, all of them or the ones asked for.
+
+    Args:
+        connection: An open SQLAlchemy connection.
+        fields: Optional list of keys, in the order wanted.
+    Returns:
+        A tuple of (keys, years), years being the years of the year
+        keys among them.
+    Raises:
+        ValueError: If a key is unknown or given twice.
+    """
+    years = get_year_axis(connection)
+    all_keys = (
+        list(LEADING_KEYS)
+        + [f"year_{year}" for year in years]
+        + list(TRAILING_KEYS)
+    )
+    if not fields:
+        return all_keys, years
+
+    unknown = [key for key in fields if key not in all_keys]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    if len(set(fields)) != len(fields):
+        raise ValueError("Each field may only be given once")
+    fields_years = [get_year(key) for key in fields]
+    return list(fields), [year for year in fields_years if year is not None]
+
+
+def iter_record_chunks(engine, keys, years, chunk_size):
+    """
+    Fetch the countries chunk by chunk, ordered by name.
+
+    Each chunk is the page of names after the last one sent, read with
+    its own connection, which is given back before the chunk is
+    yielded. Observations are only loaded for the countries of each
+    chunk, and not at all if no year is exported.
+
+    Args:
+        engine: The SQLAlchemy engine to read from.
+        keys: The keys to include in each record, in order.
+        years: The years of the year keys among them.
+        chunk_size (int): How many countries to fetch at a time.
+    Yields:
+        Lists of serialized country dictionaries with only those keys.
+    """
+    serializer = get_metadata_serializer()
+    page = serializer.statement.order_by(
+        TourismArrivals.Country_Name
+    ).limit(chunk_size)
+    query = page
+    while True:
+        with engine.connect() as connection:
+            metadata_records = serializer.dump_rows(
+                connection.execute(query).all()
+            )
+            observations = []
+            if years and metadata_records:
+                observations = load_observations(
+                    connection,
+                    [record["Country_Name"] for record in metadata_records],
+                )
+        if not metadata_records:
+            return
+        records = build_records(metadata_records, observations, years)
+        yield [{key: record[key] for key in keys} for record in records]
+        if len(metadata_records) < chunk_size:
+            return
+        # The next page starts after the last name sent
+        query = page.where(
+            TourismArrivals.Country_Name > metadata_records[-1]["Country_Name"]
+        )
+
+
+def encode_ndjson(record_chunks):
+    """
+    Encode chunks of records as NDJSON, one record per line.
+
+    Args:
+        record_chunks: Iterable of lists of record dictionaries.
+    Yields:
+        The encoded bytes of each chunk.
+    """
+    for records in record_chunks:
+        yield b"".join(dumps_json(record) + b"\n" for record in records)
+
+
+def encode_csv(record_chunks, keys):
+    """
+    Encode chunks of records as CSV, after a header row of the keys.
+
+    Null values are written as empty cells.
+
+    Args:
+        record_chunks: Iterable of lists of record dictionaries.
+        keys: The keys of the records, used as the header row.
+    Yields:
+        The encoded bytes of the header and of each chunk.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(keys)
+    for records in record_chunks:
+        writer.writerows(record.values() for record in records)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    # The header still has to be sent if there are no countries
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def encode_gzip(chunks, level=6):
+    """
+    Compress a stream of byte chunks into one gzip stream.
+
+    Args:
+        chunks: Iterable of bytes.
+        level (int): The zlib compression level.
+    Yields:
+        The compressed bytes, as they become available.
+    """
+    # wbits 31 writes a gzip header and trailer instead of zlib ones
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def iter_export(engine, export_format, fields, chunk_size, compress):
+    """
+    Stream the dataset, reading each chunk in its own transaction.
+
+    The first yield comes once the fields are checked, so that
+    prime_export() can still turn an unknown field into a 400 before
+    the response starts.
+
+    Args:
+        engine: The SQLAlchemy engine to read from.
+        export_format (str): One of EXPORT_FORMATS.
+        fields: Optional list of keys to export.
+        chunk_size (int): How many countries to fetch at a time.
+        compress (bool): Whether to gzip the output.
+    Yields:
+        None once the keys are checked, then the encoded bytes.
+    Raises:
+        ValueError: If a field is unknown, before the first yield.
+    """
+    with engine.connect() as connection:
+        keys, years = get_export_fields(connection, fields)
+    yield None
+    record_chunks = iter_record_chunks(engine, keys, years, chunk_size)
+    if export_format == "csv":
+        chunks = encode_csv(record_chunks, keys)
+    else:
+        chunks = encode_ndjson(record_chunks)
+    if compress:
+        chunks = encode_gzip(chunks)
+    yield from chunks
+
+
+def prime_export(*args):
+    """
+    Start iter_export() and check its fields before sending anything.
+
+    Args:
+        *args: The arguments of iter_export().
+    Returns:
+        The generator, positioned just before its first bytes.
+    Raises:
+        ValueError: If a field is unknown.
+    """
+    export = iter_export(*args)
+    next(export)
+    return export
@@ -0,0 +1,182 @@
+"""File containing the incrementally maintained country rankings.
+
+Each ranking is a list of (value, country name) pairs kept in sorted
+order. It is built the first time a metric is asked for, and after that
+a write only moves the changed countries with a binary search, instead
+of sorting the whole table on every request.
+"""
+import bisect
+import math
+import threading
+
+# Metric names accepted by /api/top and the record key they rank.
+# "arrivals" ranks the year_XXXX key of the requested year.
+METRICS = {
+    "average": "Average_10year_in_tourist_arrivals",
+    "max": "Max_number_of_arrivals",
+    "min": "Minimum_number_of_arrivals",
+    "percent_drop": "Percent_drop_2019_to_2020",
+    "arrivals": None,
+}
+
+
+def get_metric_value(record, key):
+    """
+    Get the numeric value of a record's metric.
+
+    Args:
+        record (dict): A serialized country record.
+        key (str): The record key of the metric.
+    Returns:
+        The value as a float, or None if it is null or not numeric.
+    """
+    value = record.get(key)
+    # Percentages are stored as text, e.g. "-58.51%"
+    if isinstance(value, str):
+        value = value.rstrip("%")
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(value) else value
+
+
+class Ranking:
+    """
+    Countries sorted by the value of one metric, nulls left out.
+
+    Methods:
+        move(): Moves a country from its old value to its new value.
+        top(): Returns the first countries in either direction.
+    """
+
+    def __init__(self, records, key):
+        """
+        Sort the countries once for the metric.
+
+        Args:
+            records: Serialized country records.
+            key (str): The record key of the metric.
+        """
+        self.key = key
+        self._entries = sorted(
+            (value, record["Country_Name"])
+            for record in records
+            if (value := get_metric_value(record, key)) is not None
+        )
+
+    def move(self, old_record, new_record):
+        """
+        Update one country's position in the ranking.
+
+        Args:
+            old_record: The country's record before the change, or None
+                if the country is new.
+            new_record: The country's record after the change, or None
+                if the country was removed.
+        Returns:
+            None
+        """
+        if old_record is not None:
+            value = get_metric_value(old_record, self.key)
+            if value is not None:
+                entry = (value, old_record["Country_Name"])
+                position = bisect.bisect_left(self._entries, entry)
+                if (
+                    position < len(self._entries)
+                    and self._entries[position] == entry
+                ):
+                    del self._entries[position]
+        if new_record is not None:
+            value = get_metric_value(new_record, self.key)
+            if value is not None:
+                bisect.insort(
+                    self._entries, (value, new_record["Country_Name"])
+                )
+
+    def top(self, number, descending=True):
+        """
+        Get the first countries of the ranking.
+
+        Args:
+            number (int): How many countries to return.
+            descending (bool): True for the highest values first.
+        Returns:
+            A list of (country name, value) tuples.
+        """
+        if descending:
+            entries = self._entries[:-number - 1:-1]
+        else:
+            entries = self._entries[:number]
+        return [(name, value) for value, name in entries]
+
+
+class Leaderboard:
+    """
+    Holds one Ranking per metric key and keeps them up to date.
+
+    The snapshot swaps in its new state inside update() and reset(),
+    under the same lock a ranking is built under, so a ranking can
+    never be built from a state older than the changes applied to it.
+
+    Methods:
+        top(): Returns the first countries for a metric key.
+        update(): Moves changed countries in every built ranking.
+        reset(): Drops every ranking, e.g. after a full reload.
+    """
+
+    def __init__(self):
+        """Create a leaderboard without any rankings built yet."""
+        self._rankings = {}
+        self._lock = threading.Lock()
+
+    def top(self, load_records, key, number, descending=True):
+        """
+        Get the first countries for a metric, building its ranking once.
+
+        Args:
+            load_records: Function returning the current serialized
+                records, only called if the ranking for key has not
+                been built yet.
+            key (str): The record key of the metric.
+            number (int): How many countries to return.
+            descending (bool): True for the highest values first.
+        Returns:
+            A list of (country name, value) tuples.
+        """
+        with self._lock:
+            ranking = self._rankings.get(key)
+            if ranking is None:
+                ranking = Ranking(load_records(), key)
+                self._rankings[key] = ranking
+            return ranking.top(number, descending)
+
+    def update(self, changes, swap_state):
+        """
+        Apply changed records to every ranking built so far.
+
+        Args:
+            changes: Iterable of (old record, new record) pairs, with
+                None for a record that did not exist.
+            swap_state: Function making the changed records current.
+        Returns:
+            None
+        """
+        with self._lock:
+            swap_state()
+            for old_record, new_record in changes:
+                for ranking in self._rankings.values():
+                    ranking.move(old_record, new_record)
+
+    def reset(self, swap_state):
+        """
+        Drop every ranking, they are rebuilt when next asked for.
+
+        Args:
+            swap_state: Function making the reloaded records current.
+        Returns:
+            None
+        """
+        with self._lock:
+            swap_state()
+            self._rankings = {}
@@ -0,0 +1,432 @@
+"""File containing the app's metrics, served in Prometheus text format.
+
+GET /metrics returns, for Prometheus to scrape:
+
+- tourism_http_request_duration_seconds: latency histogram per
+  blueprint, route and method
+- tourism_http_responses_total: responses per route and status code
+- tourism_sql_queries_per_request: histogram of how many statements
+  each request ran, on either engine
+- tourism_db_pool_checkouts_total: connections checked out of the pool
+  of each engine
+- tourism_http_response_size_bytes: histogram of response body sizes,
+  leaving out streamed bodies, whose size is not known
+- tourism_response_cache_requests_total: hits and misses of the payload
+  cache (see response_cache.py) and of ETag revalidation, with
+  tourism_response_cache_hit_ratio worked out from them
+
+Recording has to stay cheap on the hot path, so every thread counts
+into its own dictionary with no lock, and /metrics adds them up. Routes
+are labelled with their URL rule, e.g. /api/countries/country/
+<country_name>, so the number of series stays bounded.
+"""
+import threading
+import time
+from bisect import bisect_left
+from flask import Blueprint, make_response, request
+from sqlalchemy import event
+from tourism_hotels_app import db
+
+# Upper bounds of the histogram buckets
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0,
+)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Every metric: its type, help text and, for histograms, the buckets
+METRICS = {
+    "tourism_http_request_duration_seconds": (
+        "histogram", "Time taken to answer a request.", LATENCY_BUCKETS
+    ),
+    "tourism_http_responses_total": (
+        "counter", "Responses sent, by status code.", None
+    ),
+    "tourism_sql_queries_per_request": (
+        "histogram", "SQL statements executed by a request.",
+        QUERY_COUNT_BUCKETS,
+    ),
+    "tourism_db_pool_checkouts_total": (
+        "counter", "Connections checked out of an engine's pool.", None
+    ),
+    "tourism_http_response_size_bytes": (
+        "histogram", "Size of response bodies that are not streamed.",
+        SIZE_BUCKETS,
+    ),
+    "tourism_response_cache_requests_total": (
+        "counter", "Lookups of a response cache, by result.", None
+    ),
+    "tourism_response_cache_hit_ratio": (
+        "gauge", "Share of a response cache's lookups that were hits.",
+        None,
+    ),
+}
+
+# Content-Type of the Prometheus text format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# The [start time, statement count] of the request each thread is
+# answering, kept here rather than on g, as every access to g goes
+# through a proxy
+_current_request = threading.local()
+
+# The labels of each (endpoint, method), worked out once per route
+_route_labels = {}
+
+
+class MetricsRegistry:
+    """
+    Counters and histograms, recorded per thread without locking.
+
+    Every value is stored under a (metric name, labels) key, where the
+    labels are a tuple of (name, value) pairs. A counter's value is a
+    number and a histogram's a list of one count per bucket, the last
+    for +Inf, followed by the sum of the values observed.
+
+    The dictionaries of threads that have finished, e.g. one per
+    connection under the threaded development server, are folded into
+    one, so they do not pile up.
+
+    Methods:
+        inc(): Adds to a counter.
+        observe(): Adds a value to a histogram.
+        collect(): Returns the totals of every thread.
+        render(): Returns the totals in Prometheus text format.
+    """
+
+    def __init__(self):
+        """Create a registry with no values."""
+        self._local = threading.local()
+        self._threads = []
+        self._finished = {}
+        self._lock = threading.Lock()
+
+    def _values(self):
+        """
+        Sub-helper function getting the current thread's dictionary.
+
+        The lock is only taken the first time a thread records a value.
+
+        Args:
+            None
+        Returns:
+            The dictionary of values of the current thread.
+        """
+        values = getattr(self._local, "values", None)
+        if values is None:
+            values = self._local.values = {}
+            with self._lock:
+                self._fold_finished_threads()
+                self._threads.append((threading.current_thread(), values))
+        return values
+
+    def inc(self, name, labels, amount=1):
+        """
+        Add to a counter.
+
+        Args:
+            name (str): The name of the metric, in METRICS.
+            labels (tuple): The (name, value) pairs of the series.
+            amount: How much to add.
+        Returns:
+            None
+        """
+        values = self._values()
+        key = (name, labels)
+        values[key] = values.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        """
+        Add a value to a histogram.
+
+        Args:
+            name (str): The name of the metric, in METRICS.
+            labels (tuple): The (name, value) pairs of the series.
+            value: The value observed.
+        Returns:
+            None
+        """
+        values = self._values()
+        key = (name, labels)
+        buckets = METRICS[name][2]
+        histogram = values.get(key)
+        if histogram is None:
+            histogram = values[key] = [0] * (len(buckets) + 2)
+        histogram[bisect_left(buckets, value)] += 1
+        histogram[-1] += value
+
+    @staticmethod
+    def _merge(total, values):
+        """
+        Sub-helper function adding one dictionary of values to another.
+
+        Args:
+            total (dict): The dictionary added to.
+            values (dict): The dictionary added, copied first, as its
+                thread may still be writing to it.
+        Returns:
+            None
+        """
+        for key, value in values.copy().items():
+            current = total.get(key)
+            if isinstance(value, list):
+                total[key] = list(value) if current is None else [
+                    current_count + count
+                    for current_count, count in zip(current, value)
+                ]
+            else:
+                total[key] = value if current is None else current + value
+
+    def _fold_finished_threads(self):
+        """
+        Sub-helper function merging the values of finished threads.
+
+        Must be called with the lock held.
+
+        Args:
+            None
+        Returns:
+            None
+        """
+        running = []
+        for thread, values in self._threads:
+            if thread.is_alive():
+                running.append((thread, values))
+            else:
+                self._merge(self._finished, values)
+        self._threads = running
+
+    def collect(self):
+        """
+        Add up the values of every thread.
+
+        The hit ratio of each response cache is worked out from its
+        hits and misses.
+
+        Args:
+            None
+        Returns:
+            A dictionary of (metric name, labels) to value.
+        """
+        total = {}
+        with self._lock:
+            self._fold_finished_threads()
+            self._merge(total, self._finished)
+            for _, values in self._threads:
+                self._merge(total, values)
+
+        lookups = {}
+        for (name, labels), value in total.items():
+            if name == "tourism_response_cache_requests_total":
+                cache_labels = labels[:1]
+                hits, count = lookups.get(cache_labels, (0, 0))
+                if labels[1] == ("result", "hit"):
+                    hits += value
+                lookups[cache_labels] = (hits, count + value)
+        for cache_labels, (hits, count) in lookups.items():
+            total[("tourism_response_cache_hit_ratio", cache_labels)] = (
+                hits / count
+            )
+        return total
+
+    def render(self):
+        """
+        Format the totals of every metric in Prometheus text format.
+
+        Args:
+            None
+        Returns:
+            The text, one line per sample.
+        """
+        series = {}
+        for (name, labels), value in self.collect().items():
+            series.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for name, (kind, help_text, buckets) in METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(series.get(name, [])):
+                label_text = format_labels(labels)
+                if kind != "histogram":
+                    lines.append(f"{name}{label_text} {value}")
+                    continue
+                # Prometheus buckets count every value up to their bound
+                cumulative = 0
+                bounds = [str(bound) for bound in buckets] + ["+Inf"]
+                for bound, count in zip(bounds, value):
+                    cumulative += count
+                    bucket_labels = format_labels(labels + (("le", bound),))
+                    lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{name}_sum{label_text} {value[-1]}")
+                lines.append(f"{name}_count{label_text} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels):
+    """
+    Format the labels of a series, escaped as Prometheus expects.
+
+    Args:
+        labels (tuple): The (name, value) pairs of the series.
+    Returns:
+        The labels in braces, e.g. '{route="/api/top"}', or an empty
+        string if there are none.
+    """
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(
+            name,
+            str(value)
+            .replace("\\", "\\\\")
+            .replace('"', '\\"')
+            .replace("\n", "\\n"),
+        )
+        for name, value in labels
+    )
+    return "{" + pairs + "}"
+
+
+# Create the global metrics registry object
+metrics = MetricsRegistry()
+
+# Blueprint of the /metrics route
+metrics_bp = Blueprint("metrics", __name__)
+
+
+@metrics_bp.get("/metrics")
+def get_metrics():
+    """
+    HTTP GET request route returning every metric for Prometheus.
+
+    Args:
+        None
+    Returns:
+        response: The metrics in Prometheus text format.
+    """
+    response = make_response(metrics.render(), 200)
+    response.headers["Content-Type"] = CONTENT_TYPE
+    return response
+
+
+def count_statement(
+    conn, cursor, statement, parameters, context, executemany
+):
+    """Count a statement towards the current request's total."""
+    request_metrics = getattr(_current_request, "metrics", None)
+    if request_metrics is not None:
+        request_metrics[1] += 1
+
+
+def get_route_labels(current_request):
+    """
+    Get the blueprint, route and method labels of a request.
+
+    Args:
+        current_request: The Flask request object, not the proxy.
+    Returns:
+        A tuple of (name, value) pairs.
+    """
+    url_rule = current_request.url_rule
+    key = (url_rule.endpoint if url_rule is not None else None,
+           current_request.method)
+    labels = _route_labels.get(key)
+    if labels is None:
+        # Requests matching no route share one label
+        labels = _route_labels[key] = (
+            ("blueprint", current_request.blueprint or "app"),
+            ("route", url_rule.rule if url_rule is not None else "unmatched"),
+            ("method", current_request.method),
+        )
+    return labels
+
+
+def listen_pool_checkouts(engine, engine_name):
+    """
+    Sub-helper function counting the pool checkouts of an engine.
+
+    Args:
+        engine: A SQLAlchemy engine.
+        engine_name (str): The engine's label, writer or reader.
+    Returns:
+        None
+    """
+    labels = (("engine", engine_name),)
+
+    def count_checkout(dbapi_connection, connection_record, connection_proxy):
+        """Count a connection checked out of the pool."""
+        metrics.inc("tourism_db_pool_checkouts_total", labels)
+
+    event.listen(engine, "checkout", count_checkout)
+
+
+def init_metrics(app):
+    """
+    Record the metrics of every request and add the /metrics route.
+
+    Does nothing unless METRICS_ENABLED is set. Must be called inside
+    the app context, so both engines exist.
+
+    Args:
+        app: Flask app application instance
+    Returns:
+        None
+    """
+    if not app.config.get("METRICS_ENABLED"):
+        return
+
+    for bind_key, engine in db.engines.items():
+        event.listen(engine, "before_cursor_execute", count_statement)
+        listen_pool_checkouts(engine, bind_key or "writer")
+    app.register_blueprint(metrics_bp)
+
+    @app.before_request
+    def start_request_metrics():
+        """Note when the request started."""
+        _current_request.metrics = [time.perf_counter(), 0]
+
+    @app.after_request
+    def record_request_metrics(response):
+        """Record the request's latency, status, queries and size."""
+        request_metrics = getattr(_current_request, "metrics", None)
+        if request_metrics is None:
+            return response
+        _current_request.metrics = None
+        start, statements = request_metrics
+        duration = time.perf_counter() - start
+        # Every access through the request proxy has a cost, so look
+        # the request up once
+        current_request = request._get_current_object()
+        labels = get_route_labels(current_request)
+        metrics.observe(
+            "tourism_http_request_duration_seconds", labels, duration
+        )
+        metrics.inc(
+            "tourism_http_responses_total",
+            labels + (("status", str(response.status_code)),),
+        )
+        metrics.observe(
+            "tourism_sql_queries_per_request", labels[:2], statements
+        )
+        if not response.is_streamed and response.content_length is not None:
+            metrics.observe(
+                "tourism_http_response_size_bytes",
+                labels[:2],
+                response.content_length,
+            )
+        # A 304 to a request with an ETag means the client's copy was
+        # still current
+        if "HTTP_IF_NONE_MATCH" in current_request.environ and (
+            response.get_etag()[0]
+        ):
+            metrics.inc(
+                "tourism_response_cache_requests_total",
+                (
+                    ("cache", f"etag:{labels[1][1]}"),
+                    ("result", "hit" if response.status_code == 304
+                     else "miss"),
+                ),
+            )
+        return response
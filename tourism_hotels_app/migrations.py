@@ -0,0 +1,209 @@
+"""File containing the database migrations run when the app starts.
+
+Each migration checks whether it has already been applied, so running
+upgrade_database() on an up to date database does nothing.
+"""
+from sqlalchemy import inspect, text
+from tourism_hotels_app import db
+from tourism_hotels_app.models import TourismArrivals, TourismObservation
+
+# Names of the triggers keeping the long-format table in step
+INSERT_TRIGGER = "tourism_arrivals_observations_insert"
+UPDATE_TRIGGER = "tourism_arrivals_observations_update"
+DELETE_TRIGGER = "tourism_arrivals_observations_delete"
+# Name of the trigger counting updates made outside the ORM
+ROW_VERSION_TRIGGER = "tourism_arrivals_row_version"
+
+
+def get_legacy_year_columns():
+    """
+    Sub-helper function.
+
+    Gets the year columns of the wide tourism_arrivals table.
+
+    Args:
+        None
+    Returns:
+        A list of (year, column name) tuples, e.g. (1995, "1995").
+    """
+    return [
+        (int(key[len("year_"):]), attr.columns[0].name)
+        for key, attr in TourismArrivals.__mapper__.column_attrs.items()
+        if key.startswith("year_")
+    ]
+
+
+def get_unpivot_select(row):
+    """
+    Sub-helper function.
+
+    Builds a SELECT turning the year columns of one wide row into
+    (country, indicator, year, value) rows, leaving out null values.
+
+    Args:
+        row (str): How the wide row is referred to, e.g. "NEW" inside
+            a trigger or "tourism_arrivals" for the whole table.
+    Returns:
+        The SELECT statement as a string.
+    """
+    years = " UNION ALL ".join(
+        f'SELECT {year} AS year, {row}."{column}" AS value'
+        for year, column in get_legacy_year_columns()
+    )
+    return (
+        f'SELECT {row}."Country Name", {row}."Indicator Name", '
+        f"years.year, years.value FROM ({years}) AS years "
+        "WHERE years.value IS NOT NULL"
+    )
+
+
+def create_observations_table(connection):
+    """
+    Create the long-format table and copy in the wide table's years.
+
+    Args:
+        connection: An open SQLAlchemy connection in a transaction.
+    Returns:
+        None
+    """
+    TourismObservation.__table__.create(connection)
+    year_selects = " UNION ALL ".join(
+        f'SELECT "Country Name", "Indicator Name", {year}, "{column}" '
+        f'FROM tourism_arrivals WHERE "{column}" IS NOT NULL'
+        for year, column in get_legacy_year_columns()
+    )
+    connection.execute(text(
+        "INSERT OR REPLACE INTO tourism_observations "
+        '("Country Name", "Indicator Name", "Year", "Value") '
+        + year_selects
+    ))
+
+
+def create_observation_triggers(connection):
+    """
+    Create the triggers mirroring wide year columns into observations.
+
+    Inserting, updating or deleting a tourism_arrivals row, through
+    the ORM, Core or plain SQL, updates its observations for the
+    legacy years. Observations for later years are only moved along
+    when a country is renamed, and removed when it is deleted.
+
+    Args:
+        connection: An open SQLAlchemy connection in a transaction.
+    Returns:
+        None
+    """
+    legacy_years = ", ".join(
+        str(year) for year, column in get_legacy_year_columns()
+    )
+    watched_columns = ", ".join(
+        ['"Country Name"', '"Indicator Name"']
+        + [f'"{column}"' for year, column in get_legacy_year_columns()]
+    )
+    insert_observations = (
+        "INSERT OR REPLACE INTO tourism_observations "
+        '("Country Name", "Indicator Name", "Year", "Value") '
+        + get_unpivot_select("NEW")
+        + ";"
+    )
+    connection.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS {INSERT_TRIGGER} "
+        "AFTER INSERT ON tourism_arrivals BEGIN "
+        f"{insert_observations} END"
+    ))
+    connection.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS {UPDATE_TRIGGER} "
+        f"AFTER UPDATE OF {watched_columns} ON tourism_arrivals BEGIN "
+        "UPDATE OR REPLACE tourism_observations "
+        'SET "Country Name" = NEW."Country Name", '
+        '"Indicator Name" = NEW."Indicator Name" '
+        'WHERE "Country Name" = OLD."Country Name" '
+        'AND "Indicator Name" = OLD."Indicator Name"; '
+        "DELETE FROM tourism_observations "
+        'WHERE "Country Name" = NEW."Country Name" '
+        'AND "Indicator Name" = NEW."Indicator Name" '
+        f'AND "Year" IN ({legacy_years}); '
+        f"{insert_observations} END"
+    ))
+    connection.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS {DELETE_TRIGGER} "
+        "AFTER DELETE ON tourism_arrivals BEGIN "
+        "DELETE FROM tourism_observations "
+        'WHERE "Country Name" = OLD."Country Name" '
+        'AND "Indicator Name" = OLD."Indicator Name"; END'
+    ))
+
+
+def add_row_version(connection):
+    """
+    Add the row version column and the trigger keeping it current.
+
+    The ORM increases the version itself. Updates made through Core or
+    plain SQL, e.g. the csv import's upsert, leave it unchanged, so the
+    trigger increases it for them. The trigger's own UPDATE only sets
+    the version, so it does not fire the observation triggers.
+
+    Args:
+        connection: An open SQLAlchemy connection in a transaction.
+    Returns:
+        None
+    """
+    column = TourismArrivals.Row_Version.expression.name
+    existing = {
+        existing_column["name"]
+        for existing_column in inspect(connection).get_columns(
+            TourismArrivals.__tablename__
+        )
+    }
+    if column not in existing:
+        # Every existing row starts at version 1
+        connection.execute(text(
+            f'ALTER TABLE tourism_arrivals ADD COLUMN "{column}" '
+            "INTEGER NOT NULL DEFAULT 1"
+        ))
+    connection.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS {ROW_VERSION_TRIGGER} "
+        "AFTER UPDATE ON tourism_arrivals "
+        f'WHEN NEW."{column}" = OLD."{column}" BEGIN '
+        f'UPDATE tourism_arrivals SET "{column}" = OLD."{column}" + 1 '
+        'WHERE "Country Name" = NEW."Country Name"; END'
+    ))
+
+
+def create_arrivals_indexes(connection):
+    """
+    Create the indexes of the wide table the database is missing.
+
+    The table may have been created by csv_to_sqlite.py, from its own
+    copy of the columns without the model's indexes.
+
+    Args:
+        connection: An open SQLAlchemy connection in a transaction.
+    Returns:
+        None
+    """
+    for index in TourismArrivals.__table__.indexes:
+        index.create(connection, checkfirst=True)
+
+
+def upgrade_database():
+    """
+    Apply any migrations the database is missing.
+
+    Must be called inside the app context.
+
+    Args:
+        None
+    Returns:
+        None
+    """
+    with db.engine.begin() as connection:
+        tables = inspect(connection).get_table_names()
+        # Nothing to migrate until the wide table has been created
+        if TourismArrivals.__tablename__ not in tables:
+            return
+        if TourismObservation.__tablename__ not in tables:
+            create_observations_table(connection)
+        create_observation_triggers(connection)
+        add_row_version(connection)
+        create_arrivals_indexes(connection)
@@ -1,6 +1,10 @@
 """This file defines model classes, maps from database to Python classes."""
 from tourism_hotels_app import db
 
+# Attribute of the row version, left out of the API's JSON, validation
+# and inserts, which treat every other column as a country field
+ROW_VERSION_KEY = "Row_Version"
+
 
 class TourismArrivals(db.Model):
     """
@@ -19,7 +23,9 @@ class TourismArrivals(db.Model):
         Country_Code (str): The code that identifies the country.
         Indicator_Name (str): The name of the tourism indicator.
         year_1995-2020 (int): The number of tourist arrivals in the
-            respective year.
+            respective year. These columns are mirrored into
+            TourismObservation, which the read endpoints use and which
+            can also hold later years.
         Average_10year_in_tourist_arrivals (str): The 10-year average of
             tourist arrivals for each country.
         Max_number_of_arrivals (int): The all time maximum number of
@@ -28,6 +34,8 @@ class TourismArrivals(db.Model):
             tourist arrivals for each country.
         Percent_drop_2019_to_2020 (str): The percentage of drop in tourist
             arrivals between 2019 and 2020.
+        Row_Version (int): Increased on every update of the row, and
+            sent as the country's ETag rather than in its JSON.
 
     Methods:
         __repr__(): Returns the attributes of the country as a string.
@@ -84,6 +92,24 @@ class TourismArrivals(db.Model):
     Percent_drop_2019_to_2020 = db.Column(
         "Percent drop 2019 to 2020", db.Text, nullable=True
     )
+    # The ORM adds one to the version on every UPDATE of the row, and
+    # only updates it if it still has the version that was read, so a
+    # write based on an outdated copy fails with StaleDataError.
+    # Updates outside the ORM are counted by a trigger, see migrations.py
+    Row_Version = db.Column(
+        "Row Version", db.Integer, nullable=False, default=1,
+        server_default="1",
+    )
+    __mapper_args__ = {"version_id_col": Row_Version}
+    # Indexes for the region and income group filters, which end with
+    # the name so the countries of a group are read in name order.
+    # Databases created before them get them from migrations.py
+    __table_args__ = (
+        db.Index("idx_arrivals_region", "Region", "Country Name"),
+        db.Index(
+            "idx_arrivals_income_group", "IncomeGroup", "Country Name"
+        ),
+    )
 
     def __repr__(self):
         """
@@ -161,3 +187,36 @@ class TourismArrivals(db.Model):
             "Minimum_number_of_arrivals": self.Minimum_number_of_arrivals,
             "Percent_drop_2019_to_2020": self.Percent_drop_2019_to_2020,
         }
+
+
+class TourismObservation(db.Model):
+    """
+    Contains the SQLAlchemy model class for long-format observations.
+
+    One row holds one value of one indicator, for one country and year,
+    so new years can be loaded as rows without changing the schema.
+    The year columns of TourismArrivals are kept in step with this
+    table by database triggers, see migrations.py.
+
+    Args:
+        db.Model: Connects to SQLAlchemy database model function.
+
+    Attributes:
+        Country_Name (str): The name of the country.
+        Indicator_Name (str): The name of the tourism indicator.
+        Year (int): The year of the observation.
+        Value (float): The observed value, e.g. number of arrivals.
+    """
+
+    __tablename__ = "tourism_observations"
+    # The primary key also serves lookups by country and indicator
+    Country_Name = db.Column("Country Name", db.Text, primary_key=True)
+    Indicator_Name = db.Column("Indicator Name", db.Text, primary_key=True)
+    Year = db.Column("Year", db.Integer, primary_key=True)
+    Value = db.Column("Value", db.Float, nullable=False)
+    # Composite index for per-country year ranges, and one on the year
+    # alone for queries across all countries in some years
+    __table_args__ = (
+        db.Index("idx_observations_country_year", "Country Name", "Year"),
+        db.Index("idx_observations_year", "Year"),
+    )
@@ -0,0 +1,308 @@
+"""File containing helpers to read and write long-format observations.
+
+Year values are read from the tourism_observations table, so the year
+axis is open-ended: loading rows for a new year makes a year_XXXX key
+appear in the API output without any code change.
+"""
+import re
+from sqlalchemy import and_, tuple_
+from sqlalchemy.dialects.sqlite import insert
+from tourism_hotels_app import db
+from tourism_hotels_app.models import (
+    ROW_VERSION_KEY,
+    TourismArrivals,
+    TourismObservation,
+)
+from tourism_hotels_app.serializers import get_serializer
+
+# Pattern of the year keys used in the API, e.g. "year_2021"
+YEAR_KEY_PATTERN = re.compile(r"^year_(\d{4})$")
+
+# Execution option naming the countries a statement changes, so the
+# snapshot can patch just those rows instead of rebuilding everything
+CHANGED_COUNTRIES_OPTION = "changed_countries"
+
+# Model keys that are not years, split around where the years go so
+# records keep the same key order as TourismArrivalsSchema
+_COLUMN_KEYS = [
+    key for key in TourismArrivals.__mapper__.column_attrs.keys()
+    if key != ROW_VERSION_KEY
+]
+_FIRST_YEAR_POSITION = next(
+    position
+    for position, key in enumerate(_COLUMN_KEYS)
+    if YEAR_KEY_PATTERN.match(key)
+)
+LEADING_KEYS = tuple(_COLUMN_KEYS[:_FIRST_YEAR_POSITION])
+TRAILING_KEYS = tuple(
+    key
+    for key in _COLUMN_KEYS[_FIRST_YEAR_POSITION:]
+    if not YEAR_KEY_PATTERN.match(key)
+)
+METADATA_KEYS = LEADING_KEYS + TRAILING_KEYS
+
+
+def get_year(key):
+    """
+    Get the year of a year_XXXX key.
+
+    Args:
+        key (str): A JSON key or model attribute name.
+    Returns:
+        The year as an int, or None if the key is not a year key.
+    """
+    match = YEAR_KEY_PATTERN.match(key)
+    return int(match.group(1)) if match else None
+
+
+def get_legacy_years():
+    """
+    Get the years that have a column in the wide TourismArrivals model.
+
+    Args:
+        None
+    Returns:
+        A tuple of years (int), in column order.
+    """
+    return tuple(
+        get_year(key) for key in _COLUMN_KEYS if YEAR_KEY_PATTERN.match(key)
+    )
+
+
+def get_year_axis(connection):
+    """
+    Get every year that has data, plus the legacy years.
+
+    Args:
+        connection: An open SQLAlchemy connection or session.
+    Returns:
+        A sorted tuple of years (int).
+    """
+    observed = connection.execute(
+        db.select(TourismObservation.Year).distinct()
+    ).scalars()
+    return tuple(sorted(set(get_legacy_years()).union(observed)))
+
+
+def get_metadata_serializer():
+    """
+    Get the serializer for the non-year columns of tourism_arrivals.
+
+    Args:
+        None
+    Returns:
+        The RowSerializer for METADATA_KEYS.
+    """
+    return get_serializer(METADATA_KEYS)
+
+
+def load_observations(connection, country_names=None):
+    """
+    Load the observations of each country's own indicator.
+
+    Args:
+        connection: An open SQLAlchemy connection or session.
+        country_names: Optional iterable of country names, or None for
+            every country.
+    Returns:
+        A list of (country name, year, value) rows.
+    """
+    query = db.select(
+        TourismObservation.Country_Name,
+        TourismObservation.Year,
+        TourismObservation.Value,
+    ).join(
+        TourismArrivals,
+        and_(
+            TourismArrivals.Country_Name == TourismObservation.Country_Name,
+            TourismArrivals.Indicator_Name
+            == TourismObservation.Indicator_Name,
+        ),
+    )
+    if country_names is not None:
+        query = query.where(
+            TourismObservation.Country_Name.in_(list(country_names))
+        )
+    return connection.execute(query).all()
+
+
+def load_row_versions(connection, country_names=None):
+    """
+    Load the row version of each country.
+
+    Args:
+        connection: An open SQLAlchemy connection or session.
+        country_names: Optional iterable of country names, or None for
+            every country.
+    Returns:
+        A dictionary of country name to row version.
+    """
+    query = db.select(
+        TourismArrivals.Country_Name, TourismArrivals.Row_Version
+    )
+    if country_names is not None:
+        query = query.where(
+            TourismArrivals.Country_Name.in_(list(country_names))
+        )
+    return dict(connection.execute(query).all())
+
+
+def build_records(metadata_records, observations, years):
+    """
+    Combine metadata and observations into serialized country records.
+
+    Args:
+        metadata_records: Serialized dictionaries of METADATA_KEYS.
+        observations: (country name, year, value) rows.
+        years: The years to give every record a year_XXXX key for.
+    Returns:
+        A list of serialized country dictionaries, in the same order as
+        metadata_records and with the same keys as the schema output.
+    """
+    values = {}
+    for country_name, year, value in observations:
+        values.setdefault(country_name, {})[year] = value
+
+    year_keys = [(year, f"year_{year}") for year in years]
+    records = []
+    for metadata in metadata_records:
+        by_year = values.get(metadata["Country_Name"], {})
+        record = {key: metadata[key] for key in LEADING_KEYS}
+        for year, key in year_keys:
+            value = by_year.get(year)
+            record[key] = None if value is None else int(value)
+        for key in TRAILING_KEYS:
+            record[key] = metadata[key]
+        records.append(record)
+    return records
+
+
+def load_records(connection, metadata_query=None, years=None):
+    """
+    Load serialized country records for a metadata query.
+
+    Args:
+        connection: An open SQLAlchemy connection or session.
+        metadata_query: Optional statement from get_metadata_serializer()
+            with filters, ordering or a limit applied, or None for
+            every country.
+        years: Optional years to include, defaults to get_year_axis().
+    Returns:
+        A list of serialized country dictionaries.
+    """
+    names = None
+    if years is None:
+        years = get_year_axis(connection)
+    if metadata_query is None:
+        metadata_query = get_metadata_serializer().statement
+    metadata_records = get_metadata_serializer().dump_rows(
+        connection.execute(metadata_query)
+    )
+    # Only filter the observations if the metadata query was filtered
+    if metadata_query is not get_metadata_serializer().statement:
+        names = [record["Country_Name"] for record in metadata_records]
+    observations = load_observations(connection, names)
+    return build_records(metadata_records, observations, years)
+
+
+def write_observations(session, country_name, indicator_name, values):
+    """
+    Insert, update or delete observations of one country's indicator.
+
+    Used for years that have no column in the wide table, the legacy
+    years are written through TourismArrivals and mirrored by triggers.
+
+    Args:
+        session: The SQLAlchemy session of the current transaction.
+        country_name (str): The name of the country.
+        indicator_name (str): The indicator of the values.
+        values (dict): Maps year (int) to value, None to delete.
+    Returns:
+        None
+    """
+    options = {CHANGED_COUNTRIES_OPTION: (country_name,)}
+    to_delete = [year for year, value in values.items() if value is None]
+    upsert_observations(
+        session,
+        [
+            (country_name, indicator_name, year, value)
+            for year, value in values.items()
+            if value is not None
+        ],
+    )
+    table = TourismObservation.__table__
+    if to_delete:
+        session.execute(
+            db.delete(table).where(
+                table.c["Country Name"] == country_name,
+                table.c["Indicator Name"] == indicator_name,
+                table.c["Year"].in_(to_delete),
+            ),
+            execution_options=options,
+        )
+
+
+def upsert_observations(session, observations):
+    """
+    Insert or update many observations in one executemany statement.
+
+    Args:
+        session: The SQLAlchemy session of the current transaction.
+        observations: List of (country name, indicator name, year,
+            value) tuples.
+    Returns:
+        None
+    """
+    if not observations:
+        return
+    table = TourismObservation.__table__
+    statement = insert(table)
+    session.execute(
+        statement.on_conflict_do_update(
+            index_elements=[
+                table.c["Country Name"],
+                table.c["Indicator Name"],
+                table.c["Year"],
+            ],
+            set_={"Value": statement.excluded["Value"]},
+        ),
+        [
+            {
+                "Country Name": country_name,
+                "Indicator Name": indicator_name,
+                "Year": year,
+                "Value": value,
+            }
+            for country_name, indicator_name, year, value in observations
+        ],
+        execution_options={
+            CHANGED_COUNTRIES_OPTION: {row[0] for row in observations}
+        },
+    )
+
+
+def delete_observations(session, keys):
+    """
+    Delete many observations in one DELETE statement.
+
+    Args:
+        session: The SQLAlchemy session of the current transaction.
+        keys: List of (country name, indicator name, year) tuples.
+    Returns:
+        None
+    """
+    if not keys:
+        return
+    table = TourismObservation.__table__
+    session.execute(
+        db.delete(table).where(
+            tuple_(
+                table.c["Country Name"],
+                table.c["Indicator Name"],
+                table.c["Year"],
+            ).in_(keys)
+        ),
+        execution_options={
+            CHANGED_COUNTRIES_OPTION: {key[0] for key in keys}
+        },
+    )
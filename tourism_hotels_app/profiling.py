@@ -0,0 +1,300 @@
+"""File containing the opt-in profiling of single requests.
+
+With PROFILING_ENABLED set in the config, any request sent with the
+PROFILING_HEADER (X-Profile by default) gets a Server-Timing header
+saying where its time went, in milliseconds:
+
+- sql: time spent executing statements, on both engines, with how many
+  statements ran, from SQLAlchemy's cursor events
+- serialize: JSON encoding, by jsonify() and dumps_json()
+- validation: checking the JSON of a POST or PATCH with the validator
+  compiled from the model (see validation.py)
+- render: rendering Jinja templates
+- app: the rest, e.g. ORM hydration, waiting for the write lock and
+  the route's own logic
+- total: from the start of the request to its response
+
+Sending the header with the value "cprofile" also runs the request
+under cProfile and saves the stats to PROFILING_DUMP_DIR, naming the
+file in the X-Profile-Dump response header, to read with pstats or
+snakeviz. Python 3.12 and later only run one profiler at a time, so a
+request asking for cProfile while another one runs only gets its
+timings, without a dump.
+
+Only the work done before the response is returned is measured, so a
+streamed body such as /api/countries/export is not included. Without
+the flag no hook, event or JSON provider is registered. The phases
+timed in other modules (see profile_phase()) then cost a check of one
+module flag, as long as no app in the process has profiling enabled.
+"""
+import cProfile
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from flask import (
+    before_render_template,
+    g,
+    has_request_context,
+    request,
+    template_rendered,
+)
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import event
+from tourism_hotels_app import db
+
+# Value of the profiling header asking for a cProfile dump as well
+CPROFILE_VALUE = "cprofile"
+
+# Response header naming the saved cProfile dump
+DUMP_HEADER = "X-Profile-Dump"
+
+# Phases reported before app and total, in this order, if they ran
+PHASES = ("sql", "serialize", "validation", "render")
+
+# Set once an app with PROFILING_ENABLED is created, until then
+# profile_phase() does not look for a request profile at all
+_profiling_enabled = False
+
+# Reused by every phase that is not profiled, nullcontext is reentrant
+_NOT_PROFILED = nullcontext()
+
+
+class RequestProfile:
+    """
+    The timings of one profiled request.
+
+    Attributes:
+        start (float): perf_counter() when the request started.
+        phases (dict): Phase name to the seconds spent in it.
+        sql_count (int): How many statements were executed.
+        profiler: The cProfile.Profile running for the request, or None.
+    """
+
+    def __init__(self):
+        """Start timing a request."""
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.sql_count = 0
+        self.profiler = None
+
+    def add(self, phase, seconds):
+        """
+        Add time to a phase.
+
+        Args:
+            phase (str): The name of the phase.
+            seconds (float): The time spent in it.
+        Returns:
+            None
+        """
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def server_timing(self):
+        """
+        Format the timings as a Server-Timing header value.
+
+        Args:
+            None
+        Returns:
+            The header value, e.g. 'sql;dur=1.20;desc="3 statements",
+            app;dur=0.40, total;dur=1.60'.
+        """
+        total = time.perf_counter() - self.start
+        metrics = [
+            f'sql;dur={self.phases.get("sql", 0.0) * 1000:.2f};'
+            f'desc="{self.sql_count} statements"'
+        ]
+        metrics += [
+            f"{phase};dur={self.phases[phase] * 1000:.2f}"
+            for phase in PHASES[1:]
+            if phase in self.phases
+        ]
+        # Whatever was not measured is the app's own time
+        other = max(total - sum(self.phases.values()), 0.0)
+        metrics.append(f"app;dur={other * 1000:.2f}")
+        metrics.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(metrics)
+
+
+class ProfilingJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, timing jsonify() as the serialize phase."""
+
+    def dumps(self, obj, **kwargs):
+        """
+        Encode obj as JSON, as DefaultJSONProvider does.
+
+        Args:
+            obj: Any JSON serializable Python object.
+            **kwargs: Passed on to json.dumps().
+        Returns:
+            The encoded JSON as str.
+        """
+        with profile_phase("serialize"):
+            return super().dumps(obj, **kwargs)
+
+
+def get_request_profile():
+    """
+    Get the profile of the current request.
+
+    Args:
+        None
+    Returns:
+        The RequestProfile, or None if the request is not profiled or
+        there is no request.
+    """
+    if not has_request_context():
+        return None
+    return g.get("request_profile")
+
+
+@contextmanager
+def _timed(profile, phase):
+    """
+    Sub-helper function timing the with block as a phase of profile.
+
+    Args:
+        profile (RequestProfile): The profile to add the time to.
+        phase (str): The name of the phase.
+    Returns:
+        None
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add(phase, time.perf_counter() - start)
+
+
+def profile_phase(phase):
+    """
+    Time a with block as a phase of the request, if it is profiled.
+
+    Args:
+        phase (str): The name of the phase, one of PHASES.
+    Returns:
+        A context manager, doing nothing if the request is not profiled.
+    """
+    if not _profiling_enabled:
+        return _NOT_PROFILED
+    profile = get_request_profile()
+    if profile is None:
+        return _NOT_PROFILED
+    return _timed(profile, phase)
+
+
+def before_cursor_execute(
+    conn, cursor, statement, parameters, context, executemany
+):
+    """Note when a statement started, on the connection."""
+    conn.info.setdefault("profiling_start", []).append(time.perf_counter())
+
+
+def after_cursor_execute(
+    conn, cursor, statement, parameters, context, executemany
+):
+    """Add a finished statement to the request's profile."""
+    start = conn.info["profiling_start"].pop()
+    profile = get_request_profile()
+    if profile is not None:
+        profile.add("sql", time.perf_counter() - start)
+        profile.sql_count += 1
+
+
+def start_render(sender, template, context, **extra):
+    """Note when a template started rendering."""
+    if get_request_profile() is not None:
+        g.render_start = time.perf_counter()
+
+
+def end_render(sender, template, context, **extra):
+    """Add a rendered template to the request's profile."""
+    profile = get_request_profile()
+    if profile is not None and "render_start" in g:
+        profile.add("render", time.perf_counter() - g.pop("render_start"))
+
+
+def get_dump_directory(app):
+    """
+    Get the directory cProfile dumps are saved to, creating it.
+
+    Args:
+        app: Flask app application instance
+    Returns:
+        PROFILING_DUMP_DIR, or the profiles folder of the instance path
+        if it is not set.
+    """
+    directory = app.config.get("PROFILING_DUMP_DIR") or (
+        Path(app.instance_path) / "profiles"
+    )
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory
+
+
+def init_profiling(app):
+    """
+    Profile the requests that ask for it, if PROFILING_ENABLED is set.
+
+    Must be called inside the app context, so both engines exist.
+
+    Args:
+        app: Flask app application instance
+    Returns:
+        None
+    """
+    global _profiling_enabled
+    if not app.config.get("PROFILING_ENABLED"):
+        return
+    _profiling_enabled = True
+    header = app.config.get("PROFILING_HEADER", "X-Profile")
+
+    # Time every statement of the writer and reader engines
+    for engine in db.engines.values():
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    before_render_template.connect(start_render, app)
+    template_rendered.connect(end_render, app)
+    app.json = ProfilingJSONProvider(app)
+
+    @app.before_request
+    def start_profile():
+        """Start profiling the request, if it has the header."""
+        value = request.headers.get(header)
+        if value is None:
+            return
+        g.request_profile = RequestProfile()
+        if value.strip().lower() == CPROFILE_VALUE:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another request is under cProfile, which Python 3.12
+                # and later refuse, so this one is only timed
+                return
+            g.request_profile.profiler = profiler
+
+    @app.after_request
+    def finish_profile(response):
+        """Add the timings to the response, and save any cProfile dump."""
+        profile = g.pop("request_profile", None)
+        if profile is None:
+            return response
+        if profile.profiler is not None:
+            profile.profiler.disable()
+            file_name = (
+                f"{time.strftime('%Y%m%d-%H%M%S')}-{request.method}-"
+                f"{request.endpoint}-{uuid.uuid4().hex[:8]}.prof"
+            )
+            profile.profiler.dump_stats(get_dump_directory(app) / file_name)
+            response.headers[DUMP_HEADER] = file_name
+        response.headers["Server-Timing"] = profile.server_timing()
+        return response
+
+    @app.teardown_request
+    def stop_profile(error=None):
+        """Stop cProfile if the request failed before its response."""
+        profile = g.pop("request_profile", None)
+        if profile is not None and profile.profiler is not None:
+            profile.profiler.disable()
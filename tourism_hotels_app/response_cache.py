@@ -0,0 +1,62 @@
+"""File containing the cache of pre-serialized JSON response payloads."""
+import hashlib
+import threading
+from collections import namedtuple
+from tourism_hotels_app.serializers import dumps_json
+from tourism_hotels_app.metrics import metrics
+
+# One cached payload: the data, its encoded JSON bytes and a strong ETag
+CachedPayload = namedtuple(
+    "CachedPayload", ["generation", "data", "body", "etag"]
+)
+
+
+class PayloadCache:
+    """
+    Keeps encoded JSON payloads until the write generation changes.
+
+    Each entry is stored under a name together with the generation it
+    was built for. A request for a newer generation rebuilds the entry,
+    so a write never has to reach into the cache to invalidate it.
+
+    Methods:
+        get(): Returns the cached payload, building it if it is stale.
+    """
+
+    def __init__(self):
+        """Create an empty cache."""
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, name, load):
+        """
+        Get the cached payload for a name, rebuilding it if out of date.
+
+        Args:
+            name (str): The name of the cache entry, e.g. "countries".
+            load: Function returning a (generation, data) tuple for
+                the current state of the data.
+        Returns:
+            A CachedPayload for the current generation.
+        """
+        generation, data = load()
+        entry = self._entries.get(name)
+        if entry is not None and entry.generation >= generation:
+            metrics.inc(
+                "tourism_response_cache_requests_total",
+                (("cache", f"payload:{name}"), ("result", "hit")),
+            )
+            return entry
+        with self._lock:
+            # Another thread may have rebuilt it while we waited
+            entry = self._entries.get(name)
+            if entry is None or entry.generation < generation:
+                body = dumps_json(data)
+                etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+                entry = CachedPayload(generation, data, body, etag)
+                self._entries[name] = entry
+        metrics.inc(
+            "tourism_response_cache_requests_total",
+            (("cache", f"payload:{name}"), ("result", "miss")),
+        )
+        return entry
@@ -1,30 +1,38 @@
 """File containing blueprint of routes to get data in various ways."""
 from flask import (
+    current_app,
     make_response,
     jsonify,
+    request,
+    url_for,
     Blueprint,
 )
-from tourism_hotels_app import db
 
-# Import created Schemas from the schemas.py
-from tourism_hotels_app.schemas import TourismArrivalsSchema
-from tourism_hotels_app.models import TourismArrivals
-from sqlalchemy import desc
+# Import the fast JSON encoder used for read responses
+from tourism_hotels_app.serializers import dumps_json
+from tourism_hotels_app.storage import get_reader_engine
+from tourism_hotels_app.export import EXPORT_FORMATS, prime_export
+from tourism_hotels_app.search import MAX_RESULTS
 
 # Import helper functions from utilities file,
 # containing error handling and major functions for routes
-from tourism_hotels_app.utilities import get_country, get_countries, get_year
+from tourism_hotels_app.utilities import (
+    get_countries_payload,
+    get_countries_page,
+    get_year,
+    get_year_range,
+    get_countries_in_group,
+    get_group_totals,
+    get_top_countries,
+    get_ranking,
+    get_search_results,
+    get_versioned_country,
+    is_whole_number,
+)
 
 # Blueprint
 obtain_data_api_bp = Blueprint("api_obtain_data", __name__, url_prefix="/api")
 
-# Schemas
-# Import Marshmallow SQLAlchemy schemas and create instances of each
-# First for multiple results (i.e. for all countries).
-countries_schema = TourismArrivalsSchema(many=True)
-# For one country
-country_schema = TourismArrivalsSchema()
-
 
 @obtain_data_api_bp.get("/countries")
 def get_all_countries():
@@ -33,21 +41,164 @@ def get_all_countries():
 
     All international tourism details returned in JSON format,
     including data from every column.
+    The encoded JSON is cached until the next write and sent with a
+    strong ETag, so a matching If-None-Match gets a 304 with no body.
+    If a `limit` or `cursor` query parameter is given, one page of
+    countries is returned instead, see get_countries_by_page().
     Args:
         None
 
     Returns:
         response_all_countries: A JSON response object containing a
-        list of countries and their international tourism details
+        list of countries and their international tourism details,
+        or an empty 304 Not Modified response.
     """
-    # Use helper function from utilities.py to get JSON of all countries
-    all_countries = get_countries()
+    # Return a single page if the client asked for pagination
+    if "limit" in request.args or "cursor" in request.args:
+        return get_countries_by_page()
+
+    # Use helper function from utilities.py to get the cached JSON
+    all_countries = get_countries_payload()
 
     # Create a response object with JSON data and status code of 200
-    response_all_countries = make_response(all_countries, 200)
+    response_all_countries = make_response(all_countries.body, 200)
     # Set the Content-Type header to application/json
     response_all_countries.headers["Content-Type"] = "application/json"
-    return response_all_countries
+    # Set the ETag and turn into a 304 if the client already has it
+    response_all_countries.set_etag(all_countries.etag)
+    return response_all_countries.make_conditional(request)
+
+
+def get_countries_by_page():
+    """
+    Return one page of countries using keyset pagination.
+
+    Query parameters:
+        limit (int): Page size, between 1 and API_PAGE_MAX_LIMIT,
+            defaults to API_PAGE_DEFAULT_LIMIT.
+        cursor (str): The `next` cursor of the previous page.
+
+    Args:
+        None
+
+    Returns:
+        response: - A JSON response with the page `data` and a `next`
+                    link (null on the last page), also sent as a Link
+                    header, with status code 200.
+                  - Or an error message JSON with status code 400 for
+                    an invalid limit or cursor.
+    """
+    max_limit = current_app.config["API_PAGE_MAX_LIMIT"]
+    limit = request.args.get("limit", "")
+    cursor = request.args.get("cursor")
+    try:
+        # Use the default page size if no limit was given
+        if limit == "":
+            limit = current_app.config["API_PAGE_DEFAULT_LIMIT"]
+        elif not is_whole_number(limit) or not 1 <= int(limit) <= max_limit:
+            raise ValueError(
+                f"limit must be an integer between 1 and {max_limit}"
+            )
+        limit = int(limit)
+        # Use helper function from utilities.py to get the page
+        countries_page, next_cursor = get_countries_page(limit, cursor)
+    # If an invalid limit or cursor is passed, return a 400 error
+    except ValueError as value_error_message:
+        message = jsonify(
+            {
+                "status": 400,
+                "error": "Bad Request",
+                "message": str(value_error_message),
+            }
+        )
+        response = make_response(message, 400)
+        response.headers["Content-Type"] = "application/json"
+        return response
+
+    # Build the link to the next page, if there is one
+    next_link = None
+    if next_cursor is not None:
+        next_link = url_for(
+            "api_obtain_data.get_all_countries",
+            limit=limit,
+            cursor=next_cursor,
+        )
+    response = make_response(
+        dumps_json({"data": countries_page, "next": next_link}), 200
+    )
+    response.headers["Content-Type"] = "application/json"
+    if next_link is not None:
+        response.headers["Link"] = f'<{next_link}>; rel="next"'
+    return response
+
+
+@obtain_data_api_bp.get("/countries/export")
+def export_countries():
+    """
+    Stream every country as NDJSON or CSV, in constant memory.
+
+    Countries are fetched EXPORT_CHUNK_SIZE at a time and each chunk
+    is sent before the next one is fetched. The output is gzipped if
+    the client accepts it.
+
+    Query parameters:
+        format (str): ndjson (default) or csv.
+        fields (str): Optional comma separated keys to export, e.g.
+            Country_Name,year_2019,year_2020, in the order wanted.
+
+    Args:
+        None
+
+    Returns:
+        response: - A streamed response of the countries, ordered by
+                    name, with status code 200.
+                  - Or an error message JSON with status code 400 for
+                    an unknown format or field.
+    """
+    export_format = request.args.get("format", "ndjson")
+    fields = [
+        field
+        for value in request.args.getlist("fields")
+        for field in value.split(",")
+        if field
+    ]
+    compress = request.accept_encodings.quality("gzip") > 0
+    try:
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(
+                f"format must be one of: {', '.join(EXPORT_FORMATS)}"
+            )
+        # Use helper function from export.py to check the fields and
+        # get the generator streaming the export
+        export = prime_export(
+            get_reader_engine(),
+            export_format,
+            fields,
+            current_app.config["EXPORT_CHUNK_SIZE"],
+            compress,
+        )
+    # If an invalid format or field is passed, return a 400 error
+    except ValueError as value_error_message:
+        message = jsonify(
+            {
+                "status": 400,
+                "error": "Bad Request",
+                "message": str(value_error_message),
+            }
+        )
+        response = make_response(message, 400)
+        response.headers["Content-Type"] = "application/json"
+        return response
+
+    response = make_response(export, 200)
+    response.headers["Content-Type"] = EXPORT_FORMATS[export_format]
+    response.headers["Content-Disposition"] = (
+        f"attachment; filename=tourism_arrivals.{export_format}"
+    )
+    response.vary.add("Accept-Encoding")
+    if compress:
+        response.headers["Content-Encoding"] = "gzip"
+    return response
 
 
 @obtain_data_api_bp.get("/countries/country/<country_name>")
@@ -61,21 +212,26 @@ def by_country(country_name):
 
     Returns:
         response: - A JSON response with details for the specified
-                    country, if it exists in database.
-                  - Status code of 200 for OK (success), or 404 for
-                    Not Found (failure).
+                    country, if it exists in database, with the
+                    country's row version as its ETag.
+                  - Status code of 200 for OK (success), 304 for Not
+                    Modified if If-None-Match has the current ETag, or
+                    404 for Not Found (failure).
 
     Also returns status code of 200 for OK (success).
 
     """
     # Get data for specified country using helper in utilities.py
-    country_result = get_country(country_name)
+    country_result, etag = get_versioned_country(country_name)
 
     # If the country exists, return a response with the data,
     # and a status code of 200
     if country_result:
-        response = make_response(country_result, 200)
+        response = make_response(dumps_json(country_result), 200)
         response.headers["Content-Type"] = "application/json"
+        # Set the ETag and turn into a 304 if the client already has it
+        response.set_etag(etag)
+        response = response.make_conditional(request)
     # If the country does not exist, return a response with an error
     # message and a status code of 404
     else:
@@ -91,6 +247,68 @@ def by_country(country_name):
     return response
 
 
+@obtain_data_api_bp.get("/countries/search")
+def search_countries():
+    """
+    Return the countries matching a name or code, for autocomplete.
+
+    Served from an in-memory index of the snapshot (see search.py),
+    kept current on every write, so the database is not queried.
+
+    Query parameters:
+        q (str): The start of a country's name, of a later word of it
+            or of its code, e.g. "united", "kingdom" or "gb". Case,
+            accents and a few typos are allowed.
+        limit (int): How many countries to return, between 1 and
+            MAX_RESULTS, defaults to API_SEARCH_DEFAULT_LIMIT.
+
+    Args:
+        None
+
+    Returns:
+        response: - A JSON response with the `query` and `data`, a
+                    list of the matching countries, best first, with
+                    status code 200.
+                  - Or an error message JSON with status code 400 for
+                    a missing query or an invalid limit.
+    """
+    query = request.args.get("q", "")
+    limit = request.args.get("limit", "")
+    try:
+        if not query.strip():
+            raise ValueError("q must be the start of a name or code")
+        # Use the default number of results if no limit was given
+        if limit == "":
+            limit = current_app.config["API_SEARCH_DEFAULT_LIMIT"]
+        elif (
+            not is_whole_number(limit) or not 1 <= int(limit) <= MAX_RESULTS
+        ):
+            raise ValueError(
+                f"limit must be an integer between 1 and {MAX_RESULTS}"
+            )
+        limit = int(limit)
+    # If a parameter is missing or invalid, return a 400 error
+    except ValueError as value_error_message:
+        message = jsonify(
+            {
+                "status": 400,
+                "error": "Bad Request",
+                "message": str(value_error_message),
+            }
+        )
+        response = make_response(message, 400)
+        response.headers["Content-Type"] = "application/json"
+        return response
+
+    # Use helper function from utilities.py to search the index
+    search_results = get_search_results(query, limit)
+    response = make_response(
+        dumps_json({"query": query, "data": search_results}), 200
+    )
+    response.headers["Content-Type"] = "application/json"
+    return response
+
+
 @obtain_data_api_bp.get("/filterby/year/<chosen_year>")
 def by_year(chosen_year):
     """
@@ -114,7 +332,7 @@ def by_year(chosen_year):
         year_result = get_year(chosen_year)
 
         # Make response with year JSON data and success status code
-        response = make_response(year_result, 200)
+        response = make_response(dumps_json(year_result), 200)
         response.headers["Content-Type"] = "application/json"
         return response
     # If an invalid year is passed, return a 404 error JSON message
@@ -131,6 +349,201 @@ def by_year(chosen_year):
         return response
 
 
+@obtain_data_api_bp.get("/filterby/years")
+def by_year_range():
+    """
+    Return a JSON matrix of countries x years for a range of years.
+
+    Replaces one /filterby/year/<year> request per year with a single
+    request, answered from one slice of the snapshot's year matrix.
+
+    Query parameters:
+        from (int): The first year, defaults to the first year of data.
+        to (int): The last year, defaults to the last year of data.
+        countries (str): Optional country name or code, repeat the
+            parameter for more than one country.
+
+    Args:
+        None
+
+    Returns:
+        response: - A JSON response with `years`, `countries` and
+                    `values`, where values[i][j] is the arrivals of
+                    countries[i] in years[j] (null if missing), and a
+                    status code of 200 for OK (success).
+                  - Or an error message JSON with status code of 400
+                    for invalid parameters or 404 if there is no data
+                    for the years.
+    """
+    countries = request.args.getlist("countries") or None
+    try:
+        first_year = request.args.get("from", "0")
+        last_year = request.args.get("to", "9999")
+        if not (is_whole_number(first_year) and is_whole_number(last_year)):
+            raise ValueError("from and to must be years")
+        # Use helper function from utilities.py to get the matrix
+        year_range_result = get_year_range(
+            int(first_year), int(last_year), countries
+        )
+    # If an invalid year, range or country is passed, return a 400 error
+    except ValueError as value_error_message:
+        message = jsonify(
+            {
+                "status": 400,
+                "error": "Bad Request",
+                "message": str(value_error_message),
+            }
+        )
+        response = make_response(message, 400)
+        response.headers["Content-Type"] = "application/json"
+        return response
+    # If there is no data for the years, return a 404 error
+    except AttributeError:
+        message = jsonify(
+            {
+                "status": 404,
+                "error": "Not found",
+                "message": "Invalid resource URI: Invalid year",
+            }
+        )
+        response = make_response(message, 404)
+        response.headers["Content-Type"] = "application/json"
+        return response
+
+    response = make_response(dumps_json(year_range_result), 200)
+    response.headers["Content-Type"] = "application/json"
+    return response
+
+
+def group_response(group_key, group):
+    """
+    Sub-helper function making the response of a group filter.
+
+    Args:
+        group_key (str): "region" or "income", see GROUP_COLUMNS.
+        group (str): The region or income group passed in the URI.
+
+    Returns:
+        response: - A JSON response containing the countries of the
+                    group and a status code of 200 for OK (success).
+                  - Or an error message JSON with status code of 404
+                    if no country is in the group.
+    """
+    # Use helper function from utilities.py to query the group's index
+    group_result = get_countries_in_group(group_key, group)
+    if not group_result:
+        message = jsonify(
+            {
+                "status": 404,
+                "error": "Not found",
+                "message": f"Invalid resource URI: Invalid {group_key}",
+            }
+        )
+        response = make_response(message, 404)
+        response.headers["Content-Type"] = "application/json"
+        return response
+
+    response = make_response(dumps_json(group_result), 200)
+    response.headers["Content-Type"] = "application/json"
+    return response
+
+
+@obtain_data_api_bp.get("/filterby/region/<region>")
+def by_region(region):
+    """
+    Return a JSON response of all countries in a region.
+
+    Args:
+        region (str): The region passed in the URI to filter the data
+        by, e.g. "South Asia".
+
+    Returns:
+        response: - A JSON response containing the countries of the
+                    region in name order, with all their details, and
+                    a status code of 200 for OK (success).
+                  - Or an error message JSON with status code of 404
+                    for not found.
+    """
+    return group_response("region", region)
+
+
+@obtain_data_api_bp.get("/filterby/income/<income_group>")
+def by_income_group(income_group):
+    """
+    Return a JSON response of all countries in an income group.
+
+    Args:
+        income_group (str): The income group passed in the URI to
+        filter the data by, e.g. "High income".
+
+    Returns:
+        response: - A JSON response containing the countries of the
+                    income group in name order, with all their details,
+                    and a status code of 200 for OK (success).
+                  - Or an error message JSON with status code of 404
+                    for not found.
+    """
+    return group_response("income", income_group)
+
+
+@obtain_data_api_bp.get("/aggregate")
+def aggregate_by_group():
+    """
+    Return JSON of one year's arrivals summed and averaged per group.
+
+    Saves clients from downloading every country to group them.
+
+    Query parameters:
+        by (str): region or income.
+        year (int): The year to aggregate.
+
+    Args:
+        None
+
+    Returns:
+        response: - A JSON response with `by`, `year` and `data`, a
+                    list with the `sum`, `mean` and `count` of the
+                    arrivals of each group's countries with a value,
+                    and a status code of 200 for OK (success).
+                  - Or an error message JSON with status code of 400
+                    for invalid parameters or 404 if there is no data
+                    for the year.
+    """
+    try:
+        # Use helper function from utilities.py to get the totals
+        aggregate_result = get_group_totals(
+            request.args.get("by"), request.args.get("year")
+        )
+    # If an invalid parameter is passed, return a 400 error
+    except ValueError as value_error_message:
+        message = jsonify(
+            {
+                "status": 400,
+                "error": "Bad Request",
+                "message": str(value_error_message),
+            }
+        )
+        response = make_response(message, 400)
+        response.headers["Content-Type"] = "application/json"
+        return response
+    # If there is no data for the year, return a 404 error
+    except AttributeError:
+        message = jsonify(
+            {
+                "status": 404,
+                "error": "Not found",
+                "message": "Invalid resource URI: Invalid year",
+            }
+        )
+        response = make_response(message, 404)
+        response.headers["Content-Type"] = "application/json"
+        return response
+
+    response = make_response(dumps_json(aggregate_result), 200)
+    response.headers["Content-Type"] = "application/json"
+    return response
+
+
 @obtain_data_api_bp.get("/top-10-countries")
 def top_countries():
     """
@@ -150,24 +563,8 @@ def top_countries():
 
     """
     # Get top 10 countries based on average tourist arrivals in the
-    # last 10 recorded years
-    top_10_countries = (
-        db.session.query(
-            TourismArrivals.Country_Name,
-            TourismArrivals.Average_10year_in_tourist_arrivals,
-        )
-        .group_by(TourismArrivals.Country_Name)
-        .order_by(desc(TourismArrivals.Average_10year_in_tourist_arrivals))
-        .limit(10)
-        .all()
-    )
-
-    # Create a dictionary with each country and its average data
-    result = {"data": []}
-    for country in top_10_countries:
-        result["data"].append(
-            {"Country_Name": country[0], "Max_number_of_arrivals": country[1]}
-        )
+    # last 10 recorded years, ranked numerically from the snapshot
+    top_10_countries = get_top_countries(10)
 
     # Create a JSON response message of the data above
     success_message = jsonify(
@@ -185,3 +582,67 @@ def top_countries():
     response = make_response(success_message, 200)
     response.headers["Content-Type"] = "application/json"
     return response
+
+
+@obtain_data_api_bp.get("/top")
+def top_by_metric():
+    """
+    Return JSON of the countries ranked by a metric.
+
+    Rankings are kept sorted in memory and only the changed countries
+    are moved when data is added or edited, so the response does not
+    sort the table on every request.
+
+    Query parameters:
+        metric (str): average (default), max, min, percent_drop or
+            arrivals.
+        year (int): The year to rank, required for arrivals.
+        n (int): How many countries to return, defaults to 10.
+        order (str): desc (default) for the highest values first, or
+            asc for the lowest.
+
+    Args:
+        None
+
+    Returns:
+        response: - A JSON response with `metric`, `year`, `order` and
+                    `data`, a list of countries with their rank and
+                    value, and a status code of 200 for OK (success).
+                  - Or an error message JSON with status code of 400
+                    for invalid parameters.
+    """
+    metric = request.args.get("metric", "average")
+    year = request.args.get("year")
+    number = request.args.get("n", "10")
+    order = request.args.get("order", "desc")
+    try:
+        if not is_whole_number(number) or int(number) < 1:
+            raise ValueError("n must be a positive integer")
+        if order not in ("asc", "desc"):
+            raise ValueError("order must be asc or desc")
+        # Use helper function from utilities.py to get the ranking
+        ranking_result = get_ranking(
+            metric, int(number), year, descending=order == "desc"
+        )
+    # If an invalid parameter is passed, return a 400 error
+    except ValueError as value_error_message:
+        message = jsonify(
+            {
+                "status": 400,
+                "error": "Bad Request",
+                "message": str(value_error_message),
+            }
+        )
+        response = make_response(message, 400)
+        response.headers["Content-Type"] = "application/json"
+        return response
+
+    success_message = {
+        "metric": metric,
+        "year": int(year) if metric == "arrivals" else None,
+        "order": order,
+        "data": ranking_result,
+    }
+    response = make_response(dumps_json(success_message), 200)
+    response.headers["Content-Type"] = "application/json"
+    return response
@@ -1,30 +1,34 @@
 """File containing blueprint of routes to post and patch data in RESTAPI."""
-from flask import make_response, jsonify, Blueprint
+from flask import current_app, make_response, jsonify, request, Blueprint
 from sqlalchemy.exc import IntegrityError
-from marshmallow.exceptions import ValidationError
+from sqlalchemy.orm.exc import StaleDataError
 from werkzeug.exceptions import BadRequest
 from tourism_hotels_app import db
-from tourism_hotels_app.models import TourismArrivals
+from tourism_hotels_app.storage import hold_write_lock
+from tourism_hotels_app.bulk_patch import patch_countries
+from tourism_hotels_app.bulk_ingest import (
+    ingest_countries,
+    iter_json_array,
+    iter_ndjson,
+)
 
 # Import helper functions from utilities file,
 # containing error handling and major functions for routes
 from tourism_hotels_app.utilities import (
+    add_new_years,
     create_country_format,
-    get_updated_country
+    get_updated_country,
+    get_versioned_country,
 )
 
-# Import created Schemas from the schemas.py
-from tourism_hotels_app.schemas import TourismArrivalsSchema
+# Content types read as one JSON object per line by the bulk route
+NDJSON_MIMETYPES = ("application/x-ndjson", "application/jsonl")
 
 # Blueprint
 update_data_api_bp = Blueprint("api_update_data", __name__, url_prefix="/api")
-
-# Schemas
-# Import Marshmallow SQLAlchemy schemas and create instances of each
-# Create instance for multiple results (i.e. for many/all countries).
-countries_schema = TourismArrivalsSchema(many=True)
-# Create instance for one country
-country_schema = TourismArrivalsSchema()
+# Only this blueprint writes, through db.session and the writer engine.
+# Its writes run one at a time, each holding the write lock from after
+# the request body is read until the commit (see storage.py)
 
 
 @update_data_api_bp.post("/countries")
@@ -50,15 +54,22 @@ def add_country():
     try:
         # Use helper function from utilties.py to attempt to create a
         # new country based on request JSON body entered
-        new_country_format = create_country_format()
-        # Add new country row to database and commit changes
-        db.session.add(new_country_format)
-        db.session.commit()
+        new_country_format, new_years = create_country_format(
+            request.get_json()
+        )
+        # Add new country row to database and commit changes,
+        # the commit also patches the read snapshot (see snapshot.py)
+        with hold_write_lock():
+            db.session.add(new_country_format)
+            add_new_years(new_country_format, new_years)
+            new_country_name = new_country_format.Country_Name
+            db.session.commit()
 
         # Make the JSON response of the successful post with status code
-        result = country_schema.jsonify(new_country_format)
-        response = make_response(result, 201)
+        new_country, etag = get_versioned_country(new_country_name)
+        response = make_response(jsonify(new_country), 201)
         response.headers["Content-Type"] = "application/json"
+        response.set_etag(etag)
     # Catch error if the Country_Name key's value already exists
     except IntegrityError:
         # Rollback session to undo changes, if error
@@ -122,37 +133,175 @@ def add_country():
     return response
 
 
+@update_data_api_bp.post("/countries/bulk")
+def add_countries_in_bulk():
+    """
+    Add many new countries from one streamed request body.
+
+    The body is either NDJSON (Content-Type application/x-ndjson),
+    one country per line, or a JSON array of countries (Content-Type
+    application/json). Each country is validated like a POST to
+    /api/countries, and countries are inserted in chunks of
+    BULK_INGEST_CHUNK_SIZE, one transaction per chunk.
+
+    Args:
+        None
+
+    Returns:
+        response: - A JSON report with the number of countries
+                    `received`, `inserted` and `failed`, and `errors`
+                    listing each failed country by its position in the
+                    body. The status code is 201 if every country was
+                    inserted, 200 if only some were and 400 if none
+                    were.
+                  - Or an error message JSON with status code 415 for
+                    an unsupported content type.
+    """
+    if request.mimetype in NDJSON_MIMETYPES:
+        records = iter_ndjson(request.stream)
+    elif request.mimetype == "application/json":
+        records = iter_json_array(request.stream)
+    else:
+        message = jsonify(
+            {
+                "status": 415,
+                "error": "Unsupported Media Type",
+                "message": "Send application/x-ndjson or a JSON array "
+                           "as application/json.",
+            }
+        )
+        response = make_response(message, 415)
+        response.headers["Content-Type"] = "application/json"
+        return response
+
+    # Use helper function from bulk_ingest.py to insert the countries,
+    # which holds the write lock for each chunk, not while reading
+    report = ingest_countries(
+        records, current_app.config["BULK_INGEST_CHUNK_SIZE"]
+    )
+    if report["failed"] == 0 and report["inserted"] > 0:
+        status_code = 201
+    elif report["inserted"] > 0:
+        status_code = 200
+    else:
+        status_code = 400
+    response = make_response(jsonify(report), status_code)
+    response.headers["Content-Type"] = "application/json"
+    return response
+
+
+@update_data_api_bp.patch("/countries")
+def edit_countries_in_bulk():
+    """
+    Update many countries in one transaction, all of them or none.
+
+    The body is a JSON array of {"Country_Name", "patch", "etag"}
+    objects, "patch" holding the changes a PATCH to
+    /api/countries/<country_name> would, and the optional "etag" the
+    ETag the client last read, as If-Match does there (see
+    bulk_patch.py).
+
+    Args:
+        None
+
+    Returns:
+        response: - A JSON report with the number of patches
+                    `received`, countries `updated` and patches
+                    `failed`, the `errors` of each failed patch by its
+                    position in the body, and the new `etags` of the
+                    countries. The status code is 200 if every patch
+                    was applied, or 400 if any failed and so none was.
+                  - Or an error message JSON with status code 400 for
+                    a body that is not a JSON array, 409 for a rename
+                    to a name in use, or 412 for an outdated etag.
+    """
+    try:
+        # Use helper function from bulk_patch.py to apply the patches
+        patches = request.get_json()
+        with hold_write_lock():
+            report = patch_countries(patches)
+    except ValueError as value_error_message:
+        db.session.rollback()
+        message = jsonify({"status": 400, "error": str(value_error_message)})
+        response = make_response(message, 400)
+        response.headers["Content-Type"] = "application/json"
+        return response
+    # Catch the BadRequest error if the body is not valid JSON
+    except BadRequest:
+        db.session.rollback()
+        message = jsonify(
+            {
+                "status": 400,
+                "error": "Bad Request",
+                "message": "The body must be a JSON array of patches.",
+            }
+        )
+        response = make_response(message, 400)
+        response.headers["Content-Type"] = "application/json"
+        return response
+    except StaleDataError as stale_error_message:
+        db.session.rollback()
+        return make_precondition_failed_response(str(stale_error_message))
+    except IntegrityError:
+        db.session.rollback()
+        message = jsonify(
+            {
+                "status": 409,
+                "error": "Database Integrity Error",
+                "message": "Country name already exists in the database!",
+            }
+        )
+        response = make_response(message, 409)
+        response.headers["Content-Type"] = "application/json"
+        return response
+
+    status_code = 400 if report["failed"] else 200
+    response = make_response(jsonify(report), status_code)
+    response.headers["Content-Type"] = "application/json"
+    return response
+
+
 @update_data_api_bp.patch("/countries/<country_name>")
 def edit_existing_country(country_name):
     """
     Update existing country record with new JSON data for any fields.
 
+    An If-Match header makes the update conditional: unless it has the
+    country's current ETag (or is *), nothing is changed and 412 is
+    returned, so a client cannot overwrite a change it has not seen.
+
     Args:
         country_name (str): The name of the country to update passed
         in URI
 
     Returns:
         response: A Flask response containing JSON data of either
-        the updated record or an error message.
+        the updated record, with its new ETag, or an error message.
 
     Raises:
         ValueError: When the helper function get_updated_country()
         raises a ValueError, defined further in the utilities.py file.
         AttributeError: When an invalid column name is entered.
-        ValidationError: When the entered data is invalid for a specific
-        column.
         BadRequest: When an entered text or word is not a string.
+        StaleDataError: When If-Match does not have the country's
+        current ETag, or another writer kept changing the country.
+        IntegrityError: When the country is renamed to a name that
+        already exists.
     """
     try:
-        # Find the country already in the database
-        existing_country = db.session.execute(
-            db.select(TourismArrivals).filter_by(Country_Name=country_name)
-        ).scalar_one_or_none()
+        # Update the country if it exists, in one UPDATE statement
+        # checked against the snapshot's copy (see utilities.py), which
+        # refuses the change if the client's copy is out of date
+        data = request.get_json()
+        with hold_write_lock():
+            result, etag = get_updated_country(
+                country_name, data, request.if_match
+            )
         # If it exists, make a successful PATCH response of new data
-        if existing_country:
-            result = get_updated_country(existing_country, country_name)
+        if result is not None:
             response = make_response(result, 200)
             response.headers["Content-Type"] = "application/json"
+            response.set_etag(etag)
             return response
         # If country name doesn't exist, send response in JSON
         else:
@@ -195,25 +344,6 @@ def edit_existing_country(country_name):
         )
         response = make_response(error_message_json, 400)
         response.headers["Content-Type"] = "application/json"
-    # Catch the ValidationError, custom message and modifies message
-    except ValidationError as validation_error_message:
-        # Rollback session and raise JSON message with status code
-        db.session.rollback()
-        # Catch custom message and send with more meaningful info
-        error_messages = []
-        for field, errors in validation_error_message.messages.items():
-            for error in errors:
-                error_messages.append(
-                    f"The value entered: {field} is: {error}"
-                )
-        error_message_json = jsonify(
-            {
-                "status": 400,
-                "error": ", ".join(error_messages),
-             }
-        )
-        response = make_response(error_message_json, 400)
-        response.headers["Content-Type"] = "application/json"
     # Catch the BadRequest error if any word or text entered is not a string
     except BadRequest as badrequest_message:
         # Rollback session and raise JSON message with status code
@@ -226,4 +356,51 @@ def edit_existing_country(country_name):
         error_message_json = jsonify({"error": badrequest_message})
         response = make_response(error_message_json, 400)
         response.headers["Content-Type"] = "application/json"
+    # Catch an outdated If-Match, or the row changing between reading
+    # and updating it, e.g. by another process, as the UPDATE checks
+    # its version
+    except StaleDataError:
+        db.session.rollback()
+        response = make_precondition_failed_response()
+    # Catch a rename to a Country_Name that already exists
+    except IntegrityError:
+        db.session.rollback()
+        message = jsonify(
+            {
+                "status": 409,
+                "error": "Database Integrity Error",
+                "message": "Country name already exists in the database!",
+            }
+        )
+        response = make_response(message, 409)
+        response.headers["Content-Type"] = "application/json"
+    return response
+
+
+def make_precondition_failed_response(detail=None):
+    """
+    Sub-helper function making the response to an outdated PATCH.
+
+    Args:
+        detail (str): Optional detail added to the message, e.g. which
+        countries were outdated.
+
+    Returns:
+        response: A JSON error message with status code 412.
+    """
+    error_message = (
+        "The country was changed since it was read, "
+        "get it again and resend the changes."
+    )
+    if detail:
+        error_message = f"{error_message} {detail}"
+    message = jsonify(
+        {
+            "status": 412,
+            "error": "Precondition Failed",
+            "message": error_message,
+        }
+    )
+    response = make_response(message, 412)
+    response.headers["Content-Type"] = "application/json"
     return response
@@ -1,6 +1,6 @@
 """File for basic html front-end routes, NOTE: NOT required as individual."""
 from flask import render_template, Blueprint, abort
-from tourism_hotels_app.utilities import get_countries, get_country
+from tourism_hotels_app.utilities import get_countries_payload, get_country
 
 
 # Define the Blueprint for basic html front-end
@@ -17,7 +17,8 @@ def index():
     Returns:
         Returns the home page with a list of available countries.
     """
-    response = get_countries()
+    # Reuse the same cached entry as the /api/countries route
+    response = get_countries_payload().data
     return render_template("index.html", country_list=response)
 
 
@@ -0,0 +1,477 @@
+"""File containing the in-memory search index of country names and codes.
+
+Names and codes are held in a radix trie, built with the snapshot and
+patched with the same changes, so searching never goes to the database.
+Every node keeps the first MAX_RESULTS countries of its subtree, in
+rank order, so a prefix search reads one node's list, whatever the
+number of countries, and a write only updates the nodes of its own
+terms. Each edge holds the characters up to the next branch, so a name
+takes one node for the part no other term shares, not one per letter.
+
+A country is found by a prefix of its name (e.g. "united"), of any
+later word of its name (e.g. "kingdom") or of its code (e.g. "gb").
+Queries are matched without case, accents or punctuation, and allow
+for typos: a prefix at most MAX_TYPOS edits away from the query, where
+an edit is a letter added, removed, changed or two letters swapped,
+is found too, ranked after closer matches.
+"""
+import re
+import threading
+import unicodedata
+
+# Most countries a search can return, and so each node keeps
+MAX_RESULTS = 50
+
+# Edits allowed between a query and a prefix, by query length: none up
+# to 2 characters, 1 up to 5 and 2 from 6 on
+MAX_TYPOS = ((3, 0), (6, 1), (None, 2))
+
+# Rank of a match on the start of the name, and on a later word or the
+# code, which come after it
+NAME_RANK = 0
+WORD_RANK = 1
+
+# Runs of anything but letters and digits, in lower case ASCII text
+_SEPARATORS = re.compile(r"[^0-9a-z]+")
+
+
+def normalize(text):
+    """
+    Normalize a name, code or query for matching.
+
+    Letters are case folded and stripped of accents, and every run of
+    anything but letters and digits becomes one space, e.g.
+    "Côte d'Ivoire" becomes "cote d ivoire".
+
+    Args:
+        text (str): The text to normalize.
+    Returns:
+        The normalized text.
+    """
+    # Most names are ASCII, which need no Unicode decomposition
+    if text.isascii():
+        return _SEPARATORS.sub(" ", text.lower()).strip()
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return " ".join(
+        "".join(
+            character if character.isalnum() else " "
+            for character in decomposed
+            if not unicodedata.combining(character)
+        ).split()
+    )
+
+
+def get_max_typos(query):
+    """
+    Get how many edits a normalized query may be from a match.
+
+    Args:
+        query (str): The normalized query.
+    Returns:
+        The number of edits allowed, see MAX_TYPOS.
+    """
+    for shorter_than, typos in MAX_TYPOS:
+        if shorter_than is None or len(query) < shorter_than:
+            return typos
+
+
+def get_terms(record):
+    """
+    Get the terms a country is indexed under.
+
+    Args:
+        record (dict): A serialized country record.
+    Returns:
+        A list of (normalized term, entry) tuples, for the whole name,
+        the name from each later word on and the code, where the entry
+        is the (rank, normalized name, name) the term's node keeps.
+    """
+    country_name = record["Country_Name"]
+    name = normalize(country_name)
+    terms = [(name, (NAME_RANK, name, country_name))]
+    word_entry = (WORD_RANK, name, country_name)
+    words = name.split(" ")
+    for position in range(1, len(words)):
+        terms.append((" ".join(words[position:]), word_entry))
+    if record.get("Country_Code"):
+        terms.append((normalize(record["Country_Code"]), word_entry))
+    return [(term, entry) for term, entry in terms if term]
+
+
+class TrieNode:
+    """
+    One node of the search trie, at the end of an edge.
+
+    Attributes:
+        label (str): The characters of the edge from the parent, the
+            first of which is the node's key in the parent's children.
+        children (dict): Maps the first character of each edge below
+            to its node.
+        entries (list): (rank, normalized name, name) of the terms that
+            end at this node.
+        top (list): The first MAX_RESULTS entries of this node and its
+            subtree, sorted, with one entry per country. It is replaced
+            rather than changed, so it may be shared.
+    """
+
+    __slots__ = ("label", "children", "entries", "top")
+
+    def __init__(self, label):
+        """
+        Create a node without children or entries.
+
+        Args:
+            label (str): The characters of the edge from the parent.
+        """
+        self.label = label
+        self.children = {}
+        self.entries = []
+        self.top = []
+
+
+def merge_top(entry_lists):
+    """
+    Sub-helper function merging entries into a node's top list.
+
+    Args:
+        entry_lists: Iterable of lists of (rank, normalized name, name)
+            entries.
+    Returns:
+        The first MAX_RESULTS entries, sorted, keeping the best entry
+        of each country.
+    """
+    top = []
+    seen = set()
+    for entry in sorted(
+        entry for entries in entry_lists for entry in entries
+    ):
+        if entry[2] not in seen:
+            seen.add(entry[2])
+            top.append(entry)
+            if len(top) == MAX_RESULTS:
+                break
+    return top
+
+
+def insert_term(root, term):
+    """
+    Sub-helper function adding the nodes of a term to a trie.
+
+    An edge the term leaves part way along is split in two, the new
+    node in the middle taking over the subtree's top list.
+
+    Args:
+        root (TrieNode): The root of the trie.
+        term (str): The normalized term, not empty.
+    Returns:
+        The nodes from the root to the one the term ends at.
+    """
+    node = root
+    path = [node]
+    position = 0
+    while position < len(term):
+        child = node.children.get(term[position])
+        if child is None:
+            child = TrieNode(term[position:])
+            node.children[term[position]] = child
+            path.append(child)
+            break
+        label = child.label
+        common = 1
+        while (
+            common < len(label)
+            and position + common < len(term)
+            and label[common] == term[position + common]
+        ):
+            common += 1
+        if common < len(label):
+            middle = TrieNode(label[:common])
+            middle.top = child.top
+            child.label = label[common:]
+            middle.children[child.label[0]] = child
+            node.children[term[position]] = middle
+            child = middle
+        node = child
+        path.append(node)
+        position += common
+    return path
+
+
+def find_term(root, term):
+    """
+    Sub-helper function finding the nodes of a term already in a trie.
+
+    Args:
+        root (TrieNode): The root of the trie.
+        term (str): The normalized term.
+    Returns:
+        The nodes from the root to the one the term ends at, or None if
+        the term is not in the trie.
+    """
+    node = root
+    path = [node]
+    position = 0
+    while position < len(term):
+        node = node.children.get(term[position])
+        if node is None or not term.startswith(node.label, position):
+            return None
+        path.append(node)
+        position += len(node.label)
+    return path
+
+
+def fill_top(root):
+    """
+    Sub-helper function filling the top lists of a new trie, bottom up.
+
+    Args:
+        root (TrieNode): The root of the trie.
+    Returns:
+        None
+    """
+    # Nodes in breadth first order, children after their parent, so
+    # the reverse visits every child before its parent, without recursion
+    nodes = [root]
+    for node in nodes:
+        nodes.extend(node.children.values())
+    for node in reversed(nodes):
+        node.top = merge_top(
+            [node.entries] + [child.top for child in node.children.values()]
+        )
+
+
+class CountrySearch:
+    """
+    Radix trie of country names and codes, kept in step with the snapshot.
+
+    Readers and the writer share a lock, held by a search for well
+    under a millisecond, so a search never sees a half-applied change.
+
+    Methods:
+        search(): Returns the countries best matching a query.
+        update(): Applies changed records to the trie.
+        reset(): Rebuilds the trie from every record.
+    """
+
+    def __init__(self):
+        """Create an empty search index."""
+        self._root = TrieNode("")
+        self._lock = threading.Lock()
+
+    def _add_term(self, term, entry):
+        """
+        Sub-helper function adding one term of a country.
+
+        Must be called with the lock held.
+
+        Args:
+            term (str): The normalized term.
+            entry (tuple): The (rank, normalized name, name) entry.
+        Returns:
+            None
+        """
+        path = insert_term(self._root, term)
+        path[-1].entries.append(entry)
+        # From the term's node up, as an entry that does not make a
+        # node's top list cannot make its parent's either
+        for node in reversed(path):
+            top = node.top
+            if len(top) == MAX_RESULTS and entry >= top[-1]:
+                break
+            node.top = merge_top((top, [entry]))
+
+    def _remove_term(self, term, entry):
+        """
+        Sub-helper function removing one term of a country.
+
+        Must be called with the lock held. A node left without entries
+        is removed if it has no children, or joined to its child if it
+        has one, and the top lists are rebuilt bottom up.
+
+        Args:
+            term (str): The normalized term.
+            entry (tuple): The (rank, normalized name, name) entry.
+        Returns:
+            None
+        """
+        path = find_term(self._root, term)
+        if path is None or entry not in path[-1].entries:
+            return
+        path[-1].entries.remove(entry)
+        for depth in range(len(path) - 1, -1, -1):
+            node = path[depth]
+            if depth and not node.entries and len(node.children) < 2:
+                parent = path[depth - 1]
+                if not node.children:
+                    del parent.children[node.label[0]]
+                    continue
+                (child,) = node.children.values()
+                child.label = node.label + child.label
+                parent.children[node.label[0]] = child
+                continue
+            if entry in node.top:
+                node.top = merge_top(
+                    [node.entries]
+                    + [child.top for child in node.children.values()]
+                )
+
+    def update(self, changes):
+        """
+        Apply changed records to the trie.
+
+        Args:
+            changes: Iterable of (old record, new record) pairs, with
+                None for a record that did not exist.
+        Returns:
+            None
+        """
+        with self._lock:
+            for old_record, new_record in changes:
+                # Most changes leave the name and code as they were
+                if (
+                    old_record is not None
+                    and new_record is not None
+                    and old_record["Country_Name"]
+                    == new_record["Country_Name"]
+                    and old_record.get("Country_Code")
+                    == new_record.get("Country_Code")
+                ):
+                    continue
+                if old_record is not None:
+                    for term, entry in get_terms(old_record):
+                        self._remove_term(term, entry)
+                if new_record is not None:
+                    for term, entry in get_terms(new_record):
+                        self._add_term(term, entry)
+
+    def reset(self, records):
+        """
+        Rebuild the trie from every record.
+
+        The new trie is built before the lock is taken, so searches
+        carry on meanwhile.
+
+        Args:
+            records: Serialized country records.
+        Returns:
+            None
+        """
+        root = TrieNode("")
+        for record in records:
+            for term, entry in get_terms(record):
+                insert_term(root, term)[-1].entries.append(entry)
+        fill_top(root)
+        with self._lock:
+            self._root = root
+
+    def search(self, query, limit):
+        """
+        Get the countries best matching a query.
+
+        Matches are ranked by how many edits their prefix is from the
+        query, then by matching the start of the name before a later
+        word or the code, then by name.
+
+        Args:
+            query (str): What the user typed so far.
+            limit (int): How many countries to return, at most
+                MAX_RESULTS.
+        Returns:
+            A list of (country name, edits) tuples, best first.
+        """
+        query = normalize(query)
+        if not query:
+            return []
+        max_typos = get_max_typos(query)
+        best = {}
+        with self._lock:
+            found = find_nodes(self._root, query, max_typos)
+            # Closest prefixes first, as once limit countries are found
+            # a farther prefix cannot outrank them
+            found.sort(key=lambda item: item[0])
+            closest = 0
+            for distance, node in found:
+                if distance > closest and len(best) >= limit:
+                    break
+                closest = distance
+                # Past its first limit entries, a node has limit better
+                # countries of its own
+                for rank, sort_name, name in node.top[:limit]:
+                    match = (distance, rank, sort_name)
+                    if match < best.get(name, (max_typos + 1,)):
+                        best[name] = match
+        matches = sorted(best.items(), key=lambda item: item[1])
+        return [(name, match[0]) for name, match in matches[:limit]]
+
+
+def find_nodes(root, query, max_typos):
+    """
+    Sub-helper function finding the prefixes close to a query.
+
+    Walks the trie one character at a time, with one row of the edit
+    distance table per character, the distances from each prefix of
+    the query to the prefix walked so far, counting a swap of two
+    letters as one edit. A branch is left as soon as no prefix along
+    it can be close enough, or once the distance can no longer improve
+    along it, as a node's top list already covers its subtree.
+
+    The first character must match, as typos are rare there and
+    allowing them would walk most of the trie for every query.
+
+    Args:
+        root (TrieNode): The root of the trie.
+        query (str): The normalized query, not empty.
+        max_typos (int): The most edits a prefix may be away.
+    Returns:
+        A list of (edits, node) tuples, one per node with a close
+        prefix on its edge, with the fewest edits along the edge.
+    """
+    start = root.children.get(query[0])
+    if start is None:
+        return []
+    length = len(query)
+    found = []
+    # (node, the row before its edge, the row before that, the
+    # character before its edge)
+    stack = [(start, list(range(length + 1)), None, None)]
+    while stack:
+        node, previous_row, before_row, previous_character = stack.pop()
+        closest = None
+        walk_on = True
+        for character in node.label:
+            row = [previous_row[0] + 1]
+            for position in range(1, length + 1):
+                value = min(
+                    row[position - 1] + 1,
+                    previous_row[position] + 1,
+                    previous_row[position - 1]
+                    + (query[position - 1] != character),
+                )
+                # Two letters swapped, e.g. "inida" for "india"
+                if (
+                    position > 1
+                    and query[position - 1] == previous_character
+                    and query[position - 2] == character
+                ):
+                    value = min(value, before_row[position - 2] + 1)
+                row.append(value)
+            before_row, previous_row = previous_row, row
+            previous_character = character
+            distance = row[-1]
+            if distance <= max_typos and (
+                closest is None or distance < closest
+            ):
+                closest = distance
+            # Further along, no distance gets lower than the row's lowest
+            lowest = min(row)
+            if lowest > max_typos or lowest >= distance:
+                walk_on = False
+                break
+        if closest is not None:
+            found.append((closest, node))
+        if walk_on:
+            stack.extend(
+                (child, previous_row, before_row, previous_character)
+                for child in node.children.values()
+            )
+    return found
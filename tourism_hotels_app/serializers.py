@@ -0,0 +1,133 @@
+"""File containing the fast read-only serializer for tourism arrivals rows.
+
+Marshmallow is kept for validating and loading input. Output on the
+read path maps SQLAlchemy Core rows straight to dictionaries using a
+column to key table worked out once from the model, and encodes them
+with orjson when it is installed.
+"""
+import json
+from functools import lru_cache
+from sqlalchemy import Integer
+from tourism_hotels_app import db
+from tourism_hotels_app.models import ROW_VERSION_KEY, TourismArrivals
+from tourism_hotels_app.profiling import profile_phase
+
+# orjson is optional, fall back to the standard library encoder
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+
+def dumps_json(data):
+    """
+    Encode data as compact UTF-8 JSON bytes with the fastest encoder.
+
+    Dictionary keys keep their insertion order.
+
+    Args:
+        data: Any JSON serializable Python object.
+    Returns:
+        The encoded JSON as bytes.
+    """
+    with profile_phase("serialize"):
+        if orjson is not None:
+            return orjson.dumps(data)
+        return json.dumps(
+            data, ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8")
+
+
+class RowSerializer:
+    """
+    Read-only serializer from tourism_arrivals rows to dictionaries.
+
+    The output matches TourismArrivalsSchema.dump(): Integer columns
+    are converted with int() (SQLite stores them as REAL) and Text
+    columns with str().
+
+    Attributes:
+        keys (tuple): The output keys, i.e. model attribute names.
+        columns (tuple): The table columns for each key, in order.
+        statement: A Core SELECT of exactly those columns.
+
+    Methods:
+        dump_row(): Serializes one Core row.
+        dump_rows(): Serializes an iterable of Core rows.
+        dump_instance(): Serializes one TourismArrivals instance.
+    """
+
+    def __init__(self, keys=None):
+        """
+        Build the column to key table for the given keys.
+
+        Args:
+            keys: Optional iterable of model attribute names, defaults
+                to every column of TourismArrivals in table order,
+                but the row version.
+        """
+        column_attrs = TourismArrivals.__mapper__.column_attrs
+        if keys is None:
+            keys = [
+                key for key in column_attrs.keys() if key != ROW_VERSION_KEY
+            ]
+        self.keys = tuple(keys)
+        self.columns = tuple(
+            column_attrs[key].columns[0] for key in self.keys
+        )
+        self._converters = tuple(
+            int if isinstance(column.type, Integer) else str
+            for column in self.columns
+        )
+        self._table = tuple(zip(self.keys, self._converters))
+        self.statement = db.select(*self.columns)
+
+    def dump_row(self, row):
+        """
+        Serialize one Core row selected with self.statement.
+
+        Args:
+            row: A Row (or tuple) with values in self.columns order.
+        Returns:
+            A dictionary of attribute name to JSON ready value.
+        """
+        return {
+            key: None if value is None else convert(value)
+            for (key, convert), value in zip(self._table, row)
+        }
+
+    def dump_rows(self, rows):
+        """
+        Serialize an iterable of Core rows.
+
+        Args:
+            rows: Rows with values in self.columns order.
+        Returns:
+            A list of serialized dictionaries.
+        """
+        dump_row = self.dump_row
+        return [dump_row(row) for row in rows]
+
+    def dump_instance(self, instance):
+        """
+        Serialize one TourismArrivals instance, e.g. after a write.
+
+        Args:
+            instance: A TourismArrivals model instance.
+        Returns:
+            A dictionary of attribute name to JSON ready value.
+        """
+        return self.dump_row([getattr(instance, key) for key in self.keys])
+
+
+@lru_cache(maxsize=64)
+def get_serializer(keys=None):
+    """
+    Get the serializer for a set of keys, built once then reused.
+
+    Args:
+        keys: Optional tuple of model attribute names, None for all.
+    Returns:
+        The RowSerializer for those keys.
+    """
+    return RowSerializer(keys)
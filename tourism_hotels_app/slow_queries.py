@@ -0,0 +1,236 @@
+"""File containing the slow query log of both database engines.
+
+With SLOW_QUERY_THRESHOLD_MS set in the config, every statement taking
+longer than it is written to a rotating log file, with its parameters,
+duration, engine, the route of the request that ran it and SQLite's
+EXPLAIN QUERY PLAN for it, e.g.:
+
+    2026-10-18 12:00:00,000 slow query: 152.31 ms on reader, GET /api/top
+    statement: SELECT ... FROM tourism_arrivals ORDER BY ... LIMIT ?
+    parameters: (10,)
+    plan (full scan):
+      SCAN tourism_arrivals
+      USE TEMP B-TREE FOR ORDER BY
+
+A plan that reads every row of a table without an index is marked as a
+full scan, so a lookup or ORDER BY that lost its index stands out. The
+plan is only worked out for the statements that were slow, on a cursor
+of their own, so the query's results are not disturbed.
+"""
+import logging
+import time
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from flask import has_request_context, request
+from sqlalchemy import event
+from tourism_hotels_app import db
+
+# Logger the slow queries are written to
+logger = logging.getLogger("tourism_hotels_app.slow_queries")
+
+# Statements SQLite can explain
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "REPLACE", "WITH")
+
+# Longest parameters text written, as bulk inserts can have thousands
+MAX_PARAMETERS_LENGTH = 1000
+
+
+def get_query_plan(dbapi_connection, statement, parameters):
+    """
+    Get SQLite's query plan for a statement.
+
+    Args:
+        dbapi_connection: The sqlite3 connection the statement ran on.
+        statement (str): The SQL statement.
+        parameters: The statement's parameters.
+    Returns:
+        A list of the plan's lines, indented under their parent step,
+        or None if the statement cannot be explained.
+    """
+    if not statement.lstrip().upper().startswith(EXPLAINABLE):
+        return None
+    cursor = dbapi_connection.cursor()
+    try:
+        rows = cursor.execute(
+            f"EXPLAIN QUERY PLAN {statement}", parameters
+        ).fetchall()
+    except Exception:
+        # e.g. a statement using a temporary table that is gone
+        return None
+    finally:
+        cursor.close()
+
+    depths = {0: -1}
+    plan = []
+    for step_id, parent_id, _, detail in rows:
+        depths[step_id] = depths.get(parent_id, -1) + 1
+        plan.append("  " * depths[step_id] + detail)
+    return plan
+
+
+def is_full_scan(plan):
+    """
+    Find whether a query plan reads a whole table without an index.
+
+    Args:
+        plan (list): The lines of a query plan.
+    Returns:
+        True if a step scans a table without an index.
+    """
+    return any(
+        line.strip().startswith("SCAN ") and " INDEX " not in line
+        for line in plan
+    )
+
+
+def get_route():
+    """
+    Get the method and route of the current request.
+
+    Args:
+        None
+    Returns:
+        e.g. "GET /api/countries/country/<country_name>", or "no request"
+        for statements run outside of one, e.g. at startup.
+    """
+    if not has_request_context():
+        return "no request"
+    rule = request.url_rule
+    return f"{request.method} {rule.rule if rule else request.path}"
+
+
+def format_slow_query(
+    duration, engine_name, route, statement, parameters, plan
+):
+    """
+    Format one slow query as a log message.
+
+    Args:
+        duration (float): How long the statement took, in seconds.
+        engine_name (str): The engine it ran on, writer or reader.
+        route (str): The request that ran it, from get_route().
+        statement (str): The SQL statement.
+        parameters: The statement's parameters.
+        plan (list): The query plan's lines, or None.
+    Returns:
+        The message, over several lines.
+    """
+    parameters_text = repr(parameters)
+    if len(parameters_text) > MAX_PARAMETERS_LENGTH:
+        parameters_text = parameters_text[:MAX_PARAMETERS_LENGTH] + "..."
+    lines = [
+        f"slow query: {duration * 1000:.2f} ms on {engine_name}, {route}",
+        f"statement: {' '.join(statement.split())}",
+        f"parameters: {parameters_text}",
+    ]
+    if plan is None:
+        lines.append("plan: not available")
+    else:
+        full_scan = " (full scan)" if is_full_scan(plan) else ""
+        lines.append(f"plan{full_scan}:")
+        lines += ["  " + line for line in plan]
+    return "\n".join(lines)
+
+
+def listen_slow_queries(engine, engine_name, threshold):
+    """
+    Sub-helper function logging the statements of an engine over time.
+
+    Args:
+        engine: A SQLAlchemy engine.
+        engine_name (str): The engine's name in the log, writer or
+            reader.
+        threshold (float): The slowest a statement may be, in seconds.
+    Returns:
+        None
+    """
+    explain = engine.dialect.name == "sqlite"
+
+    def start_timer(
+        conn, cursor, statement, parameters, context, executemany
+    ):
+        """Note when a statement started, on the connection."""
+        conn.info.setdefault("slow_query_start", []).append(
+            time.perf_counter()
+        )
+
+    def log_if_slow(
+        conn, cursor, statement, parameters, context, executemany
+    ):
+        """Log the statement if it took longer than the threshold."""
+        duration = time.perf_counter() - conn.info["slow_query_start"].pop()
+        if duration <= threshold:
+            return
+        plan = None
+        if explain:
+            # executemany statements are explained with their first row
+            plan = get_query_plan(
+                conn.connection.dbapi_connection,
+                statement,
+                parameters[0] if executemany else parameters,
+            )
+        logger.warning(
+            format_slow_query(
+                duration, engine_name, get_route(), statement,
+                parameters, plan,
+            )
+        )
+
+    event.listen(engine, "before_cursor_execute", start_timer)
+    event.listen(engine, "after_cursor_execute", log_if_slow)
+
+
+def add_log_handler(log_file, max_bytes, backup_count):
+    """
+    Sub-helper function writing the slow query logger to a rotating file.
+
+    A handler already writing to the same file is replaced, so creating
+    several apps does not log every query more than once.
+
+    Args:
+        log_file (Path): The log file, its folder is created.
+        max_bytes (int): The size the file is rotated at.
+        backup_count (int): How many rotated files are kept.
+    Returns:
+        None
+    """
+    log_file.parent.mkdir(parents=True, exist_ok=True)
+    for handler in list(logger.handlers):
+        if getattr(handler, "baseFilename", None) == str(log_file.resolve()):
+            logger.removeHandler(handler)
+            handler.close()
+    handler = RotatingFileHandler(
+        log_file, maxBytes=max_bytes, backupCount=backup_count,
+        encoding="utf-8",
+    )
+    handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.WARNING)
+    # Keep slow queries out of the app's own log
+    logger.propagate = False
+
+
+def init_slow_query_log(app):
+    """
+    Log the slow statements of both engines, if a threshold is set.
+
+    Must be called inside the app context, so both engines exist.
+
+    Args:
+        app: Flask app application instance
+    Returns:
+        None
+    """
+    threshold_ms = app.config.get("SLOW_QUERY_THRESHOLD_MS")
+    if threshold_ms is None:
+        return
+    log_file = app.config.get("SLOW_QUERY_LOG_FILE") or (
+        Path(app.instance_path) / "slow_queries.log"
+    )
+    add_log_handler(
+        Path(log_file),
+        app.config.get("SLOW_QUERY_LOG_MAX_BYTES", 1024 * 1024),
+        app.config.get("SLOW_QUERY_LOG_BACKUP_COUNT", 5),
+    )
+    for bind_key, engine in db.engines.items():
+        listen_slow_queries(engine, bind_key or "writer", threshold_ms / 1000)
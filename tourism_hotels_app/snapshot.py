@@ -0,0 +1,886 @@
+"""File containing the in-memory columnar snapshot of tourism arrivals.
+
+The read endpoints serve their data from this snapshot instead of going
+to SQLite, the ORM and Marshmallow on every request. Each app built by
+create_app() has its own snapshot, kept in app.extensions and read
+through the `snapshot` proxy of the current app. It is patched whenever
+a database session of that app commits changes to the tourism_arrivals
+or tourism_observations tables.
+"""
+import threading
+from functools import partial
+import numpy as np
+import pandas as pd
+from flask import current_app
+from sqlalchemy import event, inspect
+from werkzeug.local import LocalProxy
+from tourism_hotels_app import db
+from tourism_hotels_app.leaderboard import Leaderboard
+from tourism_hotels_app.response_cache import PayloadCache
+from tourism_hotels_app.search import CountrySearch
+from tourism_hotels_app.storage import get_reader_engine
+from tourism_hotels_app.models import TourismArrivals, TourismObservation
+from tourism_hotels_app.observations import (
+    CHANGED_COUNTRIES_OPTION,
+    get_legacy_years,
+    get_metadata_serializer,
+    get_year_axis,
+    load_records,
+    load_row_versions,
+)
+
+# Key of an app's TourismSnapshot in app.extensions
+SNAPSHOT_EXTENSION = "tourism_snapshot"
+
+# Keys used in session.info to remember what changed before a commit
+CHANGED_NAMES_KEY = "tourism_snapshot_changed_names"
+FULL_REFRESH_KEY = "tourism_snapshot_full_refresh"
+UPDATED_ROWS_KEY = "tourism_snapshot_updated_rows"
+
+# Metadata columns held as object arrays, keyed by attribute name
+METADATA_COLUMNS = (
+    "Region",
+    "IncomeGroup",
+    "Country_Code",
+    "Indicator_Name",
+    "Percent_drop_2019_to_2020",
+)
+# Metadata columns countries can be grouped by, keyed by API name
+GROUP_COLUMNS = {
+    "region": "Region",
+    "income": "IncomeGroup",
+}
+# Numeric summary columns held as float arrays (NaN for null)
+NUMERIC_COLUMNS = (
+    "Average_10year_in_tourist_arrivals",
+    "Max_number_of_arrivals",
+    "Minimum_number_of_arrivals",
+)
+
+
+def to_float(value):
+    """
+    Sub-helper function converting a column value to a float.
+
+    Args:
+        value: A value from a serialized record, possibly None or text.
+    Returns:
+        The value as a float, or NaN if it is null or not numeric.
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def get_state_year(state, chosen_year):
+    """
+    Sub-helper function checking a year has a column in a state.
+
+    Args:
+        state (SnapshotState): The state to read from.
+        chosen_year: The year, as an int or numeric string.
+    Returns:
+        The year as an int.
+    Raises:
+        AttributeError: If there is no data column for that year.
+    """
+    try:
+        year = int(chosen_year)
+    except (TypeError, ValueError):
+        raise AttributeError(f"No data for year {chosen_year}")
+    if year not in state.year_position:
+        raise AttributeError(f"No data for year {chosen_year}")
+    return year
+
+
+def build_columns(records, years):
+    """
+    Sub-helper function building the arrays of some records.
+
+    Args:
+        records (list): Serialized country dictionaries.
+        years (tuple): The years of the year matrix columns.
+    Returns:
+        A tuple of (names array, year matrix, metadata arrays, numeric
+        arrays), one row per record, as held by SnapshotState.
+    """
+    names = np.array(
+        [record["Country_Name"] for record in records], dtype=object
+    )
+    year_matrix = np.array(
+        [
+            [to_float(record[f"year_{year}"]) for year in years]
+            for record in records
+        ],
+        dtype=np.float64,
+    ).reshape(len(records), len(years))
+    metadata = {
+        column: np.array(
+            [record[column] for record in records], dtype=object
+        )
+        for column in METADATA_COLUMNS
+    }
+    numeric = {
+        column: np.array(
+            [to_float(record[column]) for record in records],
+            dtype=np.float64,
+        )
+        for column in NUMERIC_COLUMNS
+    }
+    return names, year_matrix, metadata, numeric
+
+
+class SnapshotState:
+    """
+    Immutable columnar copy of the tourism_arrivals table.
+
+    A new state is created on every change and swapped in as a whole,
+    so readers never see a half-applied update.
+
+    Attributes:
+        records (list): Serialized country dictionaries, in table order.
+        names (np.ndarray): Country names, one per row.
+        index (dict): Maps country name to its row number.
+        code_index (dict): Maps country code to its row number.
+        years (tuple): The years of the year matrix columns.
+        generation (int): Write generation, increased on every change.
+        versions (dict): Maps country name to its row version.
+        year_matrix (np.ndarray): Countries x years float matrix, with
+            NaN for missing values.
+        metadata (dict): Object arrays for the metadata columns.
+        numeric (dict): Float arrays for the summary columns.
+    """
+
+    def __init__(self, records, years, generation, versions=None):
+        """
+        Build the arrays for the given serialized records.
+
+        Args:
+            records (list): Serialized country dictionaries.
+            years (tuple): The years to include in the year matrix.
+            generation (int): The write generation of this state.
+            versions (dict): The row version of each country.
+        """
+        self.records = records
+        self.years = years
+        self.generation = generation
+        self.versions = versions or {}
+        self.year_position = {year: i for i, year in enumerate(years)}
+        self.names, self.year_matrix, self.metadata, self.numeric = (
+            build_columns(records, years)
+        )
+        self.index = dict(zip(self.names.tolist(), range(len(records))))
+        self.code_index = dict(zip(
+            self.metadata["Country_Code"].tolist(), range(len(records))
+        ))
+        # Per-year payloads and group totals are built on first
+        # request then reused
+        self._year_payloads = {}
+        self._group_totals = {}
+
+    def patched(self, names, fresh, fresh_versions):
+        """
+        Build the next state, with some countries replaced or removed.
+
+        Only the changed records are converted. The arrays and indexes
+        of the others are copied as they are, which numpy and dict do
+        without a Python loop, so a write costs far less than building
+        a state. Replaced countries keep their row, and a new country,
+        e.g. a renamed one, takes the row of a removed one, as SQLite
+        keeps a renamed row in place. Other removed rows are deleted
+        and other new countries appended, in the order of fresh.
+
+        Args:
+            names (set): Every country changed, including the old name
+                of a renamed one. Those missing from fresh are removed.
+            fresh (dict): Maps country name to its new record.
+            fresh_versions (dict): Maps country name to its row version.
+        Returns:
+            The new SnapshotState, one generation on, with the same
+            years.
+        """
+        state = SnapshotState.__new__(SnapshotState)
+        state.years = self.years
+        state.year_position = self.year_position
+        state.generation = self.generation + 1
+        state._year_payloads = {}
+        state._group_totals = {}
+        state.versions = dict(self.versions)
+        for name in names:
+            if name not in fresh:
+                state.versions.pop(name, None)
+        state.versions.update(fresh_versions)
+
+        removed = sorted(
+            (
+                name for name in names
+                if name not in fresh and name in self.index
+            ),
+            key=self.index.get,
+        )
+        added = [name for name in fresh if name not in self.index]
+        # (old name, new name) of the rows new countries take over
+        reused = list(zip(removed, added))
+        removed = removed[len(reused):]
+        added = added[len(reused):]
+
+        state.records = list(self.records)
+        state.index = dict(self.index)
+        state.code_index = dict(self.code_index)
+        names_array = self.names
+        year_matrix = self.year_matrix
+        metadata = self.metadata
+        numeric = self.numeric
+        if removed:
+            rows = [self.index[name] for name in removed]
+            for row in reversed(rows):
+                del state.records[row]
+            for row, name in zip(rows, removed):
+                del state.index[name]
+                code = metadata["Country_Code"][row]
+                if state.code_index.get(code) == row:
+                    del state.code_index[code]
+            names_array = np.delete(names_array, rows)
+            year_matrix = np.delete(year_matrix, rows, axis=0)
+            metadata = {
+                column: np.delete(values, rows)
+                for column, values in metadata.items()
+            }
+            numeric = {
+                column: np.delete(values, rows)
+                for column, values in numeric.items()
+            }
+            # Only the rows after the first removed one move up
+            first = rows[0]
+            moved = range(first, len(state.records))
+            state.index.update(zip(names_array[first:].tolist(), moved))
+            state.code_index.update(
+                zip(metadata["Country_Code"][first:].tolist(), moved)
+            )
+        if added:
+            start = len(state.records)
+            records = [fresh[name] for name in added]
+            columns = build_columns(records, self.years)
+            state.records.extend(records)
+            names_array = np.concatenate([names_array, columns[0]])
+            year_matrix = np.concatenate([year_matrix, columns[1]])
+            metadata = {
+                column: np.concatenate([values, columns[2][column]])
+                for column, values in metadata.items()
+            }
+            numeric = {
+                column: np.concatenate([values, columns[3][column]])
+                for column, values in numeric.items()
+            }
+            for row, record in enumerate(records, start=start):
+                state.index[record["Country_Name"]] = row
+                state.code_index[record["Country_Code"]] = row
+        if not removed and not added:
+            # Rows are only written in place, into copies
+            names_array = names_array.copy()
+            year_matrix = year_matrix.copy()
+            metadata = {
+                column: values.copy() for column, values in metadata.items()
+            }
+            numeric = {
+                column: values.copy() for column, values in numeric.items()
+            }
+        state.names = names_array
+        state.year_matrix = year_matrix
+        state.metadata = metadata
+        state.numeric = numeric
+
+        # (row, record) of every row written in place
+        replaced = [
+            (state.index[name], record)
+            for name, record in fresh.items()
+            if name in self.index
+        ]
+        for old_name, name in reused:
+            row = state.index.pop(old_name)
+            state.index[name] = row
+            replaced.append((row, fresh[name]))
+        if replaced:
+            rows = [row for row, _ in replaced]
+            records = [record for _, record in replaced]
+            for row, record in replaced:
+                old_code = state.metadata["Country_Code"][row]
+                if state.code_index.get(old_code) == row:
+                    del state.code_index[old_code]
+                state.records[row] = record
+            columns = build_columns(records, self.years)
+            state.names[rows] = columns[0]
+            state.year_matrix[rows] = columns[1]
+            for column, values in columns[2].items():
+                state.metadata[column][rows] = values
+            for column, values in columns[3].items():
+                state.numeric[column][rows] = values
+            for row, record in replaced:
+                state.code_index[record["Country_Code"]] = row
+        return state
+
+    def year_payload(self, year):
+        """
+        Get the list of countries and their values for one year.
+
+        Args:
+            year (int): A year that is in self.years.
+        Returns:
+            A list of {"Country_Name", "year_XXXX"} dictionaries.
+        """
+        payload = self._year_payloads.get(year)
+        if payload is None:
+            key = f"year_{year}"
+            column = self.year_matrix[:, self.year_position[year]]
+            payload = [
+                {
+                    "Country_Name": name,
+                    key: None if np.isnan(value) else int(value),
+                }
+                for name, value in zip(self.names, column)
+            ]
+            self._year_payloads[year] = payload
+        return payload
+
+    def group_totals(self, column, year):
+        """
+        Get the sum, mean and count of one year's values per group.
+
+        Each country's group is numbered, then the year's column is
+        summed and counted per number in one vectorized pass. Countries
+        without a group are left out.
+
+        Args:
+            column (str): A metadata column in GROUP_COLUMNS.
+            year (int): A year that is in self.years.
+        Returns:
+            A list of {column, "sum", "mean", "count"} dictionaries, one
+            per group in name order, where count is the countries with
+            a value and mean is None if there are none.
+        """
+        totals = self._group_totals.get((column, year))
+        if totals is None:
+            # Code of each country's group, -1 for none
+            codes, groups = pd.factorize(self.metadata[column], sort=True)
+            values = self.year_matrix[:, self.year_position[year]]
+            counted = (codes >= 0) & ~np.isnan(values)
+            sums = np.bincount(
+                codes[counted], weights=values[counted],
+                minlength=len(groups),
+            )
+            counts = np.bincount(codes[counted], minlength=len(groups))
+            totals = [
+                {
+                    column: group,
+                    "sum": int(group_sum),
+                    "mean": float(group_sum / count) if count else None,
+                    "count": int(count),
+                }
+                for group, group_sum, count in zip(groups, sums, counts)
+            ]
+            self._group_totals[(column, year)] = totals
+        return totals
+
+
+class TourismSnapshot:
+    """
+    Holds the current SnapshotState and keeps it in step with the database.
+
+    Session events record which countries are flushed, and once the
+    session commits only those rows are reloaded and patched into a
+    copy of the state. Rows handed over with add_updated_row() are
+    patched in as they are, without reading them again. Bulk
+    statements run through the session trigger a full rebuild instead.
+
+    The rankings, the search index and the cached response payloads
+    belong to the snapshot, so every app has its own.
+
+    Methods:
+        init_app(): Adds the snapshot to an app and builds its state.
+        rebuild(): Reloads the whole table into a new state.
+        refresh_rows(): Reloads some countries and patches the state.
+        patch_rows(): Patches updated rows into the state as they are.
+        add_updated_row(): Hands an updated row over until the commit.
+        generation: The write generation of the current state.
+        years: The years of the current state.
+        countries(): Returns all serialized countries.
+        versioned_countries(): Returns countries with their generation.
+        country(): Returns one serialized country or None.
+        versioned_country(): Returns one country with its row version.
+        year(): Returns the countries and values for one year.
+        year_range(): Returns a countries x years slice of the matrix.
+        group_totals(): Returns one year's sum, mean and count by group.
+        ranking(): Returns the countries ranked by a record key.
+        search(): Returns the countries matching a name or code query.
+    """
+
+    def __init__(self):
+        """Create an empty snapshot, filled in by init_app()."""
+        self._state = SnapshotState([], get_legacy_years(), 0)
+        # Re-entrant, as refresh_rows() may fall back to rebuild()
+        self._write_lock = threading.RLock()
+        # Rankings and the search index are patched with the same
+        # changes as the state
+        self.leaderboard = Leaderboard()
+        self.search_index = CountrySearch()
+        # Payloads are cached per generation of this snapshot
+        self.payload_cache = PayloadCache()
+
+    def init_app(self, app):
+        """
+        Add the snapshot to the app and build it from the app's database.
+
+        The session events are registered once for every app, and find
+        the snapshot of the app whose session commits.
+
+        Must be called inside the app context.
+
+        Args:
+            app: Flask app application instance
+        Returns:
+            None
+        """
+        for name, listener in (
+            ("after_flush", TourismSnapshot._after_flush),
+            ("do_orm_execute", TourismSnapshot._do_orm_execute),
+            ("after_commit", TourismSnapshot._after_commit),
+            ("after_rollback", TourismSnapshot._after_rollback),
+        ):
+            if not event.contains(db.session, name, listener):
+                event.listen(db.session, name, listener)
+        app.extensions[SNAPSHOT_EXTENSION] = self
+        self.rebuild()
+
+    # -----
+    # Loading and patching
+    # -----
+    # Loading uses a separate short-lived connection of the read-only
+    # engine, so it can run after the request session has committed.
+    # Rows are read with SQLAlchemy Core and serialized without building
+    # ORM objects.
+    def rebuild(self):
+        """
+        Reload the whole table into a new snapshot state.
+
+        The year axis is every year found in tourism_observations, so a
+        newly loaded year shows up without any code change.
+
+        Args:
+            None
+        Returns:
+            None
+        """
+        with self._write_lock:
+            with get_reader_engine().connect() as connection:
+                years = get_year_axis(connection)
+                records = load_records(connection, years=years)
+                versions = load_row_versions(connection)
+            state = SnapshotState(
+                records, years, self._state.generation + 1, versions
+            )
+            self.leaderboard.reset(partial(self._swap_state, state))
+            self.search_index.reset(records)
+
+    def refresh_rows(self, names):
+        """
+        Reload the given countries and patch them into a new state.
+
+        Countries that no longer exist are removed, new countries are
+        added and the rest are replaced in place (see
+        SnapshotState.patched()). If the changes
+        added a year or removed a year's last observation, the whole
+        table is reloaded instead.
+
+        Args:
+            names: Iterable of country names that were changed.
+        Returns:
+            None
+        """
+        names = set(names)
+        if not names:
+            return
+        with self._write_lock:
+            current = self._state
+            with get_reader_engine().connect() as connection:
+                years = get_year_axis(connection)
+                # The year axis changed, every row gains or loses a year
+                if set(years) != set(current.years):
+                    self.rebuild()
+                    return
+                query = get_metadata_serializer().statement.where(
+                    TourismArrivals.Country_Name.in_(names)
+                )
+                fresh = {
+                    record["Country_Name"]: record
+                    for record in load_records(
+                        connection, query, current.years
+                    )
+                }
+                fresh_versions = load_row_versions(connection, names)
+            self._patch_state(current, names, fresh, fresh_versions)
+
+    def patch_rows(self, rows):
+        """
+        Patch updated rows into a new state, without reading them again.
+
+        Each row's changed columns are laid over the country's current
+        record. If a country is not in the state, the rows are reloaded
+        instead.
+
+        Args:
+            rows: List of (country name before the update, serialized
+                changed columns, row version) tuples.
+        Returns:
+            None
+        """
+        with self._write_lock:
+            current = self._state
+            names = {
+                name
+                for old_name, columns, _ in rows
+                for name in (
+                    old_name, columns.get("Country_Name", old_name)
+                )
+            }
+            if any(old_name not in current.index for old_name, _, _ in rows):
+                self.refresh_rows(names)
+                return
+            fresh = {}
+            fresh_versions = {}
+            for old_name, columns, version in rows:
+                record = {
+                    **current.records[current.index[old_name]], **columns
+                }
+                fresh[record["Country_Name"]] = record
+                fresh_versions[record["Country_Name"]] = version
+            self._patch_state(current, names, fresh, fresh_versions)
+
+    def _patch_state(self, current, names, fresh, fresh_versions):
+        """
+        Sub-helper function swapping in a state with some rows replaced.
+
+        Must be called with the write lock held.
+
+        Args:
+            current (SnapshotState): The state the changes apply to.
+            names (set): Every country changed, including the old name
+                of a renamed one. Those missing from fresh are removed.
+            fresh (dict): Maps country name to its new record.
+            fresh_versions (dict): Maps country name to its row version.
+        Returns:
+            None
+        """
+        # (old record, new record) pairs for the rankings
+        changes = [
+            (
+                current.records[current.index[name]]
+                if name in current.index else None,
+                fresh.get(name),
+            )
+            for name in names
+        ]
+        # Only the changed rows are written into copies of the arrays
+        state = current.patched(names, fresh, fresh_versions)
+        self.leaderboard.update(changes, partial(self._swap_state, state))
+        self.search_index.update(changes)
+
+    def _swap_state(self, state):
+        """Make the given state the one served to readers."""
+        self._state = state
+
+    # -----
+    # Session events
+    # -----
+    @staticmethod
+    def _after_flush(session, flush_context):
+        """Remember the names of flushed TourismArrivals rows."""
+        changed = session.info.setdefault(CHANGED_NAMES_KEY, set())
+        for instance in (*session.new, *session.dirty, *session.deleted):
+            if isinstance(instance, TourismArrivals):
+                changed.add(instance.Country_Name)
+                # A renamed country must also be removed under its old name
+                history = inspect(instance).attrs.Country_Name.history
+                changed.update(history.deleted or ())
+
+    @staticmethod
+    def _do_orm_execute(orm_execute_state):
+        """Record the countries changed by statements on the tables."""
+        if not (
+            orm_execute_state.is_insert
+            or orm_execute_state.is_update
+            or orm_execute_state.is_delete
+        ):
+            return
+        table = getattr(orm_execute_state.statement, "table", None)
+        if getattr(table, "name", None) not in (
+            TourismArrivals.__tablename__,
+            TourismObservation.__tablename__,
+        ):
+            return
+        info = orm_execute_state.session.info
+        # Statements naming the countries they change are patched,
+        # any other bulk statement needs a full rebuild
+        changed = orm_execute_state.execution_options.get(
+            CHANGED_COUNTRIES_OPTION
+        )
+        if changed is None:
+            info[FULL_REFRESH_KEY] = True
+        else:
+            info.setdefault(CHANGED_NAMES_KEY, set()).update(changed)
+
+    @staticmethod
+    def add_updated_row(session, old_name, columns, version):
+        """
+        Hand over the changes of a row's UPDATE, to patch in at commit.
+
+        If everything the session changed was handed over this way, the
+        commit patches the rows in as they are instead of reloading
+        them. Nothing is kept if the session rolls back.
+
+        Args:
+            session: The session the UPDATE ran in.
+            old_name (str): The country's name before the update.
+            columns (dict): The columns the UPDATE set, serialized by
+                RowSerializer, without the row version.
+            version (int): The row version the UPDATE set.
+        Returns:
+            None
+        """
+        session.info.setdefault(UPDATED_ROWS_KEY, []).append(
+            (old_name, columns, version)
+        )
+
+    @staticmethod
+    def _after_commit(session):
+        """Apply the recorded changes to the app's snapshot once committed."""
+        changed = session.info.pop(CHANGED_NAMES_KEY, set())
+        updated_rows = session.info.pop(UPDATED_ROWS_KEY, [])
+        full_refresh = session.info.pop(FULL_REFRESH_KEY, False)
+        # The session belongs to the current app, which has no snapshot
+        # yet while create_app() migrates its database
+        app_snapshot = current_app.extensions.get(SNAPSHOT_EXTENSION)
+        if app_snapshot is None:
+            return
+        handed_over = {
+            name
+            for old_name, columns, _ in updated_rows
+            for name in (old_name, columns.get("Country_Name", old_name))
+        }
+        if full_refresh:
+            app_snapshot.rebuild()
+        elif updated_rows and changed <= handed_over:
+            app_snapshot.patch_rows(updated_rows)
+        elif changed:
+            app_snapshot.refresh_rows(changed)
+
+    @staticmethod
+    def _after_rollback(session):
+        """Forget the recorded changes when the session rolls back."""
+        session.info.pop(CHANGED_NAMES_KEY, None)
+        session.info.pop(FULL_REFRESH_KEY, None)
+        session.info.pop(UPDATED_ROWS_KEY, None)
+
+    # -----
+    # Read helpers
+    # -----
+    @property
+    def generation(self):
+        """Get the write generation, increased by every committed change."""
+        return self._state.generation
+
+    @property
+    def years(self):
+        """Get the years of the current state's year axis."""
+        return self._state.years
+
+    def versioned_countries(self):
+        """
+        Get every country together with the generation it belongs to.
+
+        Both values are read from the same state, so a cache keyed on
+        the generation never stores countries from a different one.
+
+        Args:
+            None
+        Returns:
+            A tuple of (generation, list of serialized countries).
+        """
+        state = self._state
+        return state.generation, state.records
+
+    def countries(self):
+        """
+        Get every country as a serialized dictionary.
+
+        The returned dictionaries are shared, treat them as read-only.
+
+        Args:
+            None
+        Returns:
+            A list of serialized country dictionaries.
+        """
+        return self._state.records
+
+    def country(self, country_name):
+        """
+        Get one country as a serialized dictionary.
+
+        Args:
+            country_name (str): The name of the country.
+        Returns:
+            The serialized country dictionary, or None if not found.
+        """
+        state = self._state
+        row = state.index.get(country_name)
+        if row is None:
+            return None
+        return state.records[row]
+
+    def versioned_country(self, country_name):
+        """
+        Get one country together with its row version.
+
+        Both values are read from the same state, so the version always
+        belongs to the record returned.
+
+        Args:
+            country_name (str): The name of the country.
+        Returns:
+            A tuple of (serialized country dictionary, row version), or
+            (None, None) if not found.
+        """
+        state = self._state
+        row = state.index.get(country_name)
+        if row is None:
+            return None, None
+        return state.records[row], state.versions[country_name]
+
+    def year(self, chosen_year):
+        """
+        Get all countries and their values for one year.
+
+        Args:
+            chosen_year: The year, as an int or numeric string.
+        Returns:
+            A list of {"Country_Name", "year_XXXX"} dictionaries.
+        Raises:
+            AttributeError: If there is no data column for that year.
+        """
+        state = self._state
+        return state.year_payload(get_state_year(state, chosen_year))
+
+    def year_range(self, first_year, last_year, country_names=None):
+        """
+        Get the values for a range of years as a compact matrix.
+
+        Args:
+            first_year (int): The first year to include.
+            last_year (int): The last year to include.
+            country_names: Optional list of country names or country
+                codes, in the order wanted, or None for every country
+                in table order.
+        Returns:
+            A tuple of (years list, country names list, values list of
+            lists), with values None where there is no data.
+        Raises:
+            KeyError: If a country is not in the snapshot.
+        """
+        state = self._state
+        columns = [
+            position
+            for year, position in state.year_position.items()
+            if first_year <= year <= last_year
+        ]
+        if country_names is None:
+            rows = np.arange(len(state.names))
+        else:
+            rows = np.array(
+                [
+                    state.index[name] if name in state.index
+                    else state.code_index[name]
+                    for name in country_names
+                ],
+                dtype=np.intp,
+            )
+        # Take the slice in one step, then turn NaN into None
+        values = state.year_matrix[np.ix_(rows, columns)]
+        missing = np.isnan(values)
+        values = np.where(missing, 0, values).astype(np.int64).astype(object)
+        values[missing] = None
+        return (
+            [state.years[position] for position in columns],
+            state.names[rows].tolist(),
+            values.tolist(),
+        )
+
+    def group_totals(self, column, chosen_year):
+        """
+        Get the sum, mean and count of one year's values per group.
+
+        Args:
+            column (str): A metadata column in GROUP_COLUMNS.
+            chosen_year: The year, as an int or numeric string.
+        Returns:
+            A list of {column, "sum", "mean", "count"} dictionaries, one
+            per group in name order.
+        Raises:
+            AttributeError: If there is no data column for that year.
+        """
+        state = self._state
+        return state.group_totals(
+            column, get_state_year(state, chosen_year)
+        )
+
+    def ranking(self, key, number, descending=True):
+        """
+        Get the first countries ranked by the value of one record key.
+
+        Countries with a null value for the key are left out.
+
+        Args:
+            key (str): A numeric record key, e.g. a summary column or
+                year_XXXX.
+            number (int): How many countries to return.
+            descending (bool): True for the highest values first.
+        Returns:
+            A list of (country name, value) tuples, value a float.
+        """
+        return self.leaderboard.top(
+            lambda: self._state.records, key, number, descending
+        )
+
+    def search(self, query, limit):
+        """
+        Get the countries whose name or code best match a query.
+
+        Args:
+            query (str): A name or code, or the start of one, possibly
+                with typos (see search.py).
+            limit (int): How many countries to return.
+        Returns:
+            A list of serialized country dictionaries, best match first.
+        """
+        state = self._state
+        # A country removed since the search index was read is left out
+        return [
+            state.records[state.index[name]]
+            for name, _ in self.search_index.search(query, limit)
+            if name in state.index
+        ]
+
+
+def get_snapshot():
+    """
+    Get the snapshot of the current app, added by create_app().
+
+    Args:
+        None
+    Returns:
+        The app's TourismSnapshot.
+    """
+    return current_app.extensions[SNAPSHOT_EXTENSION]
+
+
+# The snapshot of the current app, as Flask's current_app is the app
+snapshot = LocalProxy(get_snapshot)
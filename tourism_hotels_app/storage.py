@@ -0,0 +1,181 @@
+"""File containing how the app connects to its SQLite database.
+
+There are two engines, each with its own connection pool:
+
+- the writer, db.engine, used by the update routes through db.session
+- the reader, get_reader_engine(), opened read-only (mode=ro) with
+  query_only set, used by everything that only reads
+
+Readers never take a write lock, so they can run in parallel on any
+number of threads, while writes are serialized in the app by
+WRITE_LOCK instead of racing each other for SQLite's lock. The lock is
+only held for a write and its commit (see hold_write_lock()), never
+while a request body is read.
+
+The storage profile is chosen with SQLITE_STORAGE_PROFILE in config.py,
+and its PRAGMAs are run through a SQLAlchemy connect event, so every
+pooled connection is set up the same way.
+"""
+import threading
+from contextlib import contextmanager
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from tourism_hotels_app import db
+from tourism_hotels_app.config import SQLITE_STORAGE_PROFILES
+
+# Bind key of the read-only engine in SQLALCHEMY_BINDS
+READER_BIND = "reader"
+
+# Held by every write through db.session, until it is committed
+WRITE_LOCK = threading.Lock()
+
+# PRAGMAs that change the database file, which the reader cannot run
+_WRITER_ONLY_PRAGMAS = ("journal_mode",)
+
+
+def get_reader_uri(uri):
+    """
+    Get the read-only version of a SQLite database URI.
+
+    Args:
+        uri (str): The SQLALCHEMY_DATABASE_URI of the app.
+    Returns:
+        The URI opening the same file with mode=ro, or the URI itself
+        if it is not a SQLite file (e.g. an in-memory database).
+    """
+    url = make_url(uri)
+    if not url.drivername.startswith("sqlite") or url.database in (
+        None, "", ":memory:"
+    ):
+        return uri
+    database = url.database
+    if not url.query.get("uri"):
+        database = f"file:{database}"
+    return url.set(
+        database=database,
+        query={**url.query, "mode": "ro", "uri": "true"},
+    ).render_as_string(hide_password=False)
+
+
+def add_reader_bind(app):
+    """
+    Add the read-only engine to the app's SQLALCHEMY_BINDS.
+
+    Must be called before db.init_app(). A reader bind already in the
+    config is kept, so a config can point it at a replica.
+
+    Args:
+        app: Flask app application instance
+    Returns:
+        None
+    """
+    binds = dict(app.config.get("SQLALCHEMY_BINDS") or {})
+    binds.setdefault(
+        READER_BIND, get_reader_uri(app.config["SQLALCHEMY_DATABASE_URI"])
+    )
+    app.config["SQLALCHEMY_BINDS"] = binds
+
+
+def get_reader_engine():
+    """
+    Get the read-only engine, must be called inside the app context.
+
+    Args:
+        None
+    Returns:
+        The SQLAlchemy engine of the reader bind.
+    """
+    return db.engines[READER_BIND]
+
+
+def get_storage_profile(profile_name):
+    """
+    Get the PRAGMAs of a named storage profile.
+
+    Args:
+        profile_name (str): A name in SQLITE_STORAGE_PROFILES.
+    Returns:
+        A dictionary of PRAGMA name to value.
+    Raises:
+        ValueError: If there is no profile with that name.
+    """
+    try:
+        return SQLITE_STORAGE_PROFILES[profile_name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown SQLITE_STORAGE_PROFILE {profile_name!r}, choose "
+            f"one of: {', '.join(SQLITE_STORAGE_PROFILES)}"
+        )
+
+
+def listen_pragmas(engine, pragmas):
+    """
+    Sub-helper function.
+
+    Runs PRAGMAs on every new DBAPI connection of a SQLite engine.
+
+    Args:
+        engine: A SQLAlchemy engine.
+        pragmas (dict): PRAGMA name to value, run in order.
+    Returns:
+        None
+    """
+    if engine.dialect.name != "sqlite" or not pragmas:
+        return
+
+    def set_pragmas(dbapi_connection, connection_record):
+        """Run the PRAGMAs on a new DBAPI connection."""
+        cursor = dbapi_connection.cursor()
+        # journal_mode comes first, as it applies to the whole file
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+    event.listen(engine, "connect", set_pragmas)
+
+
+def apply_storage_profile(app):
+    """
+    Run the configured profile's PRAGMAs on every new connection.
+
+    The reader also gets query_only, and leaves out the PRAGMAs that
+    would write to the file. Must be called inside the app context,
+    before the first connection is made.
+
+    Args:
+        app: Flask app application instance
+    Returns:
+        None
+    Raises:
+        ValueError: If the configured profile does not exist.
+    """
+    pragmas = get_storage_profile(app.config["SQLITE_STORAGE_PROFILE"])
+    listen_pragmas(db.engine, pragmas)
+    reader_pragmas = {
+        name: value
+        for name, value in pragmas.items()
+        if name not in _WRITER_ONLY_PRAGMAS
+    }
+    reader_pragmas["query_only"] = 1
+    listen_pragmas(get_reader_engine(), reader_pragmas)
+
+
+@contextmanager
+def hold_write_lock():
+    """
+    Hold WRITE_LOCK while writing through db.session and committing.
+
+    If the write fails, the session is rolled back before the lock is
+    released, so the next writer does not wait on SQLite's lock.
+
+    Args:
+        None
+    Yields:
+        None
+    """
+    with WRITE_LOCK:
+        try:
+            yield
+        except Exception:
+            db.session.rollback()
+            raise
@@ -1,23 +1,32 @@
 """File containing various helper functions used in all route blueprints."""
+import base64
+import binascii
 from tourism_hotels_app import db
-from tourism_hotels_app.models import TourismArrivals
-from tourism_hotels_app.schemas import TourismArrivalsSchema
-from flask import request
-
-# Schemas
-# Import Marshmallow schemas and create instances of each
-# Create instance for multiple results (i.e. for many/all countries).
-countries_schema = TourismArrivalsSchema(many=True)
-# Create instance for one country
-country_schema = TourismArrivalsSchema()
+from tourism_hotels_app.models import ROW_VERSION_KEY, TourismArrivals
+from tourism_hotels_app.snapshot import GROUP_COLUMNS, snapshot
+from tourism_hotels_app.storage import get_reader_engine
+from tourism_hotels_app.leaderboard import METRICS
+from tourism_hotels_app.observations import (
+    CHANGED_COUNTRIES_OPTION,
+    get_legacy_years,
+    get_metadata_serializer,
+    load_records,
+    write_observations,
+)
+from tourism_hotels_app.derived_metrics import compute_country_metrics
+from tourism_hotels_app.validation import country_validator
+from tourism_hotels_app.profiling import profile_phase
+from tourism_hotels_app.serializers import get_serializer
+from flask import jsonify
+from sqlalchemy.orm.exc import StaleDataError
 
 
 def get_countries():
     """
     Get all countries and convert to JSON - helper function.
 
-    Gets all country rows from the database as objects
-    and converts to json.
+    Gets all country rows from the in-memory snapshot, already
+    serialized in the same format as the Marshmallow schema.
 
     Args:
         None
@@ -25,15 +34,133 @@ def get_countries():
         countries_json: A JSON representation of all countries
         and their international tourism details.
     """
-    # Use SQLAlchemy to execute a SELECT query on 'TourismArrivals'
-    # table and get all rows as object
-    all_countries = db.session.execute(db.select(TourismArrivals)).scalars()
-
-    # Use Marshmallow to convert the objects to JSON format
-    countries_json = countries_schema.dump(all_countries)
+    # Read from the snapshot instead of querying the database
+    countries_json = snapshot.countries()
     return countries_json
 
 
+def get_countries_payload():
+    """
+    Get all countries as a cached, pre-serialized JSON payload.
+
+    The payload is encoded once per write generation of the snapshot,
+    which every committed POST or PATCH increases.
+
+    Args:
+        None
+    Returns:
+        countries_payload: A CachedPayload with the countries data,
+        the encoded JSON bytes and the ETag.
+    """
+    countries_payload = snapshot.payload_cache.get(
+        "countries", snapshot.versioned_countries
+    )
+    return countries_payload
+
+
+def get_countries_page(limit, cursor=None):
+    """
+    Get one page of countries using keyset pagination - helper function.
+
+    Countries are ordered by the Country Name primary key and the page
+    starts after the name held in the cursor, so the unique index is
+    used to seek to the page instead of skipping over earlier rows.
+
+    Args:
+        limit (int): The maximum number of countries in the page.
+        cursor (str): Optional cursor from the previous page, or None
+        for the first page.
+
+    Returns:
+        countries_page_json: A JSON representation of the countries in
+        the page.
+        next_cursor: The cursor for the next page, or None if this is
+        the last page.
+
+    Raises:
+        ValueError: If the cursor is not a valid cursor.
+    """
+    query = get_metadata_serializer().statement.order_by(
+        TourismArrivals.Country_Name
+    )
+    if cursor is not None:
+        query = query.where(
+            TourismArrivals.Country_Name > decode_cursor(cursor)
+        )
+    # Fetch one extra row to know whether there is a next page, the
+    # years of the page are then read from tourism_observations, through
+    # the read-only engine
+    with get_reader_engine().connect() as connection:
+        countries_page_json = load_records(
+            connection, query.limit(limit + 1)
+        )
+
+    next_cursor = None
+    if len(countries_page_json) > limit:
+        countries_page_json = countries_page_json[:limit]
+        next_cursor = encode_cursor(countries_page_json[-1]["Country_Name"])
+    return countries_page_json, next_cursor
+
+
+def get_countries_in_group(group_key, group):
+    """
+    Get every country of a region or income group - helper function.
+
+    The countries are read from the database, through the read-only
+    engine, with the index on the group's column (see models.py), which
+    also gives them in name order.
+
+    Args:
+        group_key (str): A key of GROUP_COLUMNS, "region" or "income".
+        group (str): The region or income group, e.g. "South Asia".
+
+    Returns:
+        group_countries_json: A list of the serialized countries of the
+        group, empty if there are none.
+    """
+    column = getattr(TourismArrivals, GROUP_COLUMNS[group_key])
+    query = (
+        get_metadata_serializer()
+        .statement.where(column == group)
+        .order_by(TourismArrivals.Country_Name)
+    )
+    with get_reader_engine().connect() as connection:
+        group_countries_json = load_records(connection, query)
+    return group_countries_json
+
+
+def get_group_totals(group_key, year):
+    """
+    Get one year's arrivals summed, averaged and counted per group.
+
+    Computed from the snapshot's year matrix in one vectorized pass,
+    then kept until the next write.
+
+    Args:
+        group_key (str): A key of GROUP_COLUMNS, "region" or "income".
+        year: The year, from the query string.
+    Returns:
+        group_totals_json: A dictionary with the `by` key, the `year`
+        and `data`, a list of {column, "sum", "mean", "count"}
+        dictionaries, one per group.
+    Raises:
+        ValueError: If the group key is unknown or the year is missing.
+        AttributeError: If there is no data for the year.
+    """
+    if group_key not in GROUP_COLUMNS:
+        raise ValueError(f"by must be one of: {', '.join(GROUP_COLUMNS)}")
+    if year is None:
+        raise ValueError("year is required")
+    if not is_whole_number(str(year)):
+        raise ValueError("year must be a year")
+    group_totals_json = {
+        "by": group_key,
+        "year": int(year),
+        "data": snapshot.group_totals(GROUP_COLUMNS[group_key], year),
+    }
+    return group_totals_json
+
+
 def get_country(country_name):
     """
     Get data for a single country by name - helper function.
@@ -44,23 +171,83 @@ def get_country(country_name):
 
     Returns:
         country_result_json: A JSON representation of data for the
-        requested country.
-        none_result: None if the country is not found in the database.
+        requested country, or None if the country is not found.
     """
-    # Use SQLalchemy to query the database for the requested country
-    country = db.session.execute(
-        db.select(TourismArrivals).filter_by(Country_Name=country_name)
-    ).scalar_one_or_none()
+    # Look up the country by name in the snapshot's index
+    country_result_json = snapshot.country(country_name)
+    return country_result_json
 
-    # If country is found in database,
-    # Use Marshmallow to convert the objects to JSON format
-    if country:
-        country_result_json = country_schema.dump(country)
-        return country_result_json
-    # If the country is not found in the database, return None
-    else:
-        none_result = country
-        return none_result
+
+def get_search_results(query, limit):
+    """
+    Get the countries matching a name or code typed so far.
+
+    Args:
+        query (str): The start of a country's name, of a later word of
+            it or of its code, typos allowed (see search.py).
+        limit (int): How many countries to return.
+    Returns:
+        search_results_json: A list of {"Country_Name", "Country_Code",
+        "Region"} dictionaries, best match first.
+    """
+    search_results_json = [
+        {
+            "Country_Name": record["Country_Name"],
+            "Country_Code": record["Country_Code"],
+            "Region": record["Region"],
+        }
+        for record in snapshot.search(query, limit)
+    ]
+    return search_results_json
+
+
+def get_versioned_country(country_name):
+    """
+    Get data for a single country by name, with its ETag.
+
+    Args:
+        country_name (str): The name of the country submitted in the
+        URI to retrieve data.
+
+    Returns:
+        A tuple of (the country's data, its ETag), or (None, None) if
+        the country is not found.
+    """
+    country_result_json, row_version = snapshot.versioned_country(
+        country_name
+    )
+    if country_result_json is None:
+        return None, None
+    return country_result_json, get_country_etag(row_version)
+
+
+def is_whole_number(text):
+    """
+    Find whether a query string value is a whole number, e.g. a limit.
+
+    Only ASCII digits count, as str.isdigit() also accepts characters
+    such as "²" that int() cannot read.
+
+    Args:
+        text (str): The value from the query string.
+
+    Returns:
+        True if the value is one or more of the digits 0 to 9.
+    """
+    return text.isascii() and text.isdecimal()
+
+
+def get_country_etag(row_version):
+    """
+    Get the ETag of a country from its row version.
+
+    Args:
+        row_version (int): The Row_Version of the country.
+
+    Returns:
+        The ETag, without quotes, e.g. "v3".
+    """
+    return f"v{row_version}"
 
 
 def get_year(chosen_year):
@@ -75,33 +262,114 @@ def get_year(chosen_year):
     Returns:
         year_data_json: A JSON representation of data for the
         requested yer.
+    Raises:
+        AttributeError: If there is no column for the chosen year.
     """
-    # Get the data from the database using SQLAlchemy
-    query = TourismArrivals.query.with_entities(
-        TourismArrivals.Country_Name,
-        getattr(TourismArrivals, f"year_{chosen_year}"),
-    ).all()
-    # Create the schema for chosen year to serialize the data
-    country_schema_for_chosen_year = TourismArrivalsSchema(
-        only=["Country_Name", f"year_{chosen_year}"], many=True
-    )
-    # Serialize the data to JSON using Marshmallow
-    year_data_json = country_schema_for_chosen_year.dump(query)
+    # Take the year's column from the snapshot's year matrix
+    year_data_json = snapshot.year(chosen_year)
     return year_data_json
 
 
-def create_country_format():
+def get_year_range(first_year, last_year, countries=None):
+    """
+    Get a countries x years matrix for a range of years.
+
+    Args:
+        first_year (int): The first year of the range.
+        last_year (int): The last year of the range.
+        countries: Optional list of country names or country codes,
+            or None for all countries.
+    Returns:
+        year_range_json: A dictionary with the `years` and `countries`
+        lists and the `values` matrix, one row per country.
+    Raises:
+        ValueError: If the range is empty or a country is unknown.
+        AttributeError: If there is no data for any year in the range.
+    """
+    if first_year > last_year:
+        raise ValueError("from must not be after to")
+
+    try:
+        years, names, values = snapshot.year_range(
+            first_year, last_year, countries
+        )
+    except KeyError as unknown_country:
+        raise ValueError(f"Unknown country: {unknown_country.args[0]}")
+    if not years:
+        raise AttributeError("No data for the years in the range")
+    year_range_json = {"years": years, "countries": names, "values": values}
+    return year_range_json
+
+
+def get_top_countries(number):
+    """
+    Get the countries with the highest 10-year average arrivals.
+
+    Args:
+        number (int): How many countries to return.
+    Returns:
+        top_countries_list: A list of (country name, average) tuples,
+        ordered from the highest average.
+    """
+    top_countries_list = snapshot.ranking(METRICS["average"], number)
+    return top_countries_list
+
+
+def get_ranking(metric, number, year=None, descending=True):
+    """
+    Get the countries ranked by a metric, numerically.
+
+    Args:
+        metric (str): One of the names in METRICS.
+        number (int): How many countries to return.
+        year: The year to rank, only used (and required) for the
+            "arrivals" metric.
+        descending (bool): True for the highest values first.
+    Returns:
+        ranking_json: A list of {"rank", "Country_Name", "value"}
+        dictionaries.
+    Raises:
+        ValueError: If the metric is unknown or the year is missing or
+            has no data.
+    """
+    if metric not in METRICS:
+        raise ValueError(
+            f"metric must be one of: {', '.join(METRICS)}"
+        )
+    key = METRICS[metric]
+    if key is None:
+        if year is None or not is_whole_number(str(year)):
+            raise ValueError(f"year is required for the {metric} metric")
+        if int(year) not in snapshot.years:
+            raise ValueError(f"No data for year {year}")
+        key = f"year_{int(year)}"
+
+    ranking_json = [
+        {"rank": rank, "Country_Name": country_name, "value": value}
+        for rank, (country_name, value) in enumerate(
+            snapshot.ranking(key, number, descending), start=1
+        )
+    ]
+    return ranking_json
+
+
+def create_country_format(data):
     """
     Create a new instance of TourismArrivals country with provided data.
 
-    Validates that the provided data conforms to the expected data
-    types and that all required fields are present and not null.
+    Validates the JSON of the request with the validator
+    compiled from the model's rules (see validation.py), that all
+    required fields are present, of their types and not null.
+    The derived metrics (average, max, min and percent drop) are
+    computed from the year values, any sent by the client are ignored.
 
     Args:
-        None
+        data: The JSON data sent in the HTTP POST request.
 
     Returns:
         new_country_format: A new instance of the TourismArrivals class.
+        new_years: A dictionary of any years without a model column
+        (e.g. 2021) and their values, to store with add_new_years().
 
     Raises:
         AttributeError: If a column/key name provided in the JSON data
@@ -109,56 +377,74 @@ def create_country_format():
         ValueError: If any of the following validation checks fails:
             - A required key/column name is missing from the JSON data.
             - The value for a key/column name does not match its
-              expected data type, defined in sub-helper function.
+              expected data type, defined in validation.py.
             - A value is null or empty for a non-nullable key/column name.
+            - A value fails a custom check, e.g. a negative year.
 
     """
-    # Call helper function to get expected keys, data types
-    # Also get current json response
-    data, expected_types, non_nullable_columns = get_expected_types()
-
-    # Check that all required keys, i.e. Column names are present
-    # in the JSON data
-    required_keys = expected_types.keys()
-    missing_keys = required_keys - data.keys()
-    if missing_keys:
-        raise ValueError(f"Missing required keys: {', '.join(missing_keys)}")
-
-    # Check that the values of the keys match their expected types
-    for key, expected_type in expected_types.items():
-        value = data.get(key)
-        if value is not None and not isinstance(value, expected_type):
-            raise ValueError(
-                f"The value entered for {key} should be of type: "
-                f"{expected_type.__name__}"
-            )
-
-    # For the first 5 columns only, the entered data cannot be null
-    for key in list(data.keys())[:5]:
-        if key in non_nullable_columns:
-            if not data[key]:
-                raise ValueError(f"The value entered for {key} "
-                                 f"cannot be empty or null")
+    # Validate the JSON request body
+    with profile_phase("validation"):
+        column_data, new_years = country_validator.validate_new(data)
 
     # If all the validation passes, create the new country format object
-    new_country_format = TourismArrivals(**data)
-    return new_country_format
+    new_country_format = TourismArrivals(**column_data)
+    values_by_year = {
+        year: column_data.get(f"year_{year}") for year in get_legacy_years()
+    }
+    values_by_year.update(new_years)
+    set_derived_metrics(new_country_format, values_by_year)
+    return new_country_format, new_years
+
+
+def add_new_years(country, new_years):
+    """
+    Store the years without a model column for a country - helper function.
+
+    Flushes the session first, so that a new or renamed country is in
+    the database before its observations are written.
 
+    Args:
+        country: The TourismArrivals instance the years belong to.
+        new_years (dict): Maps year (int) to value, None to delete.
 
-def get_updated_country(existing_country, country_name):
+    Returns:
+        None
+    """
+    if new_years:
+        db.session.flush()
+        write_observations(
+            db.session,
+            country.Country_Name,
+            country.Indicator_Name,
+            new_years,
+        )
+
+
+def get_updated_country(country_name, data, if_match=None):
     """
     Update an existing country record in database with HTTP PATCH.
 
-    With the JSON data sent in the HTTP PATCH request, updates
-    the existing country if it exists.
+    The changes are checked against the country's copy in the snapshot
+    instead of a row read from the database, then written with one
+    UPDATE ... RETURNING that only matches the row if it still has the
+    snapshot's row version. The snapshot is patched with the changes,
+    so nothing is read back either. Years without a model column need
+    one more statement, to write their observations.
+
+    If the UPDATE matches no row, the database has a change this
+    process has not seen, e.g. from another process, so the country is
+    reloaded into the snapshot and the changes are checked once more.
 
     Args:
-        existing_country: The existing country record to be updated.
         country_name (str): The name of the country to be updated.
+        data: The JSON data sent in the HTTP PATCH request.
+        if_match: Optional ETags of the request's If-Match header, the
+            update is only made if they include the country's ETag.
 
     Returns:
-        updated_result_json: A JSON string representing the updated
-        country record.
+        A tuple of (updated_result_json, etag): a JSON string
+        representing the updated country record and its new ETag, or
+        (None, None) if the country does not exist.
 
     Raises:
         AttributeError: If a column/key name does not exist in the
@@ -167,131 +453,178 @@ def get_updated_country(existing_country, country_name):
                       expected type.
                     - If a value entered for a non-nullable key
                       is empty or null,
+                    - If a value entered fails a custom check,
+                      e.g. a negative year.
                     - If a new value entered for a key already
                       exists in the database.
+                    - If a derived metric is entered, as those are
+                      computed from the year values.
+        StaleDataError: If if_match does not include the country's
+        ETag, or the row kept changing while it was being updated.
 
     """
-    data, expected_types, non_nullable_columns = get_expected_types()
-    # Check that column/key name actually exists first
-    for key in list(data.keys()):
-        if key not in expected_types:
-            raise AttributeError
-
-    # Check that the values of the keys match their expected types
-    for key, expected_type in expected_types.items():
-        value = data.get(key)
-        # If entered value is not null but not the correct type, raise error
-        if value is not None and not isinstance(value, expected_type):
-            raise ValueError(
-                f"The value entered for {key} should be of type: "
-                f"{expected_type.__name__}"
+    for attempt in range(2):
+        current_record, row_version = snapshot.versioned_country(
+            country_name
+        )
+        if current_record is None:
+            return None, None
+        if if_match and get_country_etag(row_version) not in if_match:
+            raise StaleDataError(
+                f"{country_name} is at version {row_version}"
             )
-
-    # For the first 5 columns only, the entered data cannot be null
-    for key in list(data.keys())[:5]:
-        if key in non_nullable_columns:
-            if not data[key]:
-                raise ValueError(f"The value entered for {key} "
-                                 "cannot be empty or null")
-
-    # Get the updated details from the json sent in the HTTP patch request
-    country_json = request.get_json()
-
-    # Check if any new value entered for key (entire value) already exists
-    for key, value in country_json.items():
-        # Strips whitespace when matching to ensure only if
-        # entire value exists, to raise the error
-        existing_record = getattr(existing_country, key)
-        if value == existing_record:
-            raise ValueError(
-                f"Value entered of '{value}' for '{key}' "
-                "already exists in the database"
+        with profile_phase("validation"):
+            column_values, new_years, values_by_year = (
+                country_validator.validate_patch(data, current_record)
             )
-
-    # Update existing records with JSON changes and commit to database
-    country_schema.load(country_json, instance=existing_country, partial=True)
+        # An empty patch changes nothing, not even the row version
+        if not column_values and not new_years:
+            return jsonify(current_record), get_country_etag(row_version)
+
+        # If any year changes, recompute the derived metrics of this
+        # country only, from its years with the changes applied
+        if values_by_year is not None:
+            column_values.update(compute_country_metrics(values_by_year))
+        new_version = update_country_row(
+            country_name, row_version, column_values
+        )
+        if new_version is not None:
+            break
+        # Load the change this process missed, then check again
+        snapshot.refresh_rows([country_name])
+    else:
+        raise StaleDataError(
+            f"{country_name} was changed while it was being updated"
+        )
+
+    updated_name = column_values.get("Country_Name", country_name)
+    if new_years:
+        # The snapshot reloads the country, with its new years
+        write_observations(
+            db.session,
+            updated_name,
+            column_values.get(
+                "Indicator_Name", current_record["Indicator_Name"]
+            ),
+            new_years,
+        )
+    else:
+        # Serialized as a SELECT of the row would be, rather than from
+        # what RETURNING gives, as SQLite returns a whole number stored
+        # in a FLOAT column as an int there
+        changed_columns = get_serializer(tuple(column_values)).dump_row(
+            column_values.values()
+        )
+        snapshot.add_updated_row(
+            db.session, country_name, changed_columns, new_version
+        )
+    # The commit also patches the read snapshot (see snapshot.py)
     db.session.commit()
-    # Return json showing the updated record
-    updated_country = db.session.execute(
-        db.select(TourismArrivals).filter_by(Country_Name=country_name)
-    ).scalar_one_or_none()
-    updated_result_json = country_schema.jsonify(updated_country)
+    # Return json showing the updated record, from the patched snapshot
+    updated_record, etag = get_versioned_country(updated_name)
+    updated_result_json = jsonify(updated_record)
 
-    return updated_result_json
+    return updated_result_json, etag
+
+
+def update_country_row(country_name, row_version, column_values):
+    """
+    Update one country's row with a single UPDATE ... RETURNING.
+
+    The row version is increased by the statement, as the ORM would,
+    and returned to tell whether the row was matched.
+
+    Args:
+        country_name (str): The name of the country to be updated.
+        row_version (int): The row version the changes were checked
+            against, the row is only updated if it still has it.
+        column_values (dict): Maps model attribute names to new values.
+
+    Returns:
+        The new row version, or None if no row has that name and row
+        version.
+    """
+    table = TourismArrivals.__table__
+    column_attrs = TourismArrivals.__mapper__.column_attrs
+    version_column = column_attrs[ROW_VERSION_KEY].columns[0]
+    updated_name = column_values.get("Country_Name", country_name)
+    statement = (
+        db.update(table)
+        .where(
+            table.c["Country Name"] == country_name,
+            version_column == row_version,
+        )
+        .values({
+            column_attrs[key].columns[0]: value
+            for key, value in column_values.items()
+        })
+        .values({version_column: row_version + 1})
+        .returning(version_column)
+    )
+    return db.session.execute(
+        statement,
+        execution_options={
+            CHANGED_COUNTRIES_OPTION: {country_name, updated_name}
+        },
+    ).scalar_one_or_none()
 
 
 # -----
 # Sub-Helper Functions used by Helper Functions on this page
 # -----
-def get_expected_types():
+def encode_cursor(country_name):
     """
     Sub-helper function.
 
-    Gets expected correct column names and their data types,
-    according to what they should be when creating the database
-    and defining SQLA models and schemas.
-    Also gets the non-nullable columns as defined in the models
-    and schemas in the relevant files, as well as JSON data of the
-    current request.
+    Encodes the last country name of a page as an opaque cursor.
 
     Args:
-        None
+        country_name (str): The last country name in the page.
     Returns:
-        expected_types_dict: A dictionary of the expected column names
-        and data types they should be.
-        non_nullable_columns: A dictionary containing the columns that
-        cannot be null.
-        current_request_data_json: JSON data of the current request
-    """
-    # Define a dictionary with keys as column names
-    # The dictionary values are the column's expected data types
-    expected_types_dict = {
-        "Country_Name": str,
-        "Region": str,
-        "IncomeGroup": str,
-        "Country_Code": str,
-        "Indicator_Name": str,
-        "year_1995": int,
-        "year_1996": int,
-        "year_1997": int,
-        "year_1998": int,
-        "year_1999": int,
-        "year_2000": int,
-        "year_2001": int,
-        "year_2002": int,
-        "year_2003": int,
-        "year_2004": int,
-        "year_2005": int,
-        "year_2006": int,
-        "year_2007": int,
-        "year_2008": int,
-        "year_2009": int,
-        "year_2010": int,
-        "year_2011": int,
-        "year_2012": int,
-        "year_2013": int,
-        "year_2014": int,
-        "year_2015": int,
-        "year_2016": int,
-        "year_2017": int,
-        "year_2018": int,
-        "year_2019": int,
-        "year_2020": int,
-        "Average_10year_in_tourist_arrivals": str,
-        "Max_number_of_arrivals": int,
-        "Minimum_number_of_arrivals": int,
-        "Percent_drop_2019_to_2020": str,
-    }
+        The URL safe cursor string.
+    """
+    return base64.urlsafe_b64encode(country_name.encode("utf-8")).decode()
 
-    # Define the columns that can't be null and their data types
-    non_nullable_columns = {
-        "Country_Name": str,
-        "Region": str,
-        "IncomeGroup": str,
-        "Country_Code": str,
-        "Indicator_Name": str,
-    }
 
-    # Get the JSON data from the current request
-    current_request_data_json = request.get_json()
-    return current_request_data_json, expected_types_dict, non_nullable_columns
+def decode_cursor(cursor):
+    """
+    Sub-helper function.
+
+    Decodes a cursor made by encode_cursor() back to a country name.
+    Characters outside the URL safe alphabet are refused rather than
+    skipped, and so is anything encode_cursor() would not have made.
+
+    Args:
+        cursor (str): The cursor passed in the query string.
+    Returns:
+        The country name the next page starts after.
+    Raises:
+        ValueError: If the cursor is not a valid cursor.
+    """
+    try:
+        country_name = base64.b64decode(
+            cursor.encode("ascii"), altchars=b"-_", validate=True
+        ).decode("utf-8")
+    except (binascii.Error, UnicodeError):
+        raise ValueError("Invalid cursor")
+    # e.g. "+" or "/", or padding or bits left over after the name
+    if encode_cursor(country_name) != cursor:
+        raise ValueError("Invalid cursor")
+    return country_name
+
+
+def set_derived_metrics(country, values_by_year):
+    """
+    Sub-helper function.
+
+    Sets the derived metrics of a country from its year values.
+
+    Args:
+        country: A TourismArrivals instance.
+        values_by_year (dict): Maps year (int) to the country's value,
+            None if it has no value.
+    Returns:
+        None
+    """
+    for key, value in compute_country_metrics(values_by_year).items():
+        setattr(country, key, value)
@@ -0,0 +1,475 @@
+"""File containing the validation rules of a country, from the model.
+
+COLUMN_RULES has one rule per TourismArrivals column, worked out from
+the column's type and nullability, plus the custom checks of its kind
+of column, so the rules cannot drift from the model. They are compiled
+once, at import, into country_validator, which checks the JSON of one
+country for POST, PATCH and both bulk routes with one call per key
+sent, while validate_frame() checks a whole pandas DataFrame at once
+for the csv import, one vectorized pass per column, and coerces its
+values to the model's types.
+"""
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+from sqlalchemy import Integer
+from tourism_hotels_app.models import ROW_VERSION_KEY, TourismArrivals
+from tourism_hotels_app.derived_metrics import DERIVED_KEYS
+from tourism_hotels_app.observations import get_year
+
+# The rule of one model column: its key in JSON, its name in the
+# database and csv, the Python type the API expects, whether it may be
+# null, whether it is computed from the year values and its custom
+# checks, as (test, message) pairs
+ColumnRule = namedtuple(
+    "ColumnRule",
+    ["key", "column_name", "python_type", "nullable", "derived", "checks"],
+)
+
+# Column added to rejected rows, saying why they were rejected
+ERROR_COLUMN = "Error"
+
+# Smallest and largest values of a SQLite INTEGER, a signed 64-bit one
+INTEGER_LIMITS = (-(2 ** 63), 2 ** 63 - 1)
+
+
+def fits_integer(value):
+    """
+    Find whether values can be stored in a SQLite INTEGER column.
+
+    The upper limit is compared as "less than 2 ** 63", as the largest
+    INTEGER rounds up to 2 ** 63 as a float, which no longer fits. Not
+    a number and infinities never fit.
+
+    Args:
+        value: An int, or a pandas Series of numbers.
+    Returns:
+        True where the value is within INTEGER_LIMITS.
+    """
+    return (value >= INTEGER_LIMITS[0]) & (value < INTEGER_LIMITS[1] + 1)
+
+
+def is_not_negative(value):
+    """
+    Find whether values are zero or more.
+
+    Args:
+        value: An int, or a pandas Series of numbers.
+    Returns:
+        True where the value is not negative.
+    """
+    return value >= 0
+
+
+# Custom checks, run on values that are not null and of the column's
+# type. A test takes one value, or a pandas Series of them for the csv
+# import, and is True where the value passes, so both paths share them
+INTEGER_CHECKS = ((fits_integer, "is too large to be stored"),)
+# Arrivals are counted, so no year can have fewer than none
+YEAR_CHECKS = INTEGER_CHECKS + ((is_not_negative, "cannot be negative"),)
+
+
+def get_column_rules():
+    """
+    Work out the rule of every column of the TourismArrivals model.
+
+    Integer columns expect int and Text columns expect str, and year
+    columns are checked with YEAR_CHECKS, the other Integer columns
+    with INTEGER_CHECKS. The row version is not a country field, so it
+    has no rule.
+
+    Args:
+        None
+    Returns:
+        A tuple of ColumnRule, in model column order.
+    """
+    rules = []
+    for key, attr in TourismArrivals.__mapper__.column_attrs.items():
+        if key == ROW_VERSION_KEY:
+            continue
+        column = attr.columns[0]
+        is_integer = isinstance(column.type, Integer)
+        if get_year(key) is not None:
+            checks = YEAR_CHECKS
+        else:
+            checks = INTEGER_CHECKS if is_integer else ()
+        rules.append(ColumnRule(
+            key=key,
+            column_name=column.name,
+            python_type=int if is_integer else str,
+            nullable=column.nullable,
+            derived=key in DERIVED_KEYS,
+            checks=checks,
+        ))
+    return tuple(rules)
+
+
+def get_year_rule(key):
+    """
+    Get the rule of a year_XXXX key that has no model column.
+
+    Args:
+        key (str): The year key, e.g. "year_2021".
+    Returns:
+        The ColumnRule of the key, stored as an observation.
+    """
+    return ColumnRule(
+        key=key,
+        column_name=str(get_year(key)),
+        python_type=int,
+        nullable=True,
+        derived=False,
+        checks=YEAR_CHECKS,
+    )
+
+
+COLUMN_RULES = get_column_rules()
+
+
+def type_error(rule):
+    """
+    Sub-helper function giving the message of a value of the wrong type.
+
+    Args:
+        rule (ColumnRule): The rule of the column.
+    Returns:
+        The message, the same as the API's.
+    """
+    return (
+        f"The value entered for {rule.key} should be of type: "
+        f"{rule.python_type.__name__}"
+    )
+
+
+def null_error(rule):
+    """
+    Sub-helper function giving the message of a missing required value.
+
+    Args:
+        rule (ColumnRule): The rule of the column.
+    Returns:
+        The message, the same as the API's.
+    """
+    return f"The value entered for {rule.key} cannot be empty or null"
+
+
+def check_error(rule, message):
+    """
+    Sub-helper function giving the message of a failed custom check.
+
+    Args:
+        rule (ColumnRule): The rule of the column.
+        message (str): The message of the check, e.g. "cannot be
+            negative".
+    Returns:
+        The message, in the API's words.
+    """
+    return f"The value entered for {rule.key} {message}"
+
+
+def compile_check(rule):
+    """
+    Compile the rule of one column into a function checking a value.
+
+    Every message is worked out here, once, so checking a value does no
+    more than its type, null and custom checks.
+
+    Args:
+        rule (ColumnRule): The rule of the column.
+    Returns:
+        A function taking a JSON value, returning the message of the
+        first check it fails, or None if it is valid.
+    """
+    expected_type = rule.python_type
+    type_message = type_error(rule)
+    null_message = None if rule.nullable else null_error(rule)
+    checks = tuple(
+        (test, check_error(rule, message)) for test, message in rule.checks
+    )
+
+    def check(value):
+        """Give the error of a value of the column, or None."""
+        if value is None:
+            return null_message
+        # Not isinstance(), as JSON true and false are Python ints
+        if type(value) is not expected_type:
+            return type_message
+        # Text of only whitespace is empty, as in validate_frame()
+        if null_message is not None and not (
+            value.strip() if expected_type is str else value
+        ):
+            return null_message
+        for test, message in checks:
+            if not test(value):
+                return message
+        return None
+
+    return check
+
+
+class CountryValidator:
+    """
+    Validator of a country's JSON, compiled from the column rules.
+
+    Every column's rule is compiled once into a check function (see
+    compile_check()), so a country is validated with one dictionary
+    lookup and one call per key it has, in a single pass over it.
+    Errors are raised in the same order whatever the order of the keys:
+    unknown keys first, then missing keys, then the first invalid
+    value.
+
+    Attributes:
+        required_keys (tuple): The keys a new country must have, every
+            column but the derived metrics, in column order.
+
+    Methods:
+        validate_new(): Validates the JSON of a new country.
+        validate_patch(): Validates the JSON of a country's changes.
+    """
+
+    def __init__(self, rules):
+        """
+        Compile the rules of every column.
+
+        Args:
+            rules (tuple): The ColumnRule of every column, e.g.
+                COLUMN_RULES.
+        """
+        self._checks = {rule.key: compile_check(rule) for rule in rules}
+        self._derived_keys = frozenset(
+            rule.key for rule in rules if rule.derived
+        )
+        self.required_keys = tuple(
+            rule.key for rule in rules if not rule.derived
+        )
+        self._required = frozenset(self.required_keys)
+        # Checks of the year keys without a column, compiled when
+        # first sent, there are at most 10000 of them
+        self._year_checks = {}
+
+    def _check_values(self, data, skip_derived):
+        """
+        Sub-helper function checking every key and value of a country.
+
+        Args:
+            data (dict): JSON data of one country.
+            skip_derived (bool): Whether to leave the derived metrics
+                out, rather than treat them as columns.
+        Returns:
+            column_data: The values of model columns.
+            new_years: The values of any years without a model column
+            (e.g. 2021), by year (int).
+            error: The message of the first value that failed its
+            column's checks, or None if all of them passed.
+        Raises:
+            AttributeError: If a key is not a column name or a year.
+        """
+        column_data = {}
+        new_years = {}
+        unknown_key = None
+        error = None
+        checks = self._checks
+        for key, value in data.items():
+            check = checks.get(key)
+            if check is None:
+                year = get_year(key)
+                if year is None:
+                    unknown_key = unknown_key or key
+                    continue
+                check = self._year_checks.get(key)
+                if check is None:
+                    check = self._year_checks[key] = compile_check(
+                        get_year_rule(key)
+                    )
+                new_years[year] = value
+            elif skip_derived and key in self._derived_keys:
+                continue
+            else:
+                column_data[key] = value
+            if error is None:
+                error = check(value)
+        if unknown_key is not None:
+            raise AttributeError(f"Unknown key: {unknown_key}")
+        return column_data, new_years, error
+
+    def validate_new(self, data):
+        """
+        Validate the JSON of one new country, as sent to POST routes.
+
+        Derived metrics in the data are left out, as they are computed
+        from the year values.
+
+        Args:
+            data (dict): JSON data of one new country.
+        Returns:
+            column_data: A dictionary of the values for the model
+            columns.
+            new_years: A dictionary of any years without a model column
+            (e.g. 2021) and their values.
+        Raises:
+            AttributeError: If a key does not match a column name or
+                year.
+            ValueError: If any of the following validation checks
+                fails:
+                - The data is not a JSON object.
+                - A required key/column name is missing.
+                - A value does not match its column's type.
+                - A value is null or empty for a non-nullable column.
+                - A value fails a custom check, e.g. a negative year.
+        """
+        if not isinstance(data, dict):
+            raise ValueError("Each country must be a JSON object")
+        column_data, new_years, error = self._check_values(
+            data, skip_derived=True
+        )
+        if not self._required.issubset(column_data):
+            missing_keys = [
+                key for key in self.required_keys if key not in column_data
+            ]
+            raise ValueError(
+                f"Missing required keys: {', '.join(missing_keys)}"
+            )
+        if error is not None:
+            raise ValueError(error)
+        return column_data, new_years
+
+    def validate_patch(self, data, current_record):
+        """
+        Validate the JSON of one country's changes, as sent to PATCH.
+
+        Args:
+            data (dict): JSON data of the changes to one country.
+            current_record (dict): The country's serialized record, as
+                served by the snapshot.
+        Returns:
+            column_values: A dictionary of the new values of model
+            columns.
+            new_years: A dictionary of any years without a model column
+            (e.g. 2021) and their values.
+            values_by_year: The country's values by year (int) with the
+            changes applied, or None if no year is changed.
+        Raises:
+            AttributeError: If a key does not match a column name or
+                year.
+            ValueError: - If the data is not a JSON object.
+                        - If a derived metric is entered, as those are
+                          computed from the year values.
+                        - If a value fails its column's checks.
+                        - If a new value entered for a key already
+                          exists in the database.
+        """
+        if not isinstance(data, dict):
+            raise ValueError("The changes must be a JSON object")
+        for key in self._derived_keys:
+            if key in data:
+                raise ValueError(
+                    f"{key} is computed from the year values and cannot "
+                    "be set"
+                )
+        column_values, new_years, error = self._check_values(
+            data, skip_derived=False
+        )
+        if error is not None:
+            raise ValueError(error)
+
+        # Check if any new value entered for key (entire value) already
+        # exists, the record holds every year, with or without a column
+        changed_years = {}
+        for key, value in data.items():
+            if value == current_record.get(key):
+                raise ValueError(
+                    f"Value entered of '{value}' for '{key}' "
+                    "already exists in the database"
+                )
+            year = get_year(key)
+            if year is not None:
+                changed_years[year] = value
+
+        # The country's years with the changes applied, to recompute
+        # the derived metrics from
+        values_by_year = None
+        if changed_years:
+            values_by_year = {
+                get_year(key): value
+                for key, value in current_record.items()
+                if get_year(key) is not None
+            }
+            values_by_year.update(changed_years)
+        return column_values, new_years, values_by_year
+
+
+# Create the global validator of a country's JSON
+country_validator = CountryValidator(COLUMN_RULES)
+
+
+def validate_frame(frame):
+    """
+    Validate a DataFrame of countries and coerce it to the model types.
+
+    Integer columns are parsed as numbers and rounded to whole numbers,
+    as the model stores them, and text columns keep their text with
+    None for nulls. The custom checks of each column run on the whole
+    column at once. Derived metric columns are left as they are, as
+    they are computed from the year values.
+
+    Args:
+        frame (pd.DataFrame): Countries with the database column names,
+            e.g. a chunk of the prepared csv, read with text columns
+            as str.
+    Returns:
+        valid: The rows that passed, coerced to the model types.
+        rejected: The rows that failed, as they were given, with an
+        ERROR_COLUMN listing every rule they broke.
+    Raises:
+        ValueError: If a required column is missing or a column is not
+            in the model, as then no row can be valid.
+    """
+    column_names = {rule.column_name for rule in COLUMN_RULES}
+    unknown = [name for name in frame.columns if name not in column_names]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+    missing = [
+        rule.column_name for rule in COLUMN_RULES
+        if not rule.derived and rule.column_name not in frame.columns
+    ]
+    if missing:
+        raise ValueError(f"Missing required columns: {', '.join(missing)}")
+
+    valid = frame.copy()
+    errors = pd.Series("", index=frame.index, dtype=object)
+    for rule in COLUMN_RULES:
+        if rule.derived:
+            continue
+        values = frame[rule.column_name]
+        if rule.python_type is int:
+            numbers = pd.to_numeric(values, errors="coerce")
+            # Anything given that is not a number is of the wrong type
+            errors += np.where(
+                values.notna() & numbers.isna(), type_error(rule) + "; ", ""
+            )
+            is_null = numbers.isna()
+            # The custom checks, on whole numbers as they are stored
+            for test, message in rule.checks:
+                errors += np.where(
+                    ~is_null & ~test(numbers.round()),
+                    check_error(rule, message) + "; ",
+                    "",
+                )
+            # Values that cannot be stored become null before the cast,
+            # which would fail on them, their rows are rejected above
+            rounded = numbers.round()
+            valid[rule.column_name] = rounded.where(
+                fits_integer(rounded)
+            ).astype("Int64")
+        else:
+            is_null = values.isna() | (values.astype(str).str.strip() == "")
+            valid[rule.column_name] = values.astype(object).where(
+                values.notna(), None
+            )
+        if not rule.nullable:
+            errors += np.where(is_null, null_error(rule) + "; ", "")
+
+    is_rejected = errors != ""
+    rejected = frame[is_rejected].copy()
+    rejected[ERROR_COLUMN] = errors[is_rejected].str.rstrip("; ")
+    return valid[~is_rejected], rejected